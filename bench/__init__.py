@@ -0,0 +1 @@
+# 测试和性能测量工具：模拟的教学管理系统和导出流程的分阶段计时，不属于命令行工具的正常使用流程
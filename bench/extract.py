@@ -0,0 +1,78 @@
+# 页面锚点提取的微基准：在保存的页面上比较PageScanner直接扫描与requests_html的DOM解析，供benchmark --extract使用
+import os
+import time
+
+from sues_s2c import SuesApi, PageScanner
+from bench.mockjxxt import MockJxxtServer
+
+# tests使用的已保存页面
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'tests', 'fixtures')
+
+# 锚点名称, 页面文件, 直接扫描函数, DOM解析函数
+EXTRACT_ANCHORS = (
+    ('semesterId', 'stdHome.html', PageScanner.semesterId, SuesApi._domSemesterId),
+    ('courseFrameSrc', 'stdHome.html', PageScanner.courseFrameSrc, SuesApi._domCourseFrameSrc),
+    ('taskActivityScript', 'courseTable.html', PageScanner.taskActivityScript, SuesApi._domTaskActivityScript),
+    ('loginError', 'loginError.html', PageScanner.loginError, SuesApi._domLoginError),
+)
+
+
+def saveFixturePages(directory: str, courseCount: int = 300):
+    """
+    从MockJxxtServer保存测试和微基准使用的页面
+    :param directory: 保存目录
+    :param courseCount: 课表页面中TaskActivity的数量
+    """
+    import requests
+    os.makedirs(directory, exist_ok=True)
+    with MockJxxtServer(courseCount, passwords={}) as server:
+        session = requests.Session()
+        session.get(server.baseUrl + '/')
+        pages = {'loginPage.html': session.get(server.baseUrl + '/eams/courseTableForStd.action?method=stdHome')}
+        session.get(server.baseUrl + '/eams/captcha/image.action')
+        form = {'loginForm.name': 'a', 'loginForm.password': 'wrong'}
+        pages['loginError.html'] = session.post(server.baseUrl + '/eams/login.action', data=form)
+        server.passwords = None
+        session.post(server.baseUrl + '/eams/login.action', data=form)
+        pages['stdHome.html'] = session.get(server.baseUrl + '/eams/courseTableForStd.action?method=stdHome')
+        pages['courseTable.html'] = session.post(server.baseUrl + '/eams/courseTableForStd!courseTable.action')
+        server.failureRate = 1.0
+        pages['unavailable.html'] = session.get(server.baseUrl + '/eams/courseTableForStd.action?method=stdHome')
+    for name, r in pages.items():
+        with open(os.path.join(directory, name), 'wb') as f:
+            f.write(r.content)
+
+
+def runExtractBenchmark(directory: str = FIXTURE_DIR, rounds: int = 20, measureMemory: bool = False):
+    """
+    分别用直接扫描和DOM解析从页面中提取每个锚点，DOM解析的耗时包含构建DOM
+    :param directory: 页面目录，见saveFixturePages
+    :param rounds: 重复次数，结果取中位数
+    :param measureMemory: 是否另外测量两种方式的峰值内存
+    :return: {锚点: {'bytes': 页面大小, 'fast': 耗时, 'dom': 耗时[, 'fastPeak': 峰值内存, 'domPeak': 峰值内存]}}
+    """
+    import requests_html
+    result = {}
+    for anchor, fileName, scan, domFind in EXTRACT_ANCHORS:
+        with open(os.path.join(directory, fileName), 'rb') as f:
+            content = f.read()
+        paths = {'fast': lambda: scan(content), 'dom': lambda: domFind(requests_html.HTML(html=content))}
+        result[anchor] = {'bytes': len(content)}
+        for path, extract in paths.items():
+            timings = []
+            for _ in range(rounds):
+                begin = time.perf_counter()
+                extract()
+                timings.append(time.perf_counter() - begin)
+            timings.sort()
+            result[anchor][path] = timings[len(timings) // 2]
+        if measureMemory:
+            import tracemalloc
+            for path, extract in paths.items():
+                tracemalloc.start()
+                try:
+                    extract()
+                    result[anchor][path + 'Peak'] = tracemalloc.get_traced_memory()[1]
+                finally:
+                    tracemalloc.stop()
+    return result
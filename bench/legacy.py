@@ -0,0 +1,224 @@
+# 改写前的课表解析、合并、日程切分和日程时间计算的实现(逐行正则、字典存储的CourseInfo、逐个比较的合并、copy.copy切分、
+# 每个日程重新解析上课时间)，sues_s2c不使用，
+# 只作为性能测量的对照和等价性测试的参照
+import copy
+import re
+from datetime import datetime, timedelta
+from functools import cmp_to_key
+
+from sues_s2c import ErrorCode, MyException, timetable, DEFtimeTable, cmp_courseTime
+
+activityMatchRe = re.compile(r'.*new.*TaskActivity\(.*\).*;$')
+activityExtractRe = re.compile(r'".*?"')
+indexMatchRe = re.compile(r'.*index.*=\d\*.*\+\d.*;$')
+marshallMatchRe = re.compile(r'.*marshalTable\(.*?\).*;$')
+timeExtractRe = re.compile(r'\(.*\)')
+yearMatchRe = re.compile(r'.*CourseTable\(.*?\).*;$')
+
+
+class LegacyCourseInfo:
+    """
+    改写前的CourseInfo：普通的类，周次为01组成的字符串，星期和节次为字符串
+    """
+
+    def __init__(self, teacherId, teacherName, courseId, courseName, roomId, roomName, validweeks):
+        self.teacherId = teacherId
+        self.teacherName = teacherName
+        self.courseId = courseId
+        self.courseName = courseName
+        self.roomId = roomId
+        self.roomName = roomName
+        self.validweeks = validweeks  # 01组成的字符串，代表了一年的53周
+        self.day = None
+        self.courses = []
+
+    def canMergeValidWeek(self, otherCourseInfo):
+        # 改写前不比较上课节次，同一天不同节次的两项也会被合并
+        return len(self.validweeks) == 53 \
+               and len(self.validweeks) == len(otherCourseInfo.validweeks) \
+               and self.validweeks != otherCourseInfo.validweeks \
+               and self.teacherId == otherCourseInfo.teacherId \
+               and self.courseId == otherCourseInfo.courseId \
+               and self.roomId == otherCourseInfo.roomId \
+               and self.day == otherCourseInfo.day
+
+    def mergeValidWeek(self, otherValidWeeks: str):
+        assert len(self.validweeks) == len(otherValidWeeks)
+        self.validweeks += otherValidWeeks
+
+
+def legacyParseCourseScript(scriptStr: str):
+    """
+    改写前getCourseTable的解析部分：逐行尝试四个以.*开头的正则
+    :param scriptStr: 包含new TaskActivity的js脚本
+    :return: 课表年份, 教学活动起始(相对于全年), 教学活动起始周, 教学活动结束周, 未合并的LegacyCourseInfo列表
+    """
+    startYear = allOccupyWeek = allStartWeek = allEndWeek = None
+    unMergedCouseList = []
+    for line in scriptStr.splitlines():
+        if activityMatchRe.match(line):
+            unMergedCouseList.append(LegacyCourseInfo(*(i[1:-1] for i in activityExtractRe.findall(line))))
+        elif indexMatchRe.match(line):
+            line = line.replace(' ', '')
+            beg = line.find('=') + 1
+            line = line[beg:-1]
+
+            day, course = line.replace('index =', '').split('*unitCount+')
+            unMergedCouseList[-1].day = day
+            unMergedCouseList[-1].courses.append(course)
+        elif marshallMatchRe.match(line):
+            allOccupyWeek, allStartWeek, allEndWeek = timeExtractRe.findall(line)[0][1:-1].split(',')
+        elif yearMatchRe.match(line):
+            startYear, _ = timeExtractRe.findall(line)[0][1:-1].split(',')
+    return startYear, allOccupyWeek, allStartWeek, allEndWeek, unMergedCouseList
+
+
+def legacyMergeCourses(unMergedCouseList: list, allOccupyWeek: str, allEndWeek: str):
+    """
+    改写前getCourseTable的合并部分：在courseId相同的课程中逐个调用canMergeValidWeek，同一课程的教学班越多越慢
+    :param unMergedCouseList: legacyParseCourseScript返回的列表，其中的对象会被修改
+    :return: 合并后的LegacyCourseInfo列表
+    """
+    unMergedCourseDict = {}
+    for curCourse in unMergedCouseList:
+        needMergeIndicator = 53 - (int(allOccupyWeek) - 1) - int(allEndWeek)
+
+        if '1' in curCourse.validweeks[0:int(allOccupyWeek) - 1] and curCourse.validweeks[0] == '0':
+            curCourse.validweeks = (53 - 1) * '0' + curCourse.validweeks
+
+        if curCourse.courseId not in unMergedCourseDict:
+            unMergedCourseDict[curCourse.courseId] = [curCourse]
+        else:
+            merged = False
+            if needMergeIndicator < 0:
+                for existCIndex, existingCourse in enumerate(unMergedCourseDict[curCourse.courseId]):
+                    if existingCourse.canMergeValidWeek(curCourse):
+                        if '1' in curCourse.validweeks[0:int(allOccupyWeek) - 1]:
+                            merged = True
+                            existingCourse.mergeValidWeek(curCourse.validweeks)
+                            unMergedCourseDict[curCourse.courseId][existCIndex] = existingCourse
+                            break
+                        elif '1' in existingCourse.validweeks[0:int(allOccupyWeek) - 1]:
+                            merged = True
+                            curCourse.mergeValidWeek(existingCourse.validweeks)
+                            unMergedCourseDict[curCourse.courseId][existCIndex] = curCourse
+                            break
+                        else:
+                            raise MyException(ErrorCode.API_CHANGED,
+                                              'API有改变，无法合并课程' + curCourse.courseName + ',请联系作者！')
+            if not merged:
+                unMergedCourseDict[curCourse.courseId].append(curCourse)
+
+    courseList = []
+    for curCourseList in unMergedCourseDict.values():
+        courseList.extend(curCourseList)
+    return courseList
+
+
+def legacySplitCourses(courseList):
+    """
+    改写前cvt2Caldav的切分：按1-4节 5-8节 9-14节把每个课程复制成最多三份
+    :param courseList: LegacyCourseInfo列表
+    :return: 切分后的LegacyCourseInfo列表
+    """
+    splitedCourseList = []
+    for curCourse in courseList:
+        bucket1_4 = []
+        bucket5_8 = []
+        bucket9_14 = []
+        for i in curCourse.courses:
+            i = int(i)
+            if i <= 3:
+                bucket1_4.append(str(i))
+            elif 4 <= i <= 7:
+                bucket5_8.append(str(i))
+            else:
+                bucket9_14.append(str(i))
+        for bucket in (bucket1_4, bucket5_8, bucket9_14):
+            if len(bucket) > 0:
+                cache = copy.copy(curCourse)
+                cache.courses = bucket
+                splitedCourseList.append(cache)
+    return splitedCourseList
+
+
+def legacyIterEventTimes(courseList, startYear: str, allOccupyWeek: str, modifyDEFTime: bool):
+    """
+    改写前cvt2Caldav计算日程时间的部分：每个日程都用cmp_to_key重新排序节次、拆分'HH:MM'字符串，
+    再用四个timedelta相加得到上课、下课和重复截止时间
+    :param courseList: LegacyCourseInfo列表，可以是legacySplitCourses的结果
+    :return: 依次产生(uid, 上课时间, 下课时间, 重复截止时间)
+    """
+    from dateutil import tz
+    weekExtractRe = re.compile(r'[1]+')
+    offset = 0
+    if datetime.strptime(startYear + '-01-01', "%Y-%m-%d") \
+            .replace(tzinfo=tz.gettz('Beijing')).weekday() == 6:
+        offset = 1
+    firstWeekTime = datetime.strptime(''.join([str(startYear), '-W', str(int(allOccupyWeek) - 1 + offset), '-0']),
+                                      "%Y-W%U-%w") \
+        .replace(tzinfo=tz.gettz('Beijing'))
+
+    for curCourse in courseList:
+        for validweek in weekExtractRe.finditer(curCourse.validweeks):
+            curCourseBegWeek = validweek.start() - (int(allOccupyWeek) - 1)
+            curCourseEndWeek = (validweek.end() - 1) - (int(allOccupyWeek) - 1)
+
+            courseTimes = sorted([int(time) for time in curCourse.courses], key=cmp_to_key(cmp_courseTime))
+
+            begTime = courseTimes[0]
+            endTime = courseTimes[-1]
+            if modifyDEFTime and curCourse.roomName[0] in ['D', 'E', 'F'] and begTime in [2, 3] and endTime in [2, 3]:
+                begTime = DEFtimeTable[begTime][0]
+                endTime = DEFtimeTable[endTime][-1]
+            else:
+                begTime = timetable[begTime][0]
+                endTime = timetable[endTime][-1]
+            begTime = begTime.split(':')
+            endTime = endTime.split(':')
+
+            startDayFrom = firstWeekTime \
+                + timedelta(weeks=int(curCourseBegWeek)) \
+                + timedelta(days=(int(curCourse.day) + 1) % 7) \
+                + timedelta(hours=int(begTime[0]), minutes=int(begTime[1]))
+            startDayTo = firstWeekTime \
+                + timedelta(weeks=int(curCourseBegWeek)) \
+                + timedelta(days=(int(curCourse.day) + 1) % 7) \
+                + timedelta(hours=int(endTime[0]), minutes=int(endTime[1]))
+            untilDay = firstWeekTime \
+                + timedelta(weeks=int(curCourseEndWeek)) \
+                + timedelta(days=(int(curCourse.day) + 1) % 7) \
+                + timedelta(hours=int(endTime[0]), minutes=int(endTime[1]))
+
+            uid = curCourse.courseId + curCourse.roomId + curCourse.day + str(curCourseBegWeek) + \
+                str(curCourseEndWeek) + str(courseTimes[0]) + str(courseTimes[-1])
+            yield uid, startDayFrom, startDayTo, untilDay
+
+
+def legacyIcs(courseList, startYear: str, allOccupyWeek: str, alarmTime: int, modifyDEFTime: bool):
+    """
+    改写前cvt2Caldav生成ics的方式：所有日程加入同一个Calendar对象后一次序列化
+    :param courseList: LegacyCourseInfo列表，可以是legacySplitCourses的结果
+    :return: ics文件的内容
+    """
+    from icalendar import Calendar, Event, Alarm
+    cal = Calendar()
+    for curCourse in courseList:
+        for uid, startDayFrom, startDayTo, untilDay in legacyIterEventTimes([curCourse], startYear, allOccupyWeek,
+                                                                            modifyDEFTime):
+            event = Event()
+            event.add('uid', uid)
+            event.add('summary', curCourse.courseName + ' ' + curCourse.teacherName)
+            event.add('dtstart', startDayFrom)
+            event.add('dtend', startDayTo)
+            event.add('location', curCourse.roomName)
+            event.add('rrule', {'freq': 'weekly', 'until': untilDay})
+
+            eventAlarm = Alarm()
+            eventAlarm.add('action', 'display')
+            eventAlarm.add('description', curCourse.courseName + ' ' + curCourse.roomName)
+            eventAlarm.add('trigger', timedelta(minutes=-abs(alarmTime)))
+
+            event.add_component(eventAlarm)
+            cal.add_component(event)
+    return cal.to_ical()
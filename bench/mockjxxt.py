@@ -0,0 +1,251 @@
+# 模拟的教学管理系统，供mock-server、benchmark子命令和tests使用，不依赖真实系统和网络
+from urllib.parse import urlsplit
+import random
+import os
+import threading
+import json
+import time
+import hashlib
+
+
+def generateCourseScript(courseCount: int, seed: int = 0, startYear: int = 2019, semesterId: int = 98,
+                         occupyWeek: int = 36, endWeek: int = 20, sectionsPerCourse: int = 2):
+    """
+    生成与教学管理系统课表页面结构相同的TaskActivity脚本，用于测试和性能测量
+    五分之一的课程跨年，会像真实系统一样被拆成两个TaskActivity，需要getCourseTable合并
+    :param courseCount: TaskActivity的数量(不含跨年拆出的部分)
+    :param seed: 随机种子，相同参数生成的脚本完全相同
+    :param startYear: 课表年份
+    :param semesterId: 学期ID
+    :param occupyWeek: 教学活动在全年中的起始周
+    :param endWeek: 教学活动结束周(相对occupyWeek)
+    :param sectionsPerCourse: 每门课程(courseId)的TaskActivity数，同一课程的教学班越多合并时需要比较的候选越多
+    :return: 脚本内容
+    """
+    rnd = random.Random(seed)
+    mainLength = 53 - (occupyWeek - 1)  # 当年剩余的周数
+    wrapLength = max(0, endWeek - mainLength)  # 跨到下一年的周数
+    lines = ['var table0 = new CourseTable(%d,%d);' % (startYear, semesterId), 'var unitCount = 14;', 'var index=0;',
+             'var activity=null;']
+
+    def addActivity(teacherId, courseId, roomId, roomName, weeks, day, units):
+        lines.append('activity = new TaskActivity("%s","教师%s","%s(%s.01)","课程%s(%s.01)","%s","%s","%s");'
+                     % (teacherId, teacherId, courseId, courseId, courseId, courseId, roomId, roomName, weeks))
+        for unit in units:
+            lines.append('index =%d*unitCount+%d;' % (day, unit))
+            lines.append('table0.activities[index][table0.activities[index].length]=activity;')
+
+    for i in range(courseCount):
+        teacherId = str(1000 + i % 97)
+        courseId = 'C%05d' % (i // sectionsPerCourse)
+        roomId = str(800 + i % 113)
+        roomName = rnd.choice('ABCDEFG') + str(100 + int(roomId) % 400)
+        day = rnd.randrange(7)
+        first = rnd.choice((0, 2, 4, 6, 8, 10, 12))
+        units = list(range(first, min(first + rnd.choice((2, 2, 3, 4)), 14)))
+        kind = i % 5
+        if kind == 0:
+            pattern = '1' * mainLength
+        elif kind == 1:
+            pattern = ('10' * mainLength)[:mainLength]
+        elif kind == 2:
+            pattern = ''.join(rnd.choice('01') for _ in range(mainLength))
+        elif kind == 3 and wrapLength:
+            # 跨年课程：当年部分和下一年开头的部分分成两个TaskActivity
+            addActivity(teacherId, courseId, roomId, roomName, '0' * (occupyWeek - 1) + '1' * mainLength, day, units)
+            addActivity(teacherId, courseId, roomId, roomName, '1' * wrapLength + '0' * (53 - wrapLength), day, units)
+            continue
+        else:
+            pattern = '0' * 4 + '1' * (mainLength - 8) + '0' * 4
+        addActivity(teacherId, courseId, roomId, roomName, '0' * (occupyWeek - 1) + pattern, day, units)
+    lines.append('table0.marshalTable(%d,1,%d);' % (occupyWeek, endWeek))
+    return '\r\n'.join(lines)
+
+
+class MockJxxtServer:
+    """
+    本地模拟的教学管理系统，实现了SuesApi用到的全部接口，用于在不访问jxxt.sues.edu.cn的情况下测试和测量
+    通过SuesApi(baseUrl=server.baseUrl)使用，课表脚本由generateCourseScript生成
+    """
+
+    def __init__(self, courseCount: int = 60, seed: int = 0, years=('2019-2020', '2018-2019'), terms=('1', '2'),
+                 latency: float = 0.0, failureRate: float = 0.0, passwords: dict = None, checkCaptcha: bool = False,
+                 port: int = 0):
+        """
+        :param courseCount: 课表中TaskActivity的数量，见generateCourseScript
+        :param seed: 课表脚本的随机种子
+        :param years: getYearsOrderByDistance返回的学年
+        :param terms: getTermsOrderByDistance返回的学期
+        :param latency: 每个响应前等待的秒数，模拟网络延迟
+        :param failureRate: 随机返回503的概率，用于测试RequestPolicy
+        :param passwords: 学号 -> 密码，None时接受任何学号和密码
+        :param checkCaptcha: 是否检查验证码，为False时接受任何验证码
+        :param port: 监听端口，0表示随机选择
+        """
+        self.courseCount = courseCount
+        self.seed = seed
+        self.years = list(years)
+        self.terms = list(terms)
+        self.latency = latency
+        self.failureRate = failureRate
+        self.passwords = passwords
+        self.checkCaptcha = checkCaptcha
+        self.port = port
+        self.sessions = {}  # JSESSIONID -> {'captcha': 最近一次的验证码, 'user': 已登录的学号}
+        self.requestCount = 0
+        self.inFlight = 0  # 正在处理的请求数
+        self.maxInFlight = 0  # 同时处理的请求数的最大值，用于检查客户端的并发限制
+        self._lock = threading.Lock()
+        self._courseTablePage = None
+        self._httpd = None
+
+    @property
+    def baseUrl(self):
+        return 'http://127.0.0.1:%d' % self.port
+
+    def courseTablePage(self):
+        """
+        :return: 课表页面的内容，第一次调用时生成
+        """
+        if self._courseTablePage is None:
+            self._courseTablePage = ('<html><head><title>课表</title></head><body><div id="ExportA"></div>'
+                                     '<script language="JavaScript">\r\n'
+                                     + generateCourseScript(self.courseCount, self.seed)
+                                     + '\r\n</script></body></html>').encode('utf-8')
+        return self._courseTablePage
+
+    @staticmethod
+    def captchaImage(code: str):
+        """
+        :return: 写有code的PNG图像
+        """
+        from io import BytesIO
+        from PIL import Image, ImageDraw
+        image = Image.new('L', (60, 20), 240)
+        ImageDraw.Draw(image).text((6, 4), code, fill=20)
+        buffer = BytesIO()
+        image.save(buffer, 'PNG')
+        return buffer.getvalue()
+
+    def handle(self, method: str, path: str, form: dict, sessionId: str):
+        """
+        处理一个请求
+        :return: (状态码, Content-Type, 响应内容, 新的JSESSIONID或None)
+        """
+        with self._lock:
+            self.requestCount += 1
+            self.inFlight += 1
+            self.maxInFlight = max(self.maxInFlight, self.inFlight)
+            session = self.sessions.get(sessionId)
+        try:
+            if self.latency:
+                time.sleep(self.latency)
+            return self._route(path, form, sessionId, session)
+        finally:
+            with self._lock:
+                self.inFlight -= 1
+
+    def _route(self, path: str, form: dict, sessionId: str, session: dict):
+        if self.failureRate and random.random() < self.failureRate:
+            return 503, 'text/plain', b'Service Unavailable', None
+        htmlType = 'text/html; charset=UTF-8'
+        route = urlsplit(path).path
+
+        if route in ('', '/'):
+            newSessionId = hashlib.sha1(os.urandom(16)).hexdigest().upper()
+            with self._lock:
+                self.sessions[newSessionId] = {'captcha': None, 'user': None}
+            return 200, htmlType, '<html><body>上海工程技术大学教学管理系统</body></html>'.encode('utf-8'), newSessionId
+        if session is None:
+            return 302, htmlType, b'', None
+        if route == '/eams/captcha/image.action':
+            session['captcha'] = ''.join(random.choice('abcdefhkmnprstuvwxy2345678') for _ in range(4))
+            return 200, 'image/png', self.captchaImage(session['captcha']), None
+        if route == '/eams/login.action':
+            username = form.get('loginForm.name', '')
+            error = ''
+            if self.checkCaptcha and form.get('loginForm.captcha') != session['captcha']:
+                error = '验证码不正确'
+            elif self.passwords is not None and self.passwords.get(username) != form.get('loginForm.password'):
+                error = '密码错误'
+            session['captcha'] = None
+            if error:
+                return 200, htmlType, ('<html><body><ul class="errorMessage"><li><span>%s</span></li></ul></body></html>'
+                                    % error).encode('utf-8'), None
+            session['user'] = username
+            return 200, htmlType, '<html><body>欢迎</body></html>'.encode('utf-8'), None
+        if route == '/eams/dwr/engine.js':
+            return 200, 'text/javascript', ('if (typeof dwr == "undefined") dwr = {};\n'
+                                            'dwr.engine._origScriptSessionId = "%s";\n' % sessionId[:32]).encode(), None
+        if session['user'] is None:
+            # 未登录时返回登录页
+            return 200, htmlType, b'<html><body><form action="login.action"></form></body></html>', None
+        if route.endswith('semesterDao.getYearsOrderByDistance.dwr'):
+            return 200, 'text/javascript', ('dwr.engine._remoteHandleCallback(\'%s\',\'0\',%s);'
+                                            % (form.get('batchId', '0'), json.dumps(self.years, separators=(',', ':')))).encode(), None
+        if route.endswith('semesterDao.getTermsOrderByDistance.dwr'):
+            return 200, 'text/javascript', ('dwr.engine._remoteHandleCallback(\'%s\',\'0\',%s);'
+                                            % (form.get('batchId', '1'), json.dumps(self.terms, separators=(',', ':')))).encode(), None
+        if route == '/eams/courseTableForStd.action':
+            return 200, htmlType, ('<html><body><form><input type="hidden" name="semester.id" value="98"/></form>'
+                                '<table><tr><td class="frameTable_content">'
+                                '<iframe src="courseTableForStd!courseTable.action?ignoreHead=1"></iframe>'
+                                '</td></tr></table></body></html>').encode(), None
+        if route == '/eams/courseTableForStd!courseTable.action':
+            return 200, htmlType, self.courseTablePage(), None
+        return 404, 'text/plain', b'Not Found', None
+
+    def start(self):
+        """
+        在后台线程中启动服务器
+        :return: self
+        """
+        from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+        from http.cookies import SimpleCookie
+        from urllib.parse import parse_qsl
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True  # 响应头和内容分两次写出，避免与客户端的延迟确认叠加出40ms的等待
+
+            def _serve(self, method):
+                length = int(self.headers.get('Content-Length') or 0)
+                form = dict(parse_qsl(self.rfile.read(length).decode('utf-8'))) if length else {}
+                cookie = SimpleCookie(self.headers.get('Cookie', ''))
+                sessionId = cookie['JSESSIONID'].value if 'JSESSIONID' in cookie else ''
+                status, contentType, body, newSessionId = mock.handle(method, self.path, form, sessionId)
+                self.send_response(status)
+                self.send_header('Content-Type', contentType)
+                self.send_header('Content-Length', str(len(body)))
+                if newSessionId:
+                    self.send_header('Set-Cookie', 'JSESSIONID=%s; Path=/' % newSessionId)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                self._serve('GET')
+
+            def do_POST(self):
+                self._serve('POST')
+
+            def log_message(self, format, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', self.port), Handler)
+        self._httpd.daemon_threads = True
+        self.port = self._httpd.server_address[1]
+        threading.Thread(target=self._httpd.serve_forever, name='mock-jxxt', daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._httpd:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, excType, excValue, traceback):
+        self.stop()
@@ -0,0 +1,189 @@
+# 导出流程和占用索引的性能测量，供benchmark子命令使用
+import random
+import os
+import time
+
+from sues_s2c import (SuesApi, RequestPolicy, HostConcurrencyLimiter, IcsStreamWriter, cvt2Caldav, iterCourseRecords,
+                      iterMergedCourses, scanCourseTableHeader, _timedIter)
+from s2c_occupancy import OccupancyIndex
+from bench.mockjxxt import MockJxxtServer, generateCourseScript
+
+
+BENCHMARK_PHASES = ('session', 'login', 'fetch', 'parse', 'merge', 'build', 'write')
+
+
+class TimedIcsWriter(IcsStreamWriter):
+    """
+    与IcsStreamWriter相同，另外把打开、写入和关闭文件的耗时累加到self.writeSeconds，
+    cvt2Caldav的其余耗时即为生成和序列化日程的耗时
+    """
+
+    def __init__(self, output):
+        begin = time.perf_counter()
+        self.writeSeconds = 0.0
+        super().__init__(output)
+        # 日历头已经在_write中计时，整体计时后覆盖
+        self.writeSeconds = time.perf_counter() - begin
+
+    def _write(self, data: bytes):
+        begin = time.perf_counter()
+        super()._write(data)
+        self.writeSeconds += time.perf_counter() - begin
+
+    def close(self):
+        begin = time.perf_counter()
+        writeSeconds = self.writeSeconds
+        super().close()
+        # 同__init__，日历尾不重复计入
+        self.writeSeconds = writeSeconds + time.perf_counter() - begin
+
+
+def runBenchmark(courseCount: int = 2000, rounds: int = 5, latency: float = 0.0, splitCourse: bool = False,
+                 measureMemory: bool = False):
+    """
+    在MockJxxtServer上完整执行导出流程，分阶段计时
+    阶段依次为：newSession、获取验证码并登录、获取学年学期和课表页面、解析脚本、合并课程、生成日程、写出ics文件。
+    解析和合并、生成和写出在流水线中交替执行，分别累计前一步生成器和文件写入的耗时，不保存中间结果
+    :param courseCount: 课表中TaskActivity的数量
+    :param rounds: 重复次数，每次使用新的会话
+    :param latency: 模拟的网络延迟(秒)
+    :param splitCourse: 是否拆分跨越休息时间的日程
+    :param measureMemory: 是否另外执行一次，用tracemalloc测量解析并合并(parse)和生成并写出ics(ics)的峰值内存(会明显变慢)
+    :return: {'courses': courseCount, 'rounds': rounds, 'phases': {阶段: 各次耗时的中位数(秒)}, 'events': 日程数}，
+             measureMemory时还有'peakMemory': {阶段: 峰值字节数}
+    """
+    import tempfile
+    timings = {phase: [] for phase in BENCHMARK_PHASES}
+    eventCount = 0
+    with MockJxxtServer(courseCount, latency=latency) as server, tempfile.TemporaryDirectory() as tmpDir:
+        icsFileName = os.path.join(tmpDir, 'bench.ics')
+        for _ in range(rounds):
+            # 不重试、不限速，测到的是每个阶段本身的耗时
+            suesApi = SuesApi(HostConcurrencyLimiter(), verbose=False, requestPolicy=RequestPolicy(retries=0),
+                              baseUrl=server.baseUrl)
+            clock = time.perf_counter()
+
+            def lap(phase, *nested):
+                """
+                :param nested: 本段中属于其它阶段的耗时，(阶段, 秒)
+                """
+                nonlocal clock
+                now = time.perf_counter()
+                elapsed = now - clock
+                for otherPhase, seconds in nested:
+                    timings[otherPhase].append(seconds)
+                    elapsed -= seconds
+                timings[phase].append(elapsed)
+                clock = now
+
+            suesApi.newSession()
+            lap('session')
+            suesApi.login('bench', 'bench', suesApi.getCaptha())
+            lap('login')
+            year = suesApi.getYears()[0]
+            term = suesApi.getTerms(year)[0]
+            content = suesApi._fetchCourseTable(year, term)
+            lap('fetch')
+            # 找到课表脚本、读取课表头和逐个读取TaskActivity都属于解析
+            begin = time.perf_counter()
+            startYear, occupyWeek, startWeek, endWeek, records = suesApi._parseCourseTable(content)
+            parseTime = [time.perf_counter() - begin]
+            courses = list(iterMergedCourses(_timedIter(records, parseTime), occupyWeek, endWeek))
+            lap('merge', ('parse', parseTime[0]))
+            writer = TimedIcsWriter(icsFileName)
+            eventCount = cvt2Caldav(startYear, occupyWeek, startWeek, endWeek, courses, 15, False, splitCourse, None,
+                                    verbose=False, writer=writer)
+            lap('build', ('write', writer.writeSeconds))
+            suesApi.session.close()
+
+        peakMemory = {}
+        if measureMemory:
+            # tracemalloc使程序明显变慢，单独执行一次，不影响上面的计时。每个阶段重新开始跟踪，只统计本阶段分配的内存
+            import tracemalloc
+            try:
+                tracemalloc.start()
+                startYear, occupyWeek, startWeek, endWeek, records = suesApi._parseCourseTable(content)
+                courses = list(iterMergedCourses(records, occupyWeek, endWeek))
+                peakMemory['parse'] = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                tracemalloc.start()
+                cvt2Caldav(startYear, occupyWeek, startWeek, endWeek, courses, 15, False, splitCourse, icsFileName,
+                           verbose=False)
+                peakMemory['ics'] = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+    medians = {phase: sorted(values)[len(values) // 2] for phase, values in timings.items()}
+    result = {'courses': courseCount, 'rounds': rounds, 'phases': medians, 'events': eventCount}
+    if measureMemory:
+        result['peakMemory'] = peakMemory
+    return result
+
+
+def compareBenchmark(result: dict, baseline: dict, tolerance: float = 0.2, minDelta: float = 0.002):
+    """
+    与保存的基线比较
+    :param tolerance: 允许比基线慢的比例
+    :param minDelta: 小于该秒数的差异不视为退化，避免极短阶段的抖动
+    :return: [(阶段, 基线耗时, 本次耗时)]，只包含退化的阶段
+    """
+    regressions = []
+    for phase, seconds in result['phases'].items():
+        base = baseline.get('phases', {}).get(phase)
+        if base is not None and seconds > base * (1 + tolerance) and seconds - base > minDelta:
+            regressions.append((phase, base, seconds))
+    return regressions
+
+
+def runOccupancyBenchmark(sectionCount: int = 4000, students: int = 5000, coursesPerStudent: int = 12,
+                          queries: int = 20000, seed: int = 0):
+    """
+    在合成的全校规模数据上测量OccupancyIndex的建立和查询耗时
+    全校的教学班由generateCourseScript生成，每个学生随机选修其中的若干个，所以大多数教学班被多个学生共享
+    另外用逐个检查所有教学班的方法回答一部分占用查询，作为对照
+    :param sectionCount: 全校TaskActivity的数量
+    :param students: 学生数
+    :param coursesPerStudent: 每个学生课表中的课程数
+    :param queries: 占用查询和空闲教室查询的次数
+    :return: 统计信息字典，build/conflicts为总耗时，其余耗时为每次查询的平均值(秒)
+    """
+    rnd = random.Random(seed)
+    script = generateCourseScript(sectionCount, seed)
+    startYear, occupyWeek, startWeek, endWeek = scanCourseTableHeader(script)
+    campus = list(iterMergedCourses(iterCourseRecords(script), occupyWeek, endWeek))
+    tables = [(startYear, occupyWeek, startWeek, endWeek, rnd.sample(campus, min(coursesPerStudent, len(campus))))
+              for _ in range(students)]
+
+    begin = time.perf_counter()
+    index = OccupancyIndex()
+    for courseTable in tables:
+        index.add(courseTable)
+    build = time.perf_counter() - begin
+
+    rooms = sorted(index.names[OccupancyIndex.ROOM])
+    weekCount = int(endWeek)
+    cells = [(rnd.choice(rooms), rnd.randrange(1, weekCount + 1), rnd.randrange(7), rnd.randrange(14))
+             for _ in range(queries)]
+    begin = time.perf_counter()
+    for roomId, week, day, slot in cells:
+        index.occupants(OccupancyIndex.ROOM, roomId, week, day, slot)
+    occupancy = (time.perf_counter() - begin) / queries
+
+    # 对照：不使用索引，检查每个教学班
+    linearCells = cells[:max(1, queries // 100)]
+    begin = time.perf_counter()
+    for roomId, week, day, slot in linearCells:
+        weekBit = int(occupyWeek) - 1 + week - 1
+        [course for course in index.sections
+         if course.roomId == roomId and course.day == day and slot in course.courses and course.weeks.test(weekBit)]
+    linearOccupancy = (time.perf_counter() - begin) / len(linearCells)
+
+    begin = time.perf_counter()
+    for _, week, day, slot in cells:
+        index.freeRooms(week, day, range(slot, min(slot + 2, 14)))
+    freeRooms = (time.perf_counter() - begin) / queries
+
+    begin = time.perf_counter()
+    index.conflicts()
+    conflicts = time.perf_counter() - begin
+    return dict(index.summary(), build=build, occupancy=occupancy, linearOccupancy=linearOccupancy,
+                freeRooms=freeRooms, conflicts=conflicts, queries=queries)
@@ -0,0 +1,105 @@
+# 课表处理流水线各步骤的性能测量，与bench/legacy中改写前的实现对比，供benchmark --stage使用
+import os
+import time
+
+from sues_s2c import (PageScanner, tokenizeCourseScript, scanCourseTableHeader, iterCourseRecords, iterMergedCourses,
+                      iterCourseBlocks, iterCourseEvents, cvt2Caldav, IcsMemoryWriter, _firstWeekTime)
+from bench.legacy import legacyParseCourseScript, legacyMergeCourses, legacyIterEventTimes
+from bench.extract import FIXTURE_DIR
+from bench.mockjxxt import generateCourseScript
+
+
+def loadPageScript(path: str = os.path.join(FIXTURE_DIR, 'courseTable.html')):
+    """
+    :param path: 保存的课表页面，默认使用tests/fixtures中的页面
+    :return: 页面中的TaskActivity脚本
+    """
+    with open(path, 'rb') as f:
+        return PageScanner.taskActivityScript(f.read())
+
+
+def _median(run, rounds: int, setup=None):
+    """
+    :param setup: 不为None时每次计时前调用，结果作为run的参数，不计入耗时
+    """
+    timings = []
+    for _ in range(rounds):
+        args = (setup(),) if setup else ()
+        begin = time.perf_counter()
+        run(*args)
+        timings.append(time.perf_counter() - begin)
+    timings.sort()
+    return timings[len(timings) // 2]
+
+
+def runParseBenchmark(scriptStr: str, rounds: int = 20):
+    """
+    比较改写前逐行尝试四个正则的解析和tokenizeCourseScript一遍扫描的解析速度
+    :param scriptStr: 课表脚本，见loadPageScript
+    :param rounds: 重复次数，结果取中位数
+    :return: {'lines': 脚本行数, 'records': TaskActivity数, 'legacy'/'tokenize'/'parse': 耗时(秒),
+              'legacyLinesPerSec'/'tokenizeLinesPerSec'/'parseLinesPerSec': 每秒处理的行数}，
+             tokenize只产生记录，parse另外读取课表头并创建CourseInfo，与legacy的工作相同
+    """
+    lines = len(scriptStr.splitlines())
+    result = {'lines': lines, 'records': len(legacyParseCourseScript(scriptStr)[4]),
+              'legacy': _median(lambda: legacyParseCourseScript(scriptStr), rounds),
+              'tokenize': _median(lambda: list(tokenizeCourseScript(scriptStr)), rounds),
+              'parse': _median(lambda: (scanCourseTableHeader(scriptStr), list(iterCourseRecords(scriptStr))), rounds)}
+    for name in ('legacy', 'tokenize', 'parse'):
+        result[name + 'LinesPerSec'] = lines / result[name] if result[name] else float('inf')
+    return result
+
+
+def runMergeBenchmark(courseCount: int = 4000, sectionsPerCourse: int = 200, rounds: int = 5):
+    """
+    比较改写前逐个比较的合并和iterMergedCourses按mergeKey索引的合并
+    合成的课表中每门课程有sectionsPerCourse个教学班，改写前的合并对每个需要合并的记录都要检查同一课程的所有教学班
+    :param courseCount: TaskActivity的数量(不含跨年拆出的部分)
+    :param rounds: 重复次数，结果取中位数
+    :return: {'records': 合并前的记录数, 'courses': 合并后的课程数, 'sectionsPerCourse': sectionsPerCourse,
+              'legacy'/'indexed': 合并耗时(秒)}，不包含解析脚本的耗时
+    """
+    scriptStr = generateCourseScript(courseCount, sectionsPerCourse=sectionsPerCourse)
+    _, occupyWeek, _, endWeek = scanCourseTableHeader(scriptStr)
+    records = list(iterCourseRecords(scriptStr))
+    return {'records': len(records), 'courses': len(list(iterMergedCourses(records, occupyWeek, endWeek))),
+            'sectionsPerCourse': sectionsPerCourse,
+            # 改写前的合并会修改课程对象，每次重新解析，解析不计入耗时
+            'legacy': _median(lambda courses: legacyMergeCourses(courses, occupyWeek, endWeek), rounds,
+                              lambda: legacyParseCourseScript(scriptStr)[4]),
+            'indexed': _median(lambda: list(iterMergedCourses(records, occupyWeek, endWeek)), rounds)}
+
+
+def runEventBenchmark(courseCount: int = 5000, rounds: int = 5, modifyDEFTime: bool = True):
+    """
+    在合成课表上比较改写前逐个解析上课时间的日程计算和iterCourseEvents查表计算的速度，
+    另外测量包含写出ics在内的cvt2Caldav整体速度
+    :param courseCount: TaskActivity的数量(不含跨年拆出的部分)
+    :param rounds: 重复次数，结果取中位数
+    :param modifyDEFTime: 是否修正DEF楼课程第三节和第四节的时间
+    :return: {'courses': 合并后的课程数, 'events': 日程数, 'legacy'/'builder'/'ics': 耗时(秒),
+              'legacyEventsPerSec'/'builderEventsPerSec'/'icsEventsPerSec': 每秒生成的VEVENT数}
+    """
+    scriptStr = generateCourseScript(courseCount)
+    startYear, occupyWeek, startWeek, endWeek = scanCourseTableHeader(scriptStr)
+    courses = list(iterMergedCourses(iterCourseRecords(scriptStr), occupyWeek, endWeek))
+    legacyCourses = legacyMergeCourses(legacyParseCourseScript(scriptStr)[4], occupyWeek, endWeek)
+
+    def build():
+        # 与改写前一样，第一周的日期在每次导出时计算一次
+        return list(iterCourseEvents(iterCourseBlocks(courses, False), occupyWeek,
+                                     _firstWeekTime(startYear, occupyWeek), 15, modifyDEFTime))
+
+    def export():
+        cvt2Caldav(startYear, occupyWeek, startWeek, endWeek, courses, 15, modifyDEFTime, False, None,
+                   verbose=False, writer=IcsMemoryWriter())
+
+    result = {'courses': len(courses), 'events': len(build()),
+              'legacy': _median(lambda: list(legacyIterEventTimes(legacyCourses, startYear, occupyWeek,
+                                                                  modifyDEFTime)), rounds),
+              'builder': _median(build, rounds),
+              'ics': _median(export, rounds)}
+    for name in ('legacy', 'builder', 'ics'):
+        result[name + 'EventsPerSec'] = result['events'] / result[name] if result[name] else float('inf')
+    return result
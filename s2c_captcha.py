@@ -0,0 +1,268 @@
+# 验证码自动识别，供captcha子命令和--captcha-model使用。PIL和NumPy加载较慢，在第一次使用的函数中导入
+import os
+import time
+
+from sues_s2c import ErrorCode, MyException, SuesApi, promptCaptcha
+
+
+class CaptchaSolver:
+    """
+    验证码识别接口，实现solve即可用于solveCaptcha
+    """
+
+    def solve(self, capthaBytes: bytes):
+        """
+        :param capthaBytes: SuesApi.getCaptha获取的验证码图像
+        :return: (识别结果, 置信度0-1)
+        """
+        raise NotImplementedError
+
+
+class TemplateCaptchaSolver(CaptchaSolver):
+    """
+    本地离线的验证码识别，不需要联网或第三方服务，只依赖Pillow和NumPy：
+    灰度化后用Otsu阈值二值化并去掉孤立噪点，按列投影切分出每个字符，缩放到固定大小后
+    与已标注样本中的字符做kNN匹配。置信度为最近的其它字符与最近的同字符样本的距离差占比，整张图取各字符的最小值
+    已标注样本为一个目录中的图片，文件名(不含扩展名)中第一个'_'之前的部分为图中的验证码，如 'a3kx_17.jpg'
+    """
+    GLYPH_SIZE = (12, 16)  # 字符缩放后的宽、高
+
+    def __init__(self, templates=None, labels=None, length: int = 4, k: int = 3):
+        """
+        :param templates: 字符样本矩阵(numpy数组，每行一个字符的特征)，一般通过train或load得到
+        :param labels: 与templates每行对应的字符
+        :param length: 验证码的字符数
+        :param k: kNN的近邻数
+        """
+        import numpy as np
+        size = self.GLYPH_SIZE[0] * self.GLYPH_SIZE[1]
+        self.templates = np.zeros((0, size), np.float32) if templates is None else np.asarray(templates, np.float32)
+        self.labels = np.asarray([] if labels is None else labels, dtype='<U1')
+        self.length = length
+        self.k = k
+        self._templateNorms = (self.templates ** 2).sum(axis=1)
+
+    @staticmethod
+    def _binarize(capthaBytes: bytes):
+        """
+        :return: 二值图像(bool数组)，True为字符的笔画
+        """
+        from io import BytesIO
+        from PIL import Image
+        import numpy as np
+        gray = np.asarray(Image.open(BytesIO(capthaBytes)).convert('L'))
+
+        # Otsu阈值：使前景和背景的类间方差最大
+        hist = np.bincount(gray.ravel(), minlength=256).astype(np.float64)
+        levels = np.arange(256)
+        weightBg = np.cumsum(hist)
+        weightFg = weightBg[-1] - weightBg
+        sumBg = np.cumsum(hist * levels)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            meanBg = sumBg / weightBg
+            meanFg = (sumBg[-1] - sumBg) / weightFg
+            between = np.nan_to_num(weightBg * weightFg * (meanBg - meanFg) ** 2)
+        ink = gray <= int(np.argmax(between))
+        if ink.mean() > 0.5:  # 浅色字深色底
+            ink = ~ink
+
+        # 去掉8邻域内没有其它笔画的孤立噪点
+        padded = np.pad(ink, 1).astype(np.uint8)
+        neighbours = sum(padded[1 + dy:padded.shape[0] - 1 + dy, 1 + dx:padded.shape[1] - 1 + dx]
+                         for dy in (-1, 0, 1) for dx in (-1, 0, 1)) - ink
+        return ink & (neighbours > 0)
+
+    @staticmethod
+    def _segment(ink, length: int):
+        """
+        按列投影切分字符
+        :param ink: _binarize得到的二值图像
+        :param length: 期望的字符数，切分结果多于它时去掉笔画最少的块，少于它时把最宽的块从中间拆开
+        :return: [(起始列, 结束列(不含))]
+        """
+        import numpy as np
+        columns = ink.sum(axis=0)
+        edges = np.diff(np.concatenate(([0], (columns > 0).astype(np.int8), [0])))
+        runs = list(zip(np.flatnonzero(edges == 1).tolist(), np.flatnonzero(edges == -1).tolist()))
+        while len(runs) > length:
+            runs.remove(min(runs, key=lambda run: columns[run[0]:run[1]].sum()))
+        while runs and len(runs) < length:
+            beg, end = max(runs, key=lambda run: run[1] - run[0])
+            if end - beg < 2:
+                break
+            # 在中间一半的范围内找笔画最少的列作为拆分点
+            quarter = (end - beg) // 4
+            cut = beg + quarter + int(np.argmin(columns[beg + quarter:end - quarter])) if quarter else (beg + end) // 2
+            cut = min(max(cut, beg + 1), end - 1)
+            index = runs.index((beg, end))
+            runs[index:index + 1] = [(beg, cut), (cut, end)]
+        return runs
+
+    @classmethod
+    def _features(cls, capthaBytes: bytes, length: int):
+        """
+        :return: 每个字符的特征矩阵，切分出的字符数不等于length时返回None
+        """
+        from PIL import Image
+        import numpy as np
+        ink = cls._binarize(capthaBytes)
+        runs = cls._segment(ink, length)
+        if len(runs) != length:
+            return None
+        features = np.empty((length, cls.GLYPH_SIZE[0] * cls.GLYPH_SIZE[1]), np.float32)
+        for i, (beg, end) in enumerate(runs):
+            glyph = ink[:, beg:end]
+            rows = np.flatnonzero(glyph.any(axis=1))
+            glyph = glyph[rows[0]:rows[-1] + 1]
+            image = Image.fromarray(glyph.astype(np.uint8) * 255).resize(cls.GLYPH_SIZE, Image.BILINEAR)
+            features[i] = np.asarray(image, np.float32).ravel() / 255
+        return features
+
+    @staticmethod
+    def loadLabelled(directory: str):
+        """
+        读取已标注样本目录
+        :return: [(验证码, 图像内容)]
+        """
+        samples = []
+        for name in sorted(os.listdir(directory)):
+            path = os.path.join(directory, name)
+            if os.path.isfile(path) and not name.startswith('.'):
+                with open(path, 'rb') as f:
+                    samples.append((os.path.splitext(name)[0].split('_')[0], f.read()))
+        return samples
+
+    @classmethod
+    def train(cls, directory: str, length: int = 4, k: int = 3):
+        """
+        从已标注样本目录建立字符样本库，切分出的字符数与标注不一致的图片会被跳过
+        :param directory: 已标注样本目录
+        :return: TemplateCaptchaSolver对象
+        """
+        import numpy as np
+        templates, labels = [], []
+        for label, capthaBytes in cls.loadLabelled(directory):
+            features = cls._features(capthaBytes, length) if len(label) == length else None
+            if features is not None:
+                templates.append(features)
+                labels.extend(label)
+        if not templates:
+            raise MyException(ErrorCode.INPUT_ERROR, '%s中没有可用的已标注验证码' % directory)
+        return cls(np.concatenate(templates), labels, length, k)
+
+    def save(self, path: str):
+        """
+        保存字符样本库(.npz)
+        """
+        import numpy as np
+        with open(path, 'wb') as f:
+            np.savez_compressed(f, templates=self.templates, labels=self.labels, length=self.length, k=self.k)
+
+    @classmethod
+    def load(cls, path: str):
+        """
+        读取save保存的字符样本库，也可以直接传入已标注样本目录，此时调用train
+        """
+        if os.path.isdir(path):
+            return cls.train(path)
+        import numpy as np
+        try:
+            with np.load(path) as data:
+                return cls(data['templates'], data['labels'], int(data['length']), int(data['k']))
+        except (OSError, ValueError, KeyError) as e:
+            raise MyException(ErrorCode.INPUT_ERROR, '验证码样本库读取失败\n' + str(e))
+
+    def solve(self, capthaBytes: bytes):
+        import numpy as np
+        try:
+            features = self._features(capthaBytes, self.length)
+        except OSError:  # 不是图片，如被重定向到了错误页
+            features = None
+        if features is None or not len(self.labels):
+            return '', 0.0
+        # 所有字符与所有样本的距离平方，一次矩阵乘法得到
+        distances = (features ** 2).sum(axis=1)[:, None] + self._templateNorms[None, :] - 2 * features @ self.templates.T
+        distances = np.maximum(distances, 0)
+        k = min(self.k, len(self.labels))
+        nearest = np.argsort(distances, axis=1)[:, :k]
+
+        text, confidence = [], 1.0
+        for row, neighbours in zip(distances, nearest):
+            votes = {}
+            for index in neighbours:
+                votes[self.labels[index]] = votes.get(self.labels[index], 0.0) + 1.0 / (1e-6 + row[index])
+            char = max(votes, key=votes.get)
+            same = self.labels == char
+            best = row[same].min()
+            other = row[~same].min() if (~same).any() else best + 1.0
+            confidence = min(confidence, max(0.0, (other - best) / (other + 1e-6)))
+            text.append(char)
+        return ''.join(text), float(confidence)
+
+    def evaluate(self, directory: str, minConfidence: float = 0.0):
+        """
+        在已标注样本上测量识别准确率和耗时
+        :param directory: 已标注样本目录，不应与train使用的样本重复
+        :param minConfidence: 置信度阈值，低于它的结果视为拒绝识别(实际使用时会重新获取验证码)
+        :return: 统计信息字典
+        """
+        samples = self.loadLabelled(directory)
+        correct = accepted = acceptedCorrect = 0
+        elapsed = []
+        for label, capthaBytes in samples:
+            begin = time.perf_counter()
+            text, confidence = self.solve(capthaBytes)
+            elapsed.append(time.perf_counter() - begin)
+            correct += text == label
+            if confidence >= minConfidence:
+                accepted += 1
+                acceptedCorrect += text == label
+        elapsed.sort()
+        return {'samples': len(samples),
+                'accuracy': correct / len(samples) if samples else 0.0,
+                'accepted': accepted,
+                'acceptedAccuracy': acceptedCorrect / accepted if accepted else 0.0,
+                'latencyAvg': sum(elapsed) / len(elapsed) if elapsed else 0.0,
+                'latencyP95': elapsed[int(len(elapsed) * 0.95)] if elapsed else 0.0}
+
+
+def solveCaptcha(suesApi: SuesApi, solver: CaptchaSolver, minConfidence: float = 0.3, maxFetches: int = 3,
+                 fallback=None):
+    """
+    获取并自动识别验证码，置信度低时重新获取，都不满足时交给fallback
+    :param suesApi: 已调用newSession的SuesApi对象
+    :param solver: CaptchaSolver对象
+    :param minConfidence: 接受识别结果的最低置信度
+    :param maxFetches: 最多获取几次验证码
+    :param fallback: 识别失败时的处理函数 fallback(capthaBytes) -> str，如promptCaptcha，None时抛出异常
+    :return: 验证码
+    """
+    for _ in range(max(1, maxFetches)):
+        # 每次获取新验证码后旧的即失效，只能返回最后一张的结果
+        capthaBytes = suesApi.getCaptha()
+        text, confidence = solver.solve(capthaBytes)
+        if confidence >= minConfidence:
+            return text
+    if fallback:
+        return fallback(capthaBytes)
+    raise MyException(ErrorCode.CAPTCHA_FETCH_ERROR, '验证码自动识别失败，%d次的置信度都低于%g' % (maxFetches, minConfidence))
+
+
+def collectCaptchas(suesApi: SuesApi, directory: str, count: int):
+    """
+    获取验证码并在控制台人工标注，保存为TemplateCaptchaSolver使用的已标注样本
+    :param suesApi: 已调用newSession的SuesApi对象
+    :param directory: 保存目录
+    :param count: 获取的数量
+    """
+    from io import BytesIO
+    from PIL import Image
+    os.makedirs(directory, exist_ok=True)
+    for i in range(count):
+        capthaBytes = suesApi.getCaptha()
+        label = promptCaptcha(capthaBytes, '\n[%d/%d] 请输入验证码(图片另弹窗口，直接回车跳过):' % (i + 1, count)).strip()
+        if not label:
+            continue
+        extension = (Image.open(BytesIO(capthaBytes)).format or 'img').lower()
+        with open(os.path.join(directory, '%s_%d_%d.%s' % (label, int(time.time()), i, extension)), 'wb') as f:
+            f.write(capthaBytes)
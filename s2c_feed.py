@@ -0,0 +1,247 @@
+# webcal日历订阅服务，供serve子命令使用
+from urllib.parse import urlsplit
+import threading
+import time
+import hashlib
+
+from sues_s2c import (MyException, SuesApi, BatchJob, RequestPolicy, ResponseCache, SessionStore, Metrics, EventCache,
+                      IcsMemoryWriter, DEFAULT_BASE_URL, defaultMetrics, cvt2Caldav, resolvePassword,
+                      _failingCaptchaProvider)
+
+
+class CalendarFeed:
+    """
+    CalendarFeedServer中的一个订阅，对应一个学生的一个学期
+    """
+
+    def __init__(self, job: BatchJob):
+        """
+        :param job: 学号、密码来源、学年和学期，学年和学期为空时在第一次生成时确定
+        """
+        self.job = job
+        self.name = job.fileName or '%s_%s_%s' % (job.username, job.year or 'latest', job.term or 'latest')
+        self.suesApi = None
+        self.passwd = None
+        self.content = None  # 最近一次生成的ics内容
+        self.etag = None
+        self.lastModified = 0.0  # 内容最近一次变化的时间戳
+        self.refreshedAt = 0.0  # 最近一次成功生成的时间戳
+        self.error = ''  # 最近一次生成失败的原因，成功后清空
+        self.lock = threading.Lock()
+
+
+class CalendarFeedServer:
+    """
+    通过HTTP提供webcal订阅，日历客户端定期访问即可自动更新课表
+    每个订阅的ics内容生成后缓存在内存中，响应带ETag和Last-Modified，客户端轮询时内容没有变化只返回304；
+    后台线程每隔refreshInterval秒重新获取所有课表，只有内容变化时才更新ETag
+    """
+
+    def __init__(self, jobs: list, host: str = '127.0.0.1', port: int = 8000, refreshInterval: float = 3600,
+                 alarmTime: int = 15, modifyDEFTime: bool = False, splitCourse: bool = False, captchaProvider=None,
+                 cache: ResponseCache = None, cacheOnly: bool = False, sessionStore: SessionStore = None,
+                 requestPolicy: RequestPolicy = None, baseUrl: str = DEFAULT_BASE_URL, metrics: Metrics = None,
+                 compactRRule: bool = False, expand: bool = False):
+        """
+        :param jobs: BatchJob列表，每项对应一个订阅，fileName不为空时作为订阅名
+        :param host: 监听地址，默认只允许本机访问
+        :param port: 监听端口，0表示随机选择
+        :param refreshInterval: 后台刷新间隔(秒)，0表示不刷新，只在第一次访问时生成
+        :param captchaProvider: 验证码获取函数 captchaProvider(suesApi, job) -> str，
+        None时不获取验证码，没有可用会话的订阅刷新失败；需要在控制台输入时传入sues_s2c._consoleCaptchaProvider
+        其余参数同runBatch
+        """
+        self.feeds = {}
+        for job in jobs:
+            feed = CalendarFeed(job)
+            self.feeds[feed.name] = feed
+        self.host = host
+        self.port = port
+        self.refreshInterval = refreshInterval
+        self.alarmTime = alarmTime
+        self.modifyDEFTime = modifyDEFTime
+        self.splitCourse = splitCourse
+        self.captchaProvider = captchaProvider or _failingCaptchaProvider
+        self.cache = cache
+        self.cacheOnly = cacheOnly
+        self.sessionStore = sessionStore
+        self.requestPolicy = requestPolicy
+        self.baseUrl = baseUrl
+        self.metrics = metrics or defaultMetrics
+        self.compactRRule = compactRRule
+        self.expand = expand
+        self.eventCache = EventCache(metrics=self.metrics)  # 各订阅和每次刷新共享
+        self._httpd = None
+        self._stopped = threading.Event()
+
+    def feedUrl(self, feed: CalendarFeed):
+        """
+        :return: 可以添加到日历客户端的webcal地址
+        """
+        from urllib.parse import quote
+        return 'webcal://%s:%d/feeds/%s.ics' % (self.host, self.port, quote(feed.name))
+
+    def _login(self, feed: CalendarFeed):
+        job = feed.job
+        if feed.passwd is None:
+            feed.passwd = '' if self.cacheOnly else resolvePassword(job.passwordSource, job.username)
+        feed.suesApi = SuesApi(verbose=False, cache=self.cache, cacheOnly=self.cacheOnly,
+                               requestPolicy=self.requestPolicy, baseUrl=self.baseUrl, metrics=self.metrics)
+        feed.suesApi.ensureLogin(job.username, feed.passwd, lambda: self.captchaProvider(feed.suesApi, job),
+                                 self.sessionStore)
+
+    def refresh(self, feed: CalendarFeed):
+        """
+        重新获取课表并生成ics，内容变化时更新ETag和Last-Modified，失败时保留上次的内容
+        :return: 内容是否有变化
+        """
+        with feed.lock:
+            try:
+                with self.metrics.timer('feed_refresh'):
+                    # 两次刷新之间会话多半已经过期，先检查，避免用过期的会话获取课表
+                    if feed.suesApi is None or not (self.cacheOnly or feed.suesApi.isSessionValid()):
+                        self._login(feed)
+                    job = feed.job
+                    if not job.year:
+                        job.year = feed.suesApi.getYears()[0]
+                    if not job.term:
+                        job.term = feed.suesApi.getTerms(job.year)[0]
+                    try:
+                        courseTable = feed.suesApi.getCourseTable(job.year, job.term)
+                    except MyException:
+                        # 会话可能已过期，重新登录后再试一次
+                        self._login(feed)
+                        courseTable = feed.suesApi.getCourseTable(job.year, job.term)
+                    writer = IcsMemoryWriter()
+                    cvt2Caldav(*courseTable, self.alarmTime, self.modifyDEFTime, self.splitCourse, '', verbose=False,
+                               writer=writer, metrics=self.metrics, compactRRule=self.compactRRule,
+                               expand=self.expand, eventCache=self.eventCache)
+            except MyException as e:
+                feed.error = str(e)
+                self.metrics.count('feed_refreshes', status='failed')
+                return False
+            feed.error = ''
+            feed.refreshedAt = time.time()
+            self.metrics.count('feed_refreshes', status='ok')
+            etag = '"%s"' % hashlib.sha1(writer.content).hexdigest()
+            if etag == feed.etag:
+                return False
+            feed.content, feed.etag, feed.lastModified = writer.content, etag, feed.refreshedAt
+            return True
+
+    def _refreshSafely(self, feed: CalendarFeed):
+        """
+        同refresh，但任何异常都只记录在feed.error中，保证后台刷新线程和HTTP响应不会因为意外的错误中断
+        """
+        try:
+            return self.refresh(feed)
+        except Exception as e:
+            feed.error = '%s: %s' % (type(e).__name__, e)
+            self.metrics.count('feed_refreshes', status='failed')
+            return False
+
+    def respond(self, path: str, headers):
+        """
+        处理一个GET请求
+        :param path: 请求路径
+        :param headers: 请求头(支持get方法)
+        :return: (状态码, 响应头字典, 响应内容)
+        """
+        from urllib.parse import unquote
+        from email.utils import formatdate, parsedate_to_datetime
+        route = unquote(urlsplit(path).path)
+        if route in ('', '/'):
+            body = ''.join('%s\t%s\t%s\n' % (feed.name, self.feedUrl(feed), feed.error or 'ok')
+                           for feed in self.feeds.values())
+            return 200, {'Content-Type': 'text/plain; charset=utf-8'}, body.encode('utf-8')
+        if not (route.startswith('/feeds/') and route.endswith('.ics')):
+            return 404, {'Content-Type': 'text/plain'}, b'Not Found'
+        feed = self.feeds.get(route[len('/feeds/'):-len('.ics')])
+        if feed is None:
+            return 404, {'Content-Type': 'text/plain'}, b'Not Found'
+        if feed.content is None:
+            # 第一次访问时同步生成
+            self._refreshSafely(feed)
+            if feed.content is None:
+                self.metrics.count('feed_requests', status='503')
+                return 503, {'Content-Type': 'text/plain; charset=utf-8', 'Retry-After': '60'}, \
+                    feed.error.encode('utf-8')
+
+        responseHeaders = {'ETag': feed.etag, 'Last-Modified': formatdate(feed.lastModified, usegmt=True),
+                           'Cache-Control': 'no-cache'}
+        ifNoneMatch = headers.get('If-None-Match')
+        notModified = False
+        if ifNoneMatch:
+            notModified = ifNoneMatch.strip() == '*' or feed.etag in [tag.strip() for tag in ifNoneMatch.split(',')]
+        elif headers.get('If-Modified-Since'):
+            try:
+                notModified = int(feed.lastModified) <= parsedate_to_datetime(headers['If-Modified-Since']).timestamp()
+            except (TypeError, ValueError):
+                pass
+        if notModified:
+            self.metrics.count('feed_requests', status='304')
+            return 304, responseHeaders, b''
+        self.metrics.count('feed_requests', status='200')
+        responseHeaders['Content-Type'] = 'text/calendar; charset=utf-8'
+        responseHeaders['Content-Disposition'] = 'inline; filename="%s.ics"' % feed.job.username
+        return 200, responseHeaders, feed.content
+
+    def _refreshLoop(self):
+        while not self._stopped.wait(self.refreshInterval):
+            for feed in list(self.feeds.values()):
+                if self._stopped.is_set():
+                    return
+                self._refreshSafely(feed)
+
+    def start(self):
+        """
+        在后台线程中启动HTTP服务和定时刷新
+        :return: self
+        """
+        from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def _serve(self, withBody: bool):
+                status, headers, body = server.respond(self.path, self.headers)
+                self.send_response(status)
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                if withBody:
+                    self.wfile.write(body)
+
+            def do_GET(self):
+                self._serve(True)
+
+            def do_HEAD(self):
+                self._serve(False)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._httpd.daemon_threads = True
+        self.port = self._httpd.server_address[1]
+        self._stopped.clear()
+        threading.Thread(target=self._httpd.serve_forever, name='calendar-feed', daemon=True).start()
+        if self.refreshInterval > 0:
+            threading.Thread(target=self._refreshLoop, name='calendar-feed-refresh', daemon=True).start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        if self._httpd:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, excType, excValue, traceback):
+        self.stop()
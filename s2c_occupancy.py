@@ -0,0 +1,158 @@
+# 多个学生课表的教室、教师占用分析，供analyze子命令使用
+from collections import namedtuple
+import os
+import re
+
+from sues_s2c import ErrorCode, MyException, CourseSnapshot, EXPORTERS, cvt2Caldav
+
+
+Conflict = namedtuple('Conflict', ['kind', 'resourceId', 'first', 'second', 'cells'])  # OccupancyIndex.conflicts的一项
+
+
+class OccupancyIndex:
+    """
+    多个学生同一学期课表的教室、教师占用索引
+    同一个教学班(课程、教师、教室、上课时间和周次都相同)出现在多个学生的课表中时只记录一次。
+    索引以(周次, 星期, 节次)为键，值为该时间各教室、教师被哪些教学班占用，查询某个教室或教师是否被占用、
+    某时间的空闲教室只需要查找对应的格子，与学生数和教学班数无关；同一格子中加入第二个教学班时记录为冲突(重复安排)
+    没有教室ID或教师ID的教学班只记录在sections中，不参与对应资源的占用和冲突
+    查询使用的周次为教学周(从1计数，同课表上显示的周次)，星期和节次同CourseInfo(从0计数，星期0为周一)
+    """
+    ROOM = 'room'
+    TEACHER = 'teacher'
+
+    def __init__(self):
+        self.header = None  # 课表年份, 教学活动起始周, 起始周, 结束周，加入的课表必须属于同一学期
+        self.sections = []  # 去重后的教学班(CourseInfo)
+        self.studentCounts = []  # 每个教学班出现在几个学生的课表中
+        self.studentCount = 0
+        self.names = {self.ROOM: {}, self.TEACHER: {}}  # 类型 -> {ID: 名称}
+        self._sectionIds = {}  # 去重键 -> 教学班编号
+        self._cells = {self.ROOM: {}, self.TEACHER: {}}  # 类型 -> {(周次位, 星期, 节次): {ID: [教学班编号]}}
+        self._resourceSections = {self.ROOM: {}, self.TEACHER: {}}  # 类型 -> {ID: [教学班编号]}
+        self._conflicts = {}  # (类型, ID, 先加入的教学班编号, 后加入的教学班编号) -> [(周次位, 星期, 节次)]
+
+    @classmethod
+    def fromSnapshot(cls, path: str, year: str = None, term: str = None):
+        """
+        用快照中的课表建立索引
+        :param year: 只使用该学年的课表，None时不限
+        :param term: 只使用该学期的课表，None时不限
+        """
+        index = cls()
+        with CourseSnapshot(path) as snapshot:
+            for (_, tableYear, tableTerm), courseTable in snapshot.items():
+                if (year is None or tableYear == year) and (term is None or tableTerm == term):
+                    index.add(courseTable)
+        if index.header is None:
+            raise MyException(ErrorCode.INPUT_ERROR, '快照中没有符合条件的课表')
+        return index
+
+    def _weekBit(self, week: int):
+        # 教学周(从1计数)在WeekSet中对应的位
+        return int(self.header[1]) - 1 + week - 1
+
+    def add(self, courseTable: tuple):
+        """
+        加入一个学生的课表
+        :param courseTable: 与SuesApi.getCourseTable的返回值相同的元组
+        :return: 新增的教学班数
+        """
+        header, courseList = tuple(courseTable[:4]), courseTable[4]
+        if self.header is None:
+            self.header = header
+        elif header[:2] != self.header[:2]:
+            raise MyException(ErrorCode.INPUT_ERROR, '只能分析同一学期的课表：%s年第%s周开始的课表与之前的%s年第%s周不同'
+                              % (header[0], header[1], self.header[0], self.header[1]))
+        self.studentCount += 1
+        added = 0
+        for course in courseList:
+            slots = tuple(sorted(course.courses))
+            key = (course.courseId, course.teacherId, course.roomId, course.day, slots, course.weeks)
+            sectionId = self._sectionIds.get(key)
+            if sectionId is not None:
+                self.studentCounts[sectionId] += 1
+                continue
+            sectionId = self._sectionIds[key] = len(self.sections)
+            self.sections.append(course)
+            self.studentCounts.append(1)
+            added += 1
+            for kind, resourceId, name in ((self.ROOM, course.roomId, course.roomName),
+                                           (self.TEACHER, course.teacherId, course.teacherName)):
+                if not resourceId:
+                    continue  # 没有安排教室(如网课、实习)或教师的课程不占用资源，不能互相冲突
+                self.names[kind][resourceId] = name
+                self._resourceSections[kind].setdefault(resourceId, []).append(sectionId)
+                cells = self._cells[kind]
+                for runBeg, runEnd in course.weeks.runs():
+                    for weekBit in range(runBeg, runEnd):
+                        for slot in slots:
+                            cell = (weekBit, course.day, slot)
+                            occupants = cells.setdefault(cell, {}).setdefault(resourceId, [])
+                            for other in occupants:
+                                self._conflicts.setdefault((kind, resourceId, other, sectionId), []).append(cell)
+                            occupants.append(sectionId)
+        return added
+
+    def occupants(self, kind: str, resourceId: str, week: int, day: int, slot: int):
+        """
+        :param kind: OccupancyIndex.ROOM或OccupancyIndex.TEACHER
+        :return: 该时间占用该教室或教师的教学班(CourseInfo)列表，空闲时为空列表
+        """
+        cell = self._cells[kind].get((self._weekBit(week), day, slot), {})
+        return [self.sections[sectionId] for sectionId in cell.get(resourceId, ())]
+
+    def freeRooms(self, week: int, day: int, slots):
+        """
+        :param slots: 节次(从0计数)的可迭代对象，例:range(2, 4)
+        :return: 这些节次都空闲的教室ID，按ID排序。只知道课表中出现过的教室
+        """
+        cells = self._cells[self.ROOM]
+        busy = set()
+        for slot in slots:
+            busy.update(cells.get((self._weekBit(week), day, slot), ()))
+        return sorted(self.names[self.ROOM].keys() - busy)
+
+    def resourceSections(self, kind: str, resourceId: str):
+        """
+        :return: 使用该教室或由该教师上课的所有教学班(CourseInfo)
+        """
+        return [self.sections[sectionId] for sectionId in self._resourceSections[kind].get(resourceId, ())]
+
+    def conflicts(self, kind: str = None):
+        """
+        同一教室或同一教师在同一时间被安排了多个教学班
+        :param kind: 只返回该类型的冲突，None时返回全部
+        :return: Conflict列表，first和second为冲突的两个教学班，cells为冲突的[(教学周, 星期, 节次)]
+        """
+        weekOffset = int(self.header[1]) - 1 if self.header else 0
+        return [Conflict(conflictKind, resourceId, self.sections[first], self.sections[second],
+                         [(weekBit - weekOffset + 1, day, slot) for weekBit, day, slot in cells])
+                for (conflictKind, resourceId, first, second), cells in self._conflicts.items()
+                if kind is None or conflictKind == kind]
+
+    def exportCalendars(self, kind: str, outputDir: str, alarmTime: int = 15, modifyDEFTime: bool = False,
+                        splitCourse: bool = False, compactRRule: bool = False, exportFormat: str = 'ics',
+                        expand: bool = False):
+        """
+        为每个教室或教师生成一个日历文件，文件名为 类型_ID_名称.扩展名
+        :param kind: OccupancyIndex.ROOM或OccupancyIndex.TEACHER
+        其余参数同cvt2Caldav
+        :return: 生成的文件数
+        """
+        os.makedirs(outputDir, exist_ok=True)
+        for resourceId, name in sorted(self.names[kind].items()):
+            fileName = re.sub(r'[\\/:*?"<>|\s]+', '_', '%s_%s_%s' % (kind, resourceId, name))
+            cvt2Caldav(*self.header, self.resourceSections(kind, resourceId), alarmTime, modifyDEFTime, splitCourse,
+                       os.path.join(outputDir, fileName + EXPORTERS[exportFormat].EXTENSION), verbose=False,
+                       compactRRule=compactRRule, exportFormat=exportFormat, expand=expand)
+        return len(self.names[kind])
+
+    def summary(self):
+        """
+        :return: 学生数、去重后的教学班数、去重前的课程格子数、教室数、教师数、教室冲突数、教师冲突数
+        """
+        return {'students': self.studentCount, 'sections': len(self.sections), 'enrolments': sum(self.studentCounts),
+                'rooms': len(self.names[self.ROOM]), 'teachers': len(self.names[self.TEACHER]),
+                'roomConflicts': sum(key[0] == self.ROOM for key in self._conflicts),
+                'teacherConflicts': sum(key[0] == self.TEACHER for key in self._conflicts)}
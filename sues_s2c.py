@@ -1,10 +1,5 @@
-import requests
-import requests_html
-from io import BytesIO
-from PIL import Image
-from icalendar import Calendar, Event, Alarm
+# requests、requests_html、PIL、icalendar和dateutil加载较慢，在第一次使用的函数中导入，使程序启动时可以立即显示提示
 from datetime import datetime, timedelta
-from dateutil import tz
 import random
 import math
 import re
@@ -12,8 +7,23 @@ import os
 import getpass
 from enum import Enum, unique
 import sys
-import copy
-from functools import cmp_to_key
+from functools import lru_cache
+from collections import namedtuple, OrderedDict
+import threading
+from contextlib import contextmanager, redirect_stdout
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
+import csv
+import json
+import time
+import html
+import hashlib
+import base64
+import struct
+
+# 直接运行本文件时模块名为__main__，s2c_feed等模块导入sues_s2c时应得到同一个模块，而不是再加载一份
+if __name__ == '__main__':
+    sys.modules.setdefault('sues_s2c', sys.modules[__name__])
 
 DBG_MODE = False
 
@@ -29,6 +39,7 @@ class ErrorCode(Enum):
     CONNECTION_ERROR = -7, '网络连接失败'
     INPUT_ERROR = -8, '用户输入错误'
     API_CHANGED = -9, '教学系统API有变化'
+    CACHE_MISS = -10, '缓存中没有需要的数据'
 
     def __init__(self, errorCode, errorMsg):
         self.errorcode = errorCode
@@ -45,39 +56,203 @@ class MyException(Exception):
         return '错误代码:%d   错误描述:%s   详细信息:%s' % (self.errorCode.errorcode, self.errorCode.errorMsg, self.detail)
 
 
+class WeekSet:
+    """
+    用整数位掩码表示的周次集合，第i位对应原先validweeks字符串(由0/1组成)的第i个字符
+    合并、移位、判断都是整数运算，runs可以直接得到所有连续的上课周
+    """
+    __slots__ = ('bits', 'length')
+
+    def __init__(self, bits: int = 0, length: int = 53):
+        """
+        :param bits: 位掩码，第i位为1表示第i周上课
+        :param length: 周次总数，对应validweeks字符串的长度
+        """
+        self.bits = bits
+        self.length = length
+
+    @classmethod
+    def fromStr(cls, weekStr: str):
+        """
+        :param weekStr: 01组成的字符串，例：'0111'表示第1-3周(从0计数)上课
+        """
+        if weekStr.strip('01'):
+            raise ValueError('周次字符串只能由0和1组成: ' + weekStr)
+        return cls(int(weekStr[::-1], 2) if weekStr else 0, len(weekStr))
+
+    def __str__(self):
+        return format(self.bits, '0%db' % self.length)[::-1] if self.length else ''
+
+    def __repr__(self):
+        return 'WeekSet(%r)' % str(self)
+
+    def __len__(self):
+        return self.length
+
+    def __eq__(self, other):
+        return isinstance(other, WeekSet) and self.bits == other.bits and self.length == other.length
+
+    def __hash__(self):
+        return hash((self.bits, self.length))
+
+    def test(self, week: int):
+        """
+        :return: 第week周(从0计数)是否上课
+        """
+        return (self.bits >> week) & 1 == 1
+
+    def anyInRange(self, beg: int, end: int):
+        """
+        :return: [beg,end)范围内是否有上课周，等价于 '1' in validweeks[beg:end]
+        """
+        if end <= beg:
+            return False
+        return self.bits & (((1 << end) - 1) ^ ((1 << beg) - 1)) != 0
+
+    def union(self, other):
+        """
+        :return: 两个长度相同的周次集合的并集
+        """
+        assert self.length == other.length
+        return WeekSet(self.bits | other.bits, self.length)
+
+    def concat(self, other):
+        """
+        :return: other接在self之后的周次集合，等价于字符串拼接 validweeks + otherValidWeeks
+        """
+        return WeekSet(self.bits | (other.bits << self.length), self.length + other.length)
+
+    def shift(self, count: int):
+        """
+        :return: 在前面补count个不上课周后的周次集合，等价于 count * '0' + validweeks
+        """
+        return WeekSet(self.bits << count, self.length + count)
+
+    def runs(self):
+        """
+        依次产生所有连续上课周的范围(beg, end)，从0计数，不包含end，与re.finditer(r'[1]+')得到的start(),end()相同
+        """
+        bits = self.bits
+        begs = bits & ~(bits << 1)  # 每段连续上课周的第一周
+        ends = bits & ~(bits >> 1)  # 每段连续上课周的最后一周
+        while begs:
+            begBit = begs & -begs
+            endBit = ends & -ends
+            yield begBit.bit_length() - 1, endBit.bit_length()
+            begs ^= begBit
+            ends ^= endBit
+
+    def recurrences(self, maxStep: int = 4, exdateCost: float = 0.125):
+        """
+        选择表示所有上课周所需日程最少的重复规则，用于RRULE压缩
+        候选为每段连续上课周一个日程(与runs相同)，或从第一个上课周起每step周重复一次的一个日程，
+        其中不上课的周用EXDATE排除。单双周上课的课程用后者只需要一个日程
+        :param maxStep: 考虑的最大重复间隔(周)
+        :param exdateCost: 一个EXDATE相对一个日程的代价，代价相同时选择与runs相同的表示
+        :return: [(第一周, 最后一周, 间隔, 需要排除的周组成的元组)]，从0计数，包含最后一周
+        """
+        rules = [(beg, end - 1, 1, ()) for beg, end in self.runs()]
+        if len(rules) <= 1:
+            return rules
+        first, last = rules[0][0], rules[-1][1]
+        bestCost = len(rules)
+        for step in range(1, maxStep + 1):
+            lattice = range(first, last + 1, step)
+            latticeBits = sum(1 << week for week in lattice)
+            if self.bits & ~latticeBits:
+                continue  # 有上课周不在每step周一次的位置上
+            holes = tuple(week for week in lattice if not self.test(week))
+            cost = 1 + len(holes) * exdateCost
+            if cost < bestCost:
+                rules, bestCost = [(first, last, step, holes)], cost
+        return rules
+
+
 class CourseInfo:
-    def __init__(self, teacherId, teacherName, courseId, courseName, roomId, roomName, validweeks):
-        self.teacherId = teacherId
-        self.teacherName = teacherName
-        self.courseId = courseId
-        self.courseName = courseName
-        self.roomId = roomId
-        self.roomName = roomName
-        self.validweeks = validweeks  # 01组成的字符串，代表了一年的53周
-        self.day = None
-        self.courses = []
+    """
+    教学管理系统课表上的一个课程格子，创建后不可修改，合并周次等操作返回新的对象
+    """
+    __slots__ = ('teacherId', 'teacherName', 'courseId', 'courseName', 'roomId', 'roomName', 'weeks', 'day', 'courses')
+
+    def __init__(self, teacherId, teacherName, courseId, courseName, roomId, roomName, validweeks, day: int,
+                 courses: tuple):
+        """
+        :param validweeks: 上课周次，WeekSet或01组成的字符串
+        :param day: 星期，从0计数，0表示周一
+        :param courses: 上课节次，从0计数
+        """
+        setField = super().__setattr__
+        setField('teacherId', teacherId)
+        setField('teacherName', teacherName)
+        setField('courseId', courseId)
+        setField('courseName', courseName)
+        setField('roomId', roomId)
+        setField('roomName', roomName)
+        # 上课周次，对应01组成的字符串，代表了一年的53周
+        setField('weeks', validweeks if isinstance(validweeks, WeekSet) else WeekSet.fromStr(validweeks))
+        setField('day', day)
+        setField('courses', tuple(courses))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('CourseInfo对象不可修改，请使用replaceWeeks/mergeValidWeek创建新对象')
+
+    @property
+    def validweeks(self):
+        """
+        01组成的字符串形式的上课周次
+        """
+        return str(self.weeks)
+
+    def replaceWeeks(self, weeks: WeekSet):
+        """
+        :return: 只有上课周次不同的新CourseInfo对象
+        """
+        return CourseInfo(self.teacherId, self.teacherName, self.courseId, self.courseName, self.roomId, self.roomName,
+                          weeks, self.day, self.courses)
 
     def canMergeValidWeek(self, otherCourseInfo):
         # 这里必须要把星期和上课时间补充完整后才能进行合并
         assert self.day != None
         assert len(self.courses) != 0
 
-        # 合并的条件是两个课程除了validweeks其他信息都相同，且validweeks长度相同，内容不同 validweeks长度53
-        return len(self.validweeks) == 53 \
-               and len(self.validweeks) == len(otherCourseInfo.validweeks) \
-               and self.validweeks != otherCourseInfo.validweeks \
+        # 合并的条件是两个课程除了validweeks其他信息(包括上课节次)都相同，且validweeks长度相同，内容不同 validweeks长度53
+        return len(self.weeks) == 53 \
+               and len(self.weeks) == len(otherCourseInfo.weeks) \
+               and self.weeks != otherCourseInfo.weeks \
                and self.teacherId == otherCourseInfo.teacherId \
                and self.courseId == otherCourseInfo.courseId \
                and self.roomId == otherCourseInfo.roomId \
-               and self.day == otherCourseInfo.day
+               and self.day == otherCourseInfo.day \
+               and self.courses == otherCourseInfo.courses
+
+    def mergeKey(self):
+        """
+        :return: 除周次外决定两个课程能否合并的字段，canMergeValidWeek为真的两个课程mergeKey一定相同
+        """
+        return self.teacherId, self.courseId, self.roomId, self.day, self.courses
 
-    def mergeValidWeek(self, otherValidWeeks: str):
+    def mergeValidWeek(self, otherWeeks: WeekSet):
         """
-        对字符串进行合并，self.validweeks+=otehrValidWeeks
-        :param otherValidWeeks:
+        对周次进行合并，等价于字符串self.validweeks+otherValidWeeks
+        :param otherWeeks:
+        :return: 合并周次后的新CourseInfo对象
         """
-        assert len(self.validweeks) == len(otherValidWeeks)
-        self.validweeks += otherValidWeeks
+        assert len(self.weeks) == len(otherWeeks)
+        return self.replaceWeeks(self.weeks.concat(otherWeeks))
+
+
+class CourseSlice:
+    """
+    课程的一部分上课节次，按节次切分日程时代替复制整个CourseInfo，其余属性直接读取原课程
+    """
+    __slots__ = ('course', 'courses')
+
+    def __init__(self, course: CourseInfo, courses: tuple):
+        self.course = course
+        self.courses = courses
+
+    def __getattr__(self, name):
+        return getattr(self.course, name)
 
 
 timetable = [('08:15', '09:00'),
@@ -110,42 +285,894 @@ def cmp_courseTime(t1: int, t2: int):
     return 0
 
 
-class SuesApi:
+def _clockToTimedelta(clock: str):
+    hour, minute = clock.split(':')
+    return timedelta(hours=int(hour), minutes=int(minute))
+
+
+# 预先计算好的每节课(上课时间, 下课时间)，相对当天0点，生成日程时不再需要解析'HH:MM'
+slotTimes = [(_clockToTimedelta(beg), _clockToTimedelta(end)) for beg, end in timetable]
+DEFslotTimes = [(_clockToTimedelta(beg), _clockToTimedelta(end)) for beg, end in DEFtimeTable]
+
+# 节次排序键，sorted(courses, key=slotSortKey)与按cmp_courseTime排序的结果相同
+slotSortKey = realTimeTableOrder.__getitem__
+
+ONE_WEEK = timedelta(weeks=1)
+
+
+@lru_cache(maxsize=None)
+def beijingTz():
+    """
+    :return: 北京时间的tzinfo，只解析一次
+    """
+    from dateutil import tz
+    return tz.gettz('Beijing')
+
+
+# 课表js脚本中四种语句对应的记录类型，由tokenizeCourseScript产生
+TaskActivityToken = namedtuple('TaskActivityToken', ['args'])  # new TaskActivity(...)，args为其中的字符串参数
+UnitIndexToken = namedtuple('UnitIndexToken', ['day', 'unit'])  # index =day*unitCount+unit，上一个课程的星期和节次
+MarshalTableToken = namedtuple('MarshalTableToken', ['occupyWeek', 'startWeek', 'endWeek'])  # marshalTable(...)
+CourseTableToken = namedtuple('CourseTableToken', ['year', 'semesterId'])  # new CourseTable(...)
+
+# 四种语句合并为一个正则，每种语句都以固定的关键字开头，整个脚本只需扫描一遍，不再逐行尝试多个以.*开头的正则
+_courseScriptTokenRe = re.compile(
+    r'new[ \t]+TaskActivity\(([^\r\n]*)\)[ \t]*;'
+    r'|index[ \t]*=[ \t]*(\d+)[ \t]*\*[ \t]*unitCount[ \t]*\+[ \t]*(\d+)[ \t]*;'
+    r'|\.marshalTable\(([^()\r\n]*)\)[ \t]*;'
+    r'|new[ \t]+CourseTable\(([^()\r\n]*)\)[ \t]*;')
+_quotedStrRe = re.compile(r'"(.*?)"')
+
+
+def tokenizeCourseScript(scriptStr: str):
+    """
+    线性扫描一遍课表js脚本，依次产生其中的TaskActivityToken、UnitIndexToken、MarshalTableToken和CourseTableToken
+    :param scriptStr: 包含new TaskActivity的js脚本
+    """
+    for match in _courseScriptTokenRe.finditer(scriptStr):
+        kind = match.lastindex
+        if kind == 1:
+            yield TaskActivityToken(tuple(_quotedStrRe.findall(match.group(1))))
+        elif kind == 3:
+            yield UnitIndexToken(match.group(2), match.group(3))
+        elif kind == 4:
+            yield MarshalTableToken(*(i.strip() for i in match.group(4).split(',')))
+        else:
+            yield CourseTableToken(*(i.strip() for i in match.group(5).split(',')[:2]))
+
+
+_courseTableHeaderRe = re.compile(r'\.marshalTable\(([^()\r\n]*)\)[ \t]*;|new[ \t]+CourseTable\(([^()\r\n]*)\)[ \t]*;')
+
+
+def scanCourseTableHeader(scriptStr: str):
+    """
+    读取课表js脚本中的课表年份和教学周信息。marshalTable在脚本末尾，而合并课程需要教学周信息，
+    所以先单独扫描这两种语句，课程记录再由iterCourseRecords边读边交给iterMergedCourses
+    :param scriptStr: 包含new TaskActivity的js脚本
+    :return: 课表年份, 教学活动起始(相对于全年), 教学活动起始周, 教学活动结束周，脚本中没有时为None(同getCourseTable)
+    """
+    startYear = allOccupyWeek = allStartWeek = allEndWeek = None
+    for match in _courseTableHeaderRe.finditer(scriptStr):
+        if match.lastindex == 1:
+            allOccupyWeek, allStartWeek, allEndWeek = MarshalTableToken(*(i.strip() for i in match.group(1).split(',')))
+        else:
+            startYear = CourseTableToken(*(i.strip() for i in match.group(2).split(',')[:2])).year
+    return startYear, allOccupyWeek, allStartWeek, allEndWeek
+
+
+def iterCourseRecords(scriptStr: str):
+    """
+    流水线第一步：依次产生课表js脚本中的每个TaskActivity，只保存正在读取的一个
+    :param scriptStr: 包含new TaskActivity的js脚本
+    :return: 依次产生未合并的CourseInfo，上课星期和节次已补充完整
+    """
+    activity = None  # [TaskActivity参数, 上课星期, 上课节次列表]
+    for token in tokenizeCourseScript(scriptStr):
+        if isinstance(token, TaskActivityToken):
+            # 新课程，上一个课程的节次信息已经读完
+            if activity:
+                yield CourseInfo(*activity[0], activity[1], activity[2])
+            activity = [token.args, None, []]
+        elif isinstance(token, UnitIndexToken):
+            # 当前课程的节次信息
+            activity[1] = int(token.day)
+            activity[2].append(int(token.unit))
+    if activity:
+        yield CourseInfo(*activity[0], activity[1], activity[2])
+
+
+def iterMergedCourses(courseRecords, allOccupyWeek: str, allEndWeek: str, metrics=None):
+    """
+    流水线第二步：合并被教学管理系统拆成两项的跨年课程
+    同一门课程的记录可能出现在脚本的任何位置，而输出按courseId分组，所以这一步读完所有记录后才开始输出，
+    但只保存合并后的课程，不再另外保存未合并的列表
+    :param courseRecords: iterCourseRecords的结果
+    :param metrics: 不为None时记录读取的TaskActivity数(task_activities)和合并次数(course_merges)
+    :return: 依次产生合并后的CourseInfo
+    """
+    unMergedCourseDict = {}
+    activityCount = mergeCount = 0
+
+    # 这里需要注意，如果当前validweek放不下js会新建一个课程信息对象把validweek补到前面去
+    # 这个课程信息对象需要特殊处理，否则日期会摆放不正确（这里和jxxt网上处理有一定差异！）
+    # 因此如果发现这种情况需要特殊处理,如果碰到两个课程信息只有validweeks不同就需要进行合并这两个validweeks
+    # 进行课程信息合并
+    # 合并候选索引：CourseInfo.mergeKey() -> 该课程在unMergedCourseDict[courseId]中的下标列表，只记录周次长度为53的课程
+    mergeIndex = {}
+    for curCourse in courseRecords:
+        activityCount += 1
+        needMergeIndicator = 53 - (int(allOccupyWeek) - 1) - int(
+            allEndWeek)  # 表示在当前validweeks字符串中还缺多少位，这个值<0表示需要与其他项合并
+
+        if (curCourse.weeks.anyInRange(0, int(allOccupyWeek) - 1) and not curCourse.weeks.test(0)):
+            # 特殊情况，这种情况下前面有1但是第一位是0，这表示当前周次需要转换后才能输出(前面补52个0)
+            curCourse = curCourse.replaceWeeks(curCourse.weeks.shift(53 - 1))
+
+        courseGroup = unMergedCourseDict.setdefault(curCourse.courseId, [])
+        mergeKey = curCourse.mergeKey()
+        merged = False
+        if needMergeIndicator < 0 and len(curCourse.weeks) == 53:
+            # 说明需要curCourse和其他项合并周次才完整，通过索引直接找到除周次外完全相同的课程
+            candidates = mergeIndex.get(mergeKey, [])
+            for candIndex, existCIndex in enumerate(candidates):
+                existingCourse = courseGroup[existCIndex]
+                if existingCourse.weeks == curCourse.weeks:
+                    continue
+                # print('Merge', curCourse.courseName, existingCourse.validweeks, '+', curCourse.validweeks)
+
+                # 判断一下Merge先后顺序
+                if curCourse.weeks.anyInRange(0, int(allOccupyWeek) - 1):
+                    courseGroup[existCIndex] = existingCourse.mergeValidWeek(curCourse.weeks)
+                elif existingCourse.weeks.anyInRange(0, int(allOccupyWeek) - 1):
+                    courseGroup[existCIndex] = curCourse.mergeValidWeek(existingCourse.weeks)
+                else:
+                    raise MyException(ErrorCode.API_CHANGED,
+                                      'API有改变，无法合并课程' + curCourse.courseName + ',请联系作者！')
+                # 合并后周次长度不再是53，不能再参与合并
+                merged = True
+                mergeCount += 1
+                del candidates[candIndex]
+                break
+        if not merged:
+            if len(curCourse.weeks) == 53:
+                mergeIndex.setdefault(mergeKey, []).append(len(courseGroup))
+            courseGroup.append(curCourse)
+
+    if metrics:
+        metrics.count('task_activities', activityCount)
+        metrics.count('course_merges', mergeCount)
+    del mergeIndex
+    occupyWeek = int(allOccupyWeek)
+    crossYear = 53 - (occupyWeek - 1) - int(allEndWeek) < 0
+    for curCourseList in unMergedCourseDict.values():
+        for curCourse in curCourseList:
+            if crossYear and len(curCourse.weeks) == 53 and curCourse.weeks.anyInRange(0, occupyWeek - 1) \
+                    and not curCourse.weeks.anyInRange(occupyWeek - 1, 53):
+                # 跨年课程下一年的部分没有可以合并的当年部分(例如上课节次不同)，与合并后一样接在当年53周之后，日期落在下一年
+                curCourse = curCourse.replaceWeeks(curCourse.weeks.shift(53))
+            yield curCourse
+
+
+class HostConcurrencyLimiter:
+    """
+    按主机限制同时进行的HTTP请求数，多个SuesApi对象共享同一个限制器时可以避免对教学管理系统并发请求过多
+    """
+
+    def __init__(self, maxPerHost: int = 0):
+        """
+        :param maxPerHost: 每个主机允许同时进行的请求数，0表示不限制
+        """
+        self.maxPerHost = maxPerHost
+        self._semaphores = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def slot(self, url: str):
+        """
+        占用url所在主机的一个请求名额，名额用完时阻塞等待
+        :param url: 请求地址
+        """
+        if self.maxPerHost <= 0:
+            yield
+            return
+        host = urlsplit(url).netloc
+        with self._lock:
+            semaphore = self._semaphores.get(host)
+            if semaphore is None:
+                semaphore = self._semaphores[host] = threading.BoundedSemaphore(self.maxPerHost)
+        with semaphore:
+            yield
+
+
+# 默认不限制并发，批量导出时由runBatch设置
+defaultHostLimiter = HostConcurrencyLimiter()
+
+
+class RequestPolicy:
+    """
+    HTTP请求的重试、退避、按主机限速和熔断策略，多个SuesApi对象共享同一个策略时限速和熔断状态也是共享的
+    连接失败、超时以及429/5xx响应会在指数退避(带随机抖动)后重试；
+    同一主机连续失败breakerThreshold次后熔断，breakerCooldown秒内的请求直接失败，之后放行一个试探请求
+    """
+    RETRY_STATUS = frozenset((429, 500, 502, 503, 504))
+
+    def __init__(self, retries: int = 2, backoffBase: float = 0.5, backoffMax: float = 8.0, ratePerHost: float = 0,
+                 burst: int = 5, breakerThreshold: int = 5, breakerCooldown: float = 30.0):
+        """
+        :param retries: 失败后的最大重试次数
+        :param backoffBase: 第一次重试前的最长等待时间(秒)，之后每次翻倍
+        :param backoffMax: 单次重试前的最长等待时间(秒)
+        :param ratePerHost: 每个主机每秒允许发出的请求数(令牌桶)，0表示不限制
+        :param burst: 令牌桶容量，即允许的突发请求数
+        :param breakerThreshold: 连续失败多少次后熔断，0表示不熔断
+        :param breakerCooldown: 熔断持续时间(秒)
+        """
+        self.retries = retries
+        self.backoffBase = backoffBase
+        self.backoffMax = backoffMax
+        self.ratePerHost = ratePerHost
+        self.burst = max(1, burst)
+        self.breakerThreshold = breakerThreshold
+        self.breakerCooldown = breakerCooldown
+        self._buckets = {}  # host -> [可用令牌数, 上次补充时间]
+        self._failures = {}  # host -> 连续失败次数
+        self._openUntil = {}  # host -> 熔断结束时间
+        self._lock = threading.Lock()
+        # 统计信息
+        self.attempts = 0
+        self.retried = 0
+        self.failures = 0
+        self.rejected = 0
+        self.latencyTotal = 0.0
+        self.latencyMax = 0.0
+
+    def backoff(self, attempt: int):
+        """
+        :param attempt: 已失败的次数-1
+        :return: 第attempt次重试前的等待时间(秒)，在[0, min(backoffMax, backoffBase*2^attempt)]中均匀随机
+        """
+        return random.uniform(0, min(self.backoffMax, self.backoffBase * (2 ** attempt)))
+
+    def acquire(self, host: str):
+        """
+        从host的令牌桶中取一个令牌，没有令牌时阻塞等待
+        """
+        if self.ratePerHost <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                bucket = self._buckets.get(host)
+                if bucket is None:
+                    bucket = self._buckets[host] = [float(self.burst), now]
+                bucket[0] = min(float(self.burst), bucket[0] + (now - bucket[1]) * self.ratePerHost)
+                bucket[1] = now
+                if bucket[0] >= 1:
+                    bucket[0] -= 1
+                    return
+                wait = (1 - bucket[0]) / self.ratePerHost
+            time.sleep(wait)
+
+    def allow(self, host: str):
+        """
+        :return: host当前是否允许发出请求，熔断期间返回False
+        """
+        if self.breakerThreshold <= 0:
+            return True
+        with self._lock:
+            openUntil = self._openUntil.get(host)
+            if openUntil is None:
+                return True
+            now = time.monotonic()
+            if now < openUntil:
+                self.rejected += 1
+                return False
+            # 熔断结束，放行一个试探请求，试探结果出来之前其它请求仍然被拒绝
+            self._openUntil[host] = now + self.breakerCooldown
+            return True
+
+    def record(self, host: str, latency: float, ok: bool, retrying: bool):
+        """
+        记录一次请求的结果
+        :param latency: 请求耗时(秒)
+        :param ok: 请求是否成功
+        :param retrying: 失败后是否还会重试
+        """
+        with self._lock:
+            self.attempts += 1
+            self.latencyTotal += latency
+            self.latencyMax = max(self.latencyMax, latency)
+            if ok:
+                self._failures.pop(host, None)
+                self._openUntil.pop(host, None)
+                return
+            if retrying:
+                self.retried += 1
+            else:
+                self.failures += 1
+            count = self._failures[host] = self._failures.get(host, 0) + 1
+            if 0 < self.breakerThreshold <= count:
+                self._openUntil[host] = time.monotonic() + self.breakerCooldown
+
+    def stats(self):
+        """
+        :return: 统计信息字典
+        """
+        with self._lock:
+            return {'attempts': self.attempts, 'retried': self.retried, 'failures': self.failures,
+                    'rejected': self.rejected,
+                    'latencyAvg': self.latencyTotal / self.attempts if self.attempts else 0.0,
+                    'latencyMax': self.latencyMax,
+                    'openHosts': sorted(self._openUntil)}
+
+
+# 默认失败后重试2次，不限速，批量导出时由runBatch设置
+defaultRequestPolicy = RequestPolicy()
+
+
+class Metrics:
+    """
+    计数器和计时器，可以导出为JSON或Prometheus文本格式，可以在多个线程中共享
+    每个指标由名称和标签(关键字参数)确定，如 metrics.count('http_requests', endpoint='login.action', status='200')
+    """
 
     def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}  # (名称, 标签) -> 值
+        self.timers = {}  # (名称, 标签) -> [次数, 总耗时, 最长耗时]
+
+    def count(self, name: str, value: int = 1, **labels):
+        """
+        计数器增加value
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def record(self, name: str, seconds: float, **labels):
+        """
+        记录一次耗时
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            timer = self.timers.get(key)
+            if timer is None:
+                self.timers[key] = [1, seconds, seconds]
+            else:
+                timer[0] += 1
+                timer[1] += seconds
+                timer[2] = max(timer[2], seconds)
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        """
+        记录with块的耗时，块中抛出异常时也会记录
+        """
+        begin = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - begin, **labels)
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.timers.clear()
+
+    @staticmethod
+    def _format(name: str, labels: tuple):
+        if not labels:
+            return name
+        return '%s{%s}' % (name, ','.join('%s="%s"' % (key, str(value).replace('\\', '\\\\').replace('"', '\\"')
+                                                       .replace('\n', '\\n')) for key, value in labels))
+
+    def toDict(self):
+        """
+        :return: {'counters': {指标: 值}, 'timers': {指标: {'count', 'sum', 'max'}}}，指标写作 名称{标签="值"}
+        """
+        with self._lock:
+            return {'counters': {self._format(name, labels): value
+                                 for (name, labels), value in sorted(self.counters.items())},
+                    'timers': {self._format(name, labels): {'count': count, 'sum': total, 'max': longest}
+                               for (name, labels), (count, total, longest) in sorted(self.timers.items())}}
+
+    def toPrometheus(self, prefix: str = 'sues_s2c'):
+        """
+        :return: Prometheus文本格式，计数器为<prefix>_<名称>_total，计时器为summary类型的<prefix>_<名称>_seconds
+        """
+        lines = []
+        with self._lock:
+            counters = sorted(self.counters.items())
+            timers = sorted(self.timers.items())
+        lastName = None
+        for (name, labels), value in counters:
+            metric = '%s_%s_total' % (prefix, name)
+            if name != lastName:
+                lines.append('# TYPE %s counter' % metric)
+                lastName = name
+            lines.append('%s %s' % (self._format(metric, labels), value))
+        lastName = None
+        for (name, labels), (count, total, longest) in timers:
+            metric = '%s_%s_seconds' % (prefix, name)
+            if name != lastName:
+                lines.append('# TYPE %s summary' % metric)
+                lastName = name
+            lines.append('%s %d' % (self._format(metric + '_count', labels), count))
+            lines.append('%s %.6f' % (self._format(metric + '_sum', labels), total))
+        lastName = None
+        for (name, labels), (count, total, longest) in timers:
+            metric = '%s_%s_seconds_max' % (prefix, name)
+            if name != lastName:
+                lines.append('# TYPE %s gauge' % metric)
+                lastName = name
+            lines.append('%s %.6f' % (self._format(metric, labels), longest))
+        return '\n'.join(lines) + '\n'
+
+    def save(self, path: str):
+        """
+        写出到文件，扩展名为.json时写出toDict的JSON，否则写出Prometheus文本格式
+        """
+        with open(path, 'w', encoding='utf-8') as f:
+            if path.lower().endswith('.json'):
+                json.dump(self.toDict(), f, ensure_ascii=False, indent=2)
+            else:
+                f.write(self.toPrometheus())
+
+
+def _timedIter(iterable, elapsed: list):
+    """
+    依次产生iterable中的元素，从iterable取元素的耗时累加到elapsed[0]
+    流水线中相邻的两步交替执行，用它包装前一步的生成器即可分别得到两步的耗时，不需要先保存中间结果
+    """
+    iterator = iter(iterable)
+    while True:
+        begin = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            elapsed[0] += time.perf_counter() - begin
+        yield item
+
+
+# 所有SuesApi对象和cvt2Caldav默认记录到这里
+defaultMetrics = Metrics()
+
+
+class PageScanner:
+    """
+    直接在响应的原始字节中查找教学管理系统页面上需要的几个锚点，不构建完整的DOM
+    每个函数找不到或无法确定结果时返回None，由调用方回退到requests_html的DOM解析
+    """
+    semesterIdInputRe = re.compile(rb'<input\b[^>]*\bname\s*=\s*["\']semester\.id["\'][^>]*>', re.I)
+    valueAttrRe = re.compile(rb'\bvalue\s*=\s*(?:"([^"]*)"|\'([^\']*)\')', re.I)
+    courseFrameRe = re.compile(rb'<td\b[^>]*\bclass\s*=\s*["\'](?:[^"\']*\s)?frameTable_content(?:\s[^"\']*)?["\'][^>]*>'
+                               rb'\s*<iframe\b[^>]*\bsrc\s*=\s*(?:"([^"]*)"|\'([^\']*)\')', re.I)
+    loginErrorRe = re.compile(rb'<ul\b[^>]*\bclass\s*=\s*["\'](?:[^"\']*\s)?errorMessage(?:\s[^"\']*)?["\'][^>]*>'
+                              rb'\s*<li\b[^>]*>\s*<span\b[^>]*>(.*?)</span>', re.I | re.S)
+    tagRe = re.compile(r'<[^>]*>')
+
+    @staticmethod
+    def _decode(raw: bytes):
+        # 教学管理系统页面为UTF-8编码，解码失败时交给DOM解析处理
+        try:
+            return raw.decode('utf-8')
+        except UnicodeDecodeError:
+            return None
+
+    @staticmethod
+    def _attrValue(match):
+        if not match:
+            return None
+        value = PageScanner._decode(match.group(1) if match.group(1) is not None else match.group(2))
+        return html.unescape(value) if value is not None else None
+
+    @staticmethod
+    def semesterId(content: bytes):
+        """
+        :return: input[name=semester.id]的value
+        """
+        inputTag = PageScanner.semesterIdInputRe.search(content)
+        return PageScanner._attrValue(inputTag and PageScanner.valueAttrRe.search(inputTag.group(0)))
+
+    @staticmethod
+    def courseFrameSrc(content: bytes):
+        """
+        :return: td.frameTable_content>iframe的src
+        """
+        return PageScanner._attrValue(PageScanner.courseFrameRe.search(content))
+
+    @staticmethod
+    def taskActivityScript(content: bytes):
+        """
+        :return: 唯一一个包含'new TaskActivity'的<script>的内容
+        """
+        anchor = content.find(b'new TaskActivity')
+        if anchor < 0:
+            return None
+        scriptBeg = content.rfind(b'<script', 0, anchor)
+        scriptEnd = content.find(b'</script>', anchor)
+        if scriptBeg < 0 or scriptEnd < 0 or content.find(b'</script>', scriptBeg, anchor) >= 0:
+            return None
+        if content.find(b'new TaskActivity', scriptEnd) >= 0:
+            # 有多个脚本包含课程信息，交给DOM解析判断
+            return None
+        scriptBeg = content.find(b'>', scriptBeg, anchor)
+        if scriptBeg < 0:
+            return None
+        return PageScanner._decode(content[scriptBeg + 1:scriptEnd])
+
+    @staticmethod
+    def loginError(content: bytes):
+        """
+        :return: ul.errorMessage>li>span的文本，页面上没有错误信息时返回''
+        """
+        if content.find(b'errorMessage') < 0:
+            return ''
+        match = PageScanner.loginErrorRe.search(content)
+        if not match:
+            return None
+        text = PageScanner._decode(match.group(1))
+        return html.unescape(PageScanner.tagRe.sub('', text)).strip() if text is not None else None
+
+
+def isPastTerm(yearStr: str, semester: str, now: datetime = None):
+    """
+    判断学期是否已经结束，已结束学期的课表不会再变化
+    :param yearStr: 学年 例:'2019-2020'
+    :param semester: 学期 例:'1'
+    :param now: 当前时间，默认为datetime.now()
+    """
+    try:
+        endYear = int(yearStr.split('-')[-1])
+    except ValueError:
+        return False
+    # 第一学期在次年3月前结束，其余学期在次年9月前结束
+    termEnd = datetime(endYear, 3, 1) if semester == '1' else datetime(endYear, 9, 1)
+    return (now or datetime.now()) >= termEnd
+
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.sues_s2c', 'cache')
+
+
+class ResponseCache:
+    """
+    教学管理系统响应的磁盘缓存，按 用户+接口+参数 索引
+    每个接口有各自的有效期，缓存总大小超过上限时淘汰最久没有使用的条目
+    每个条目是一个文件：第一行为JSON格式的元数据，其后为响应的原始内容，文件修改时间即最近使用时间
+    """
+    DEFAULT_TTLS = {
+        'years': 24 * 3600,
+        'terms': 24 * 3600,
+        'courseTable': 3600,  # 当前学期的课表可能还会调整
+        'pastCourseTable': 365 * 24 * 3600,  # 已结束学期的课表不会再变化
+    }
+
+    def __init__(self, directory: str = DEFAULT_CACHE_DIR, maxBytes: int = 50 * 1024 * 1024, ttls: dict = None):
+        """
+        :param directory: 缓存目录
+        :param maxBytes: 缓存总大小上限
+        :param ttls: 各接口的有效期(秒)，覆盖DEFAULT_TTLS中的对应项
+        """
+        self.directory = directory
+        self.maxBytes = maxBytes
+        self.ttls = dict(self.DEFAULT_TTLS, **(ttls or {}))
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, user: str, endpoint: str, params: dict):
+        key = json.dumps([user, endpoint, params], sort_keys=True, ensure_ascii=False)
+        return os.path.join(self.directory, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.cache')
+
+    def get(self, user: str, endpoint: str, params: dict, checkExpiry: bool = True):
+        """
+        :param checkExpiry: 是否检查有效期，离线模式下过期的条目也可以使用
+        :return: 缓存的响应内容，没有或已过期时返回None
+        """
+        path = self._path(user, endpoint, params)
+        try:
+            with open(path, 'rb') as f:
+                meta = json.loads(f.readline())
+                content = f.read()
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        if checkExpiry and time.time() > meta['storedAt'] + self.ttls.get(meta['ttlName'], 0):
+            self.misses += 1
+            return None
+        try:
+            os.utime(path)  # 记录最近使用时间
+        except OSError:
+            pass
+        self.hits += 1
+        return content
+
+    def put(self, user: str, endpoint: str, params: dict, ttlName: str, content: bytes):
+        """
+        写入缓存并在超过大小上限时淘汰最久没有使用的条目
+        :param ttlName: 有效期名称，见DEFAULT_TTLS
+        """
+        path = self._path(user, endpoint, params)
+        meta = {'user': user, 'endpoint': endpoint, 'params': params, 'ttlName': ttlName, 'storedAt': time.time()}
+        tmpPath = '%s.%d.tmp' % (path, threading.get_ident())
+        with open(tmpPath, 'wb') as f:
+            f.write(json.dumps(meta, ensure_ascii=False).encode('utf-8') + b'\n')
+            f.write(content)
+        os.replace(tmpPath, path)
+        self._evict()
+
+    def _evict(self):
+        with self._lock:
+            entries = []
+            totalBytes = 0
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith('.cache'):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    totalBytes += stat.st_size
+            entries.sort()
+            for _, size, path in entries:
+                if totalBytes <= self.maxBytes:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                totalBytes -= size
+
+
+DEFAULT_SESSION_DIR = os.path.join(os.path.expanduser('~'), '.sues_s2c', 'sessions')
+
+
+class SessionStore:
+    """
+    加密保存登录后的会话(cookie和XHR会话ID)，之后的运行可以直接复用，跳过验证码和登录
+    每个学号一个文件，使用由教学管理系统密码通过PBKDF2派生的密钥以Fernet加密，需要安装cryptography
+    """
+    KDF_ITERATIONS = 200000
+
+    def __init__(self, directory: str = DEFAULT_SESSION_DIR, maxAge: int = 12 * 3600):
+        """
+        :param directory: 会话文件目录
+        :param maxAge: 会话最长复用时间(秒)，超过后即使服务器仍认可也重新登录
+        """
+        self.directory = directory
+        self.maxAge = maxAge
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, username: str):
+        return os.path.join(self.directory, hashlib.sha1(username.encode('utf-8')).hexdigest() + '.session')
+
+    @staticmethod
+    def _fernet(passwd: str, salt: bytes):
+        try:
+            from cryptography.fernet import Fernet
+        except ImportError:
+            raise MyException(ErrorCode.INPUT_ERROR, '保存会话需要安装cryptography: pip install cryptography')
+        key = hashlib.pbkdf2_hmac('sha256', passwd.encode('utf-8'), salt, SessionStore.KDF_ITERATIONS)
+        return Fernet(base64.urlsafe_b64encode(key))
+
+    def save(self, suesApi, passwd: str):
+        """
+        加密保存suesApi当前的会话
+        :param suesApi: 已登录的SuesApi对象
+        :param passwd: 教学管理系统密码，用于派生加密密钥
+        """
+        salt = os.urandom(16)
+        token = self._fernet(passwd, salt).encrypt(json.dumps(suesApi.exportSessionState()).encode('utf-8'))
+        path = self._path(suesApi.username)
+        tmpPath = '%s.%d.tmp' % (path, threading.get_ident())
+        with open(tmpPath, 'w', encoding='utf-8') as f:
+            json.dump({'salt': base64.b64encode(salt).decode('ascii'), 'token': token.decode('ascii')}, f)
+        os.replace(tmpPath, path)
+
+    def load(self, username: str, passwd: str):
+        """
+        :return: 保存的会话状态，没有、已过期或无法解密(如密码已修改)时返回None
+        """
+        try:
+            with open(self._path(username), encoding='utf-8') as f:
+                stored = json.load(f)
+            fernet = self._fernet(passwd, base64.b64decode(stored['salt']))
+        except (OSError, ValueError, KeyError):
+            return None
+        from cryptography.fernet import InvalidToken
+        try:
+            state = json.loads(fernet.decrypt(stored['token'].encode('ascii'), ttl=self.maxAge))
+        except (InvalidToken, KeyError, ValueError):
+            return None
+        return state if state.get('username') == username else None
+
+    def discard(self, username: str):
+        """
+        删除保存的会话
+        """
+        try:
+            os.remove(self._path(username))
+        except OSError:
+            pass
+
+
+DEFAULT_BASE_URL = 'http://jxxt.sues.edu.cn'
+
+
+class SuesApi:
+
+    def __init__(self, hostLimiter: HostConcurrencyLimiter = None, verbose: bool = True, cache: ResponseCache = None,
+                 cacheOnly: bool = False, requestPolicy: RequestPolicy = None, baseUrl: str = DEFAULT_BASE_URL,
+                 metrics: Metrics = None):
+        """
+        :param hostLimiter: 主机并发限制器，None时使用defaultHostLimiter
+        :param verbose: 是否在控制台输出进度信息
+        :param cache: 响应缓存，None时不使用缓存
+        :param cacheOnly: 离线模式，只从缓存读取(包括已过期的条目)，不访问教学管理系统
+        :param requestPolicy: 重试、限速和熔断策略，None时使用defaultRequestPolicy
+        :param baseUrl: 教学管理系统地址，测试时可以指向MockJxxtServer
+        :param metrics: 记录请求和各阶段耗时的Metrics对象，None时使用defaultMetrics
+        """
+        if cacheOnly and not cache:
+            raise MyException(ErrorCode.INPUT_ERROR, '离线模式需要指定缓存')
         self.session = None
         self.xhrOriSessionId = None
+        self.xhrSessionId = None
+        self.username = ''
+        self.cache = cache
+        self.cacheOnly = cacheOnly
+        self.hostLimiter = hostLimiter or defaultHostLimiter
+        self.requestPolicy = requestPolicy or defaultRequestPolicy
+        self.baseUrl = baseUrl.rstrip('/')
+        self.metrics = metrics or defaultMetrics
+        self.verbose = verbose
+        self.extractPaths = {}  # 各锚点最近一次提取使用的方式，见SuesApi._extract
 
         # 用到的正则表达式
-        self.activityMatchRe = re.compile(r'.*new.*TaskActivity\(.*\).*;$')
-        self.activityExtractRe = re.compile(r'".*?"')
-        self.indexMatchRe = re.compile(r'.*index.*=\d\*.*\+\d.*;$')
-        self.marshallMatchRe = re.compile(r'.*marshalTable\(.*?\).*;$')
-        self.timeExtractRe = re.compile(r'\(.*\)')
         self.squareBracketExprRe = re.compile(r'\[.*\]')
-        self.yearMatchRe = re.compile(r'.*CourseTable\(.*?\).*;$')
 
     def newSession(self):
         """
         创建新会话，本方法必须在所有函数之前调用
         """
+        if self.cacheOnly:
+            return
+        self._createSession()
+
+        # 测试连接
+        self._request('GET', self.baseUrl + '/', ErrorCode.CONNECTION_ERROR, '访问教学管理系统主页出错,请检查连接\n')
+
+        self.xhrOriSessionId = self._getXHROriSessionID()
+        self.xhrSessionId = self._getXHRCallSessionId()
+
+    def exportSessionState(self):
+        """
+        :return: 可以JSON序列化的会话状态，用于SessionStore保存
+        """
+        return {'username': self.username,
+                'xhrOriSessionId': self.xhrOriSessionId,
+                'xhrSessionId': self.xhrSessionId,
+                'cookies': [{'name': c.name, 'value': c.value, 'domain': c.domain, 'path': c.path}
+                            for c in self.session.cookies]}
+
+    def restoreSessionState(self, state: dict):
+        """
+        从exportSessionState得到的状态重建会话，代替newSession和login
+        """
+        self._createSession()
+        for cookie in state['cookies']:
+            self.session.cookies.set(cookie['name'], cookie['value'], domain=cookie['domain'], path=cookie['path'])
+        self.xhrOriSessionId = state['xhrOriSessionId']
+        self.xhrSessionId = state['xhrSessionId']
+        self.username = state['username']
+
+    def isSessionValid(self):
+        """
+        访问课表主页检查当前会话是否仍处于登录状态，未登录时教学管理系统会返回登录页
+        """
+        if not self.session:
+            return False
+        try:
+            r = self._request('GET', self.baseUrl + '/eams/courseTableForStd.action?method=stdHome',
+                              ErrorCode.CONNECTION_ERROR)
+        except MyException:
+            return False
+        return r.status_code == 200 and PageScanner.semesterId(r.content) is not None
+
+    def resumeSession(self, store: SessionStore, username: str, passwd: str):
+        """
+        尝试复用store中保存的会话
+        :return: 是否成功复用，失败时保存的会话会被删除
+        """
+        state = store.load(username, passwd)
+        if state is None:
+            return False
+        self.restoreSessionState(state)
+        if self.isSessionValid():
+            return True
+        store.discard(username)
+        self.session = None
+        return False
+
+    def ensureLogin(self, username: str, passwd: str, captchaProvider, store: SessionStore = None):
+        """
+        优先复用store中保存的会话，不可用时创建新会话并登录，登录成功后保存会话
+        :param captchaProvider: 获取验证码的函数 captchaProvider() -> str，只在需要登录时调用
+        :param store: 会话存储，None时总是登录
+        :return: 'resumed' 复用了保存的会话，'login' 重新登录
+        """
+        if store and not self.cacheOnly and self.resumeSession(store, username, passwd):
+            return 'resumed'
+        self.newSession()
+        self.login(username, passwd, '' if self.cacheOnly else captchaProvider())
+        if store and not self.cacheOnly:
+            store.save(self, passwd)
+        return 'login'
+
+    def _createSession(self):
+        """
+        创建HTTP会话对象。requests的Session不保证线程安全，每个SuesApi对象的会话只应在一个线程中使用
+        """
         # proxies = {'http': 'socks5://127.0.0.1:1085',
         #            'https': 'socks5://127.0.0.1:1085'}
         reqHeader = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; WOW64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/62.0.3202.9 Safari/537.36'
         }
+        import requests_html
         self.session = requests_html.HTMLSession()
         self.session.headers = reqHeader
         # self.session.proxies = proxies
 
-        # 测试连接
-        try:
-            self.session.get('http://jxxt.sues.edu.cn/', timeout=10)
-        except requests.exceptions.RequestException as e:  # This is the correct syntax
-            raise MyException(ErrorCode.CONNECTION_ERROR, '访问教学管理系统主页出错,请检查连接\n' + str(e))
-
-        self.xhrOriSessionId = self._getXHROriSessionID()
-        self.xhrSessionId = self._getXHRCallSessionId()
+    def _request(self, method: str, url: str, errorCode: ErrorCode, errorPrefix: str = '', retry: bool = True,
+                 **kwargs):
+        """
+        所有HTTP请求的统一入口，负责超时设置、主机并发限制、限速、重试、熔断和异常转换
+        :param method: 'GET'或'POST'
+        :param url: 请求地址
+        :param errorCode: 请求失败时抛出的MyException错误代码
+        :param errorPrefix: 请求失败时附加在详细信息前的说明
+        :param retry: 失败后是否按requestPolicy重试，重复提交有副作用的请求(如登录)应为False
+        :return: 响应对象，其它非200的状态码(如404)由调用方处理；重试后仍为429/5xx时抛出异常
+        """
+        import requests
+        kwargs.setdefault('timeout', 10)
+        policy = self.requestPolicy
+        splitUrl = urlsplit(url)
+        host = splitUrl.netloc
+        endpoint = splitUrl.path.rsplit('/', 1)[-1] or '/'
+        attempts = 1 + (policy.retries if retry else 0)
+        for attempt in range(attempts):
+            if not policy.allow(host):
+                raise MyException(errorCode, errorPrefix + '%s 连续请求失败，暂停访问%g秒' % (host, policy.breakerCooldown))
+            policy.acquire(host)
+            error = r = None
+            begin = time.perf_counter()
+            with self.hostLimiter.slot(url):
+                try:
+                    r = self.session.request(method, url, **kwargs)
+                except requests.exceptions.RequestException as e:  # This is the correct syntax
+                    error = e
+            elapsed = time.perf_counter() - begin
+            ok = error is None and r.status_code not in RequestPolicy.RETRY_STATUS
+            retrying = not ok and attempt + 1 < attempts
+            policy.record(host, elapsed, ok, retrying)
+            self.metrics.record('http_request', elapsed, endpoint=endpoint)
+            self.metrics.count('http_requests', endpoint=endpoint, status='error' if r is None else str(r.status_code))
+            if r is not None:
+                self.metrics.count('http_response_bytes', len(r.content))
+            if not retrying:
+                break
+            wait = policy.backoff(attempt)
+            retryAfter = r.headers.get('Retry-After', '') if r is not None else ''
+            if retryAfter.isdigit():
+                wait = max(wait, min(int(retryAfter), policy.backoffMax))
+            time.sleep(wait)
+        if error is not None:
+            raise MyException(errorCode, errorPrefix + str(error))
+        if r.status_code in RequestPolicy.RETRY_STATUS:
+            # 不能把服务器暂时不可用的错误页当作正常内容交给调用方(可能被解析或缓存)
+            raise MyException(errorCode, errorPrefix + '%s 返回HTTP %d，已重试%d次' % (endpoint, r.status_code, attempt))
+        return r
 
     def getCaptha(self):
         """
@@ -155,10 +1182,7 @@ class SuesApi:
         if not self.session:
             raise MyException(ErrorCode.CAPTCHA_FETCH_ERROR, 'session对象没有被建立，是否忘记调用了 SuesApi.newSession?')
 
-        try:
-            r = self.session.get('http://jxxt.sues.edu.cn/eams/captcha/image.action', timeout=10)
-        except requests.exceptions.RequestException as e:  # This is the correct syntax
-            raise MyException(ErrorCode.CAPTCHA_FETCH_ERROR, str(e))
+        r = self._request('GET', self.baseUrl + '/eams/captcha/image.action', ErrorCode.CAPTCHA_FETCH_ERROR)
 
         if r.status_code == 200:
             return r.content
@@ -172,6 +1196,9 @@ class SuesApi:
         :param passwd: 教学管理系统密码
         :param captcha: 验证码
         """
+        self.username = username
+        if self.cacheOnly:
+            return
         if not self.session:
             raise MyException(ErrorCode.LOGIN_ERROR, 'session对象没有被建立，是否忘记调用了 SuesApi.newSession?')
 
@@ -179,14 +1206,108 @@ class SuesApi:
                 'loginForm.password': passwd,
                 'encodedPassword': '',
                 'loginForm.captcha': captcha}
-        try:
-            r = self.session.post('http://jxxt.sues.edu.cn/eams/login.action', data, timeout=10)
-        except requests.exceptions.RequestException as e:  # This is the correct syntax
-            raise MyException(ErrorCode.LOGIN_ERROR, str(e))
+        # 验证码只能使用一次，登录请求不重试
+        r = self._request('POST', self.baseUrl + '/eams/login.action', ErrorCode.LOGIN_ERROR, retry=False,
+                          data=data)
 
-        errorMsg = r.html.find('ul.errorMessage>li>span', first=True)
+        errorMsg = self._extract(r.content, 'loginError', PageScanner.loginError, SuesApi._domLoginError)
         if errorMsg:
-            raise MyException(ErrorCode.LOGIN_ERROR, errorMsg.text)
+            raise MyException(ErrorCode.LOGIN_ERROR, errorMsg)
+
+    def _extract(self, content: bytes, anchor: str, scan, domFind):
+        """
+        从响应中提取一个锚点，先用PageScanner直接扫描原始字节，找不到时再回退到requests_html的DOM解析
+        使用的方式记录在self.extractPaths[anchor]中，值为'fast'或'dom'
+        :param content: 响应的原始内容
+        :param anchor: 锚点名称
+        :param scan: PageScanner中对应的扫描函数
+        :param domFind: DOM解析函数，参数为requests_html.HTML对象
+        :return: 提取结果
+        """
+        value = scan(content)
+        if value is not None:
+            self.extractPaths[anchor] = 'fast'
+            return value
+        self.extractPaths[anchor] = 'dom'
+        import requests_html
+        return domFind(requests_html.HTML(html=content))
+
+    def _cachedContent(self, endpoint: str, params: dict, ttlName: str, fetch, validate):
+        """
+        优先从缓存中读取响应内容，没有时调用fetch获取并写入缓存
+        登录失效时教学管理系统返回登录页，validate不通过的内容不写入缓存，否则在有效期内每次都会读到这个页面
+        :param endpoint: 接口名称
+        :param params: 决定响应内容的参数
+        :param ttlName: 有效期名称，见ResponseCache.DEFAULT_TTLS
+        :param fetch: 从教学管理系统获取响应内容的函数
+        :param validate: 检查响应内容是否为需要的数据的函数 validate(content) -> bool，缓存中不通过的条目视为不存在
+        :return: 响应的原始内容，从教学管理系统获取的内容没有通过validate时也原样返回，由调用方报错
+        """
+        if self.baseUrl != DEFAULT_BASE_URL:
+            # 其它地址(如MockJxxtServer)的响应与真实系统分开缓存
+            params = dict(params, baseUrl=self.baseUrl)
+        if self.cache:
+            content = self.cache.get(self.username, endpoint, params, checkExpiry=not self.cacheOnly)
+            if content is not None and validate(content):
+                return content
+        if self.cacheOnly:
+            raise MyException(ErrorCode.CACHE_MISS, '离线模式下缓存中没有%s的%s数据 %s' % (self.username, endpoint, params))
+        content = fetch()
+        if self.cache and validate(content):
+            self.cache.put(self.username, endpoint, params, ttlName, content)
+        return content
+
+    @staticmethod
+    def _checkStatus(r, errorCode: ErrorCode, what: str):
+        """
+        :param r: SuesApi._request返回的响应
+        :param what: 出错时的说明，例:'教学年'
+        """
+        if r.status_code != 200:
+            raise MyException(errorCode, '%s获取失败，返回值异常%d' % (what, r.status_code))
+
+    def _isBracketList(self, content: bytes):
+        return self.squareBracketExprRe.search(content.decode('utf-8', 'replace')) is not None
+
+    def _parseBracketList(self, content: bytes, errorCode: ErrorCode, what: str):
+        """
+        解析DWR接口返回的列表，例:dwr.engine._remoteHandleCallback('0','0',["2019-2020","2018-2019"]);
+        :return: 字符串列表
+        """
+        match = self.squareBracketExprRe.search(content.decode('utf-8', 'replace'))
+        if match is None:
+            raise MyException(errorCode, '%s获取失败，返回的不是%s列表，可能是登录已失效' % (what, what))
+        return match.group()[1:-1].replace('"', '').split(',')
+
+    @staticmethod
+    def _isCourseTablePage(content: bytes):
+        return b'TaskActivity' in content
+
+    @staticmethod
+    def _domLoginError(dom):
+        errorMsg = dom.find('ul.errorMessage>li>span', first=True)
+        return errorMsg.text if errorMsg else ''
+
+    @staticmethod
+    def _domAttr(dom, selector: str, attr: str):
+        # 页面结构不同(如登录页、错误页)时找不到元素，返回None而不是抛出AttributeError/KeyError
+        element = dom.find(selector, first=True)
+        return element.attrs.get(attr) if element is not None else None
+
+    @staticmethod
+    def _domSemesterId(dom):
+        return SuesApi._domAttr(dom, 'input[name=semester\\.id]', 'value')
+
+    @staticmethod
+    def _domCourseFrameSrc(dom):
+        return SuesApi._domAttr(dom, 'td.frameTable_content>iframe', 'src')
+
+    @staticmethod
+    def _domTaskActivityScript(dom):
+        script = dom.find('script', containing='new TaskActivity')
+        if (len(script) != 1):
+            return None
+        return script[0].html.replace('&#13;', '\r\n')
 
     def _getXHROriSessionID(self):
         """
@@ -197,10 +1318,7 @@ class SuesApi:
             raise MyException(ErrorCode.XHRSession_Error, 'session对象没有被建立，是否忘记调用了 SuesApi.newSession?')
 
         # 获取engine.js
-        try:
-            r = self.session.get('http://jxxt.sues.edu.cn/eams/dwr/engine.js', timeout=10)
-        except requests.exceptions.RequestException as e:  # This is the correct syntax
-            raise MyException(ErrorCode.XHRSession_Error, str(e))
+        r = self._request('GET', self.baseUrl + '/eams/dwr/engine.js', ErrorCode.XHRSession_Error)
 
         sessionStrBeg = r.text.find('dwr.engine._origScriptSessionId')
         sessionStrEnd = r.text.find('\n', sessionStrBeg)
@@ -225,6 +1343,12 @@ class SuesApi:
         获取教学系统允许查询的教学年
         :return: 字符串列表 例：['2019-2020']
         """
+        content = self._cachedContent('years', {}, 'years', self._fetchYears, self._isBracketList)
+        yearList = self._parseBracketList(content, ErrorCode.YEAR_FETCH_ERROR, '教学年')
+
+        return yearList
+
+    def _fetchYears(self):
         if not self.xhrSessionId or not self.session:
             raise MyException(ErrorCode.YEAR_FETCH_ERROR, 'session或xhrSessionId对象没有被建立，是否忘记调用了 SuesApi.newSession?')
 
@@ -240,16 +1364,11 @@ class SuesApi:
             'c0-param0': 'string:1',
             'batchId': '0'
         }
-        try:
-            r = self.session.post(
-                'http://jxxt.sues.edu.cn/eams/dwr/call/plaincall/semesterDao.getYearsOrderByDistance.dwr',
-                data=payload, timeout=10)
-        except requests.exceptions.RequestException as e:  # This is the correct syntax
-            raise MyException(ErrorCode.YEAR_FETCH_ERROR, str(e))
-
-        yearList = self.squareBracketExprRe.findall(r.text)[0][1:-1].replace('"', '').split(',')
-
-        return yearList
+        r = self._request('POST',
+                          self.baseUrl + '/eams/dwr/call/plaincall/semesterDao.getYearsOrderByDistance.dwr',
+                          ErrorCode.YEAR_FETCH_ERROR, data=payload)
+        self._checkStatus(r, ErrorCode.YEAR_FETCH_ERROR, '教学年')
+        return r.content
 
     def getTerms(self, yearStr: str):
         """
@@ -257,6 +1376,12 @@ class SuesApi:
         :param yearStr: self.getYears获取的年份字符串 例:'2019-2020'
         :return: 学期列表 例：['1','2']
         """
+        content = self._cachedContent('terms', {'year': yearStr}, 'terms', lambda: self._fetchTerms(yearStr),
+                                      self._isBracketList)
+        semesterList = self._parseBracketList(content, ErrorCode.TERM_FETCH_ERROR, '学期')
+        return semesterList
+
+    def _fetchTerms(self, yearStr: str):
         if not self.xhrSessionId or not self.session:
             raise MyException(ErrorCode.TERM_FETCH_ERROR, 'session或xhrSessionId对象没有被建立，是否忘记调用了 SuesApi.newSession?')
 
@@ -273,15 +1398,11 @@ class SuesApi:
             'c0-param1': 'string:' + yearStr,
             'batchId': '1'
         }
-        try:
-            r = self.session.post(
-                'http://jxxt.sues.edu.cn/eams/dwr/call/plaincall/semesterDao.getTermsOrderByDistance.dwr',
-                data=payload, timeout=10)
-        except requests.exceptions.RequestException as e:  # This is the correct syntax
-            raise MyException(ErrorCode.TERM_FETCH_ERROR, str(e))
-
-        semesterList = self.squareBracketExprRe.findall(r.text)[0][1:-1].replace('"', '').split(',')
-        return semesterList
+        r = self._request('POST',
+                          self.baseUrl + '/eams/dwr/call/plaincall/semesterDao.getTermsOrderByDistance.dwr',
+                          ErrorCode.TERM_FETCH_ERROR, data=payload)
+        self._checkStatus(r, ErrorCode.TERM_FETCH_ERROR, '学期')
+        return r.content
 
     def getCourseTable(self, yearStr: str, semester: str):
         """
@@ -290,20 +1411,64 @@ class SuesApi:
         :param semester: 学期 例:'1'
         :return: 课表年份, 教学活动起始(相对于全年),教学活动起始周(相对于第二个参数)，教学活动结束周(相对于第二个参数), CourseInfo列表 表中每一项代表教学管理系统的一个格子，相应需要创建一个日程
         """
+        # 已结束学期的课表不会再变化，可以缓存更长时间
+        with self.metrics.timer('phase', phase='fetch'):
+            content = self._cachedContent('courseTable', {'year': yearStr, 'semester': semester},
+                                          'pastCourseTable' if isPastTerm(yearStr, semester) else 'courseTable',
+                                          lambda: self._fetchCourseTable(yearStr, semester), self._isCourseTablePage)
+
+        if self.verbose:
+            print('解析、合并课程信息中...(2/2)')
+        # 解析和合并是流水线的前两步，边读取TaskActivity边合并，读取TaskActivity的耗时计入parse，其余计入merge
+        parseTime = [0.0]
+        merging = False
+        begin = time.perf_counter()
+        try:
+            rltStartYear, rltAllOccupyWeek, rltAllStartWeek, rltAllEndWeek, courseRecords = \
+                self._parseCourseTable(content)
+            parseTime[0] = time.perf_counter() - begin
+            merging = True
+            rltCouseList = list(iterMergedCourses(_timedIter(courseRecords, parseTime), rltAllOccupyWeek,
+                                                  rltAllEndWeek, self.metrics))
+        finally:
+            # 与Metrics.timer一样，出错时也记录
+            elapsed = time.perf_counter() - begin
+            if not merging:
+                parseTime[0] = elapsed
+            self.metrics.record('phase', parseTime[0], phase='parse')
+            self.metrics.record('phase', elapsed - parseTime[0], phase='merge')
+
+        return rltStartYear, rltAllOccupyWeek, rltAllStartWeek, rltAllEndWeek, rltCouseList
+
+    def _parseCourseTable(self, content: bytes):
+        """
+        从课表页面中找到课表脚本
+        :param content: 课表页面的原始内容
+        :return: 课表年份, 教学活动起始(相对于全年), 教学活动起始周, 教学活动结束周(同getCourseTable), iterCourseRecords的结果
+        """
+        # 寻找特定的一个js脚本
+        scriptStr = self._extract(content, 'taskActivityScript', PageScanner.taskActivityScript,
+                                  SuesApi._domTaskActivityScript)
+        if scriptStr is None:
+            raise MyException(ErrorCode.COURSE_FETCH_ERROR, '课表获取失败，可能是因为该时间段没有课程？请检查学期、时间的选择，如果还有问题请联系开发者。')
+        return (*scanCourseTableHeader(scriptStr), iterCourseRecords(scriptStr))
+
+    def _fetchCourseTable(self, yearStr: str, semester: str):
         if not self.session:
             raise MyException(ErrorCode.COURSE_FETCH_ERROR, 'session对象没有被建立，是否忘记调用了 SuesApi.newSession?')
 
         # get SemesterID and other stuff
-        try:
-            r = self.session.get('http://jxxt.sues.edu.cn/eams/courseTableForStd.action?method=stdHome', timeout=10)
-        except requests.exceptions.RequestException as e:  # This is the correct syntax
-            raise MyException(ErrorCode.COURSE_FETCH_ERROR, str(e))
+        r = self._request('GET', self.baseUrl + '/eams/courseTableForStd.action?method=stdHome',
+                          ErrorCode.COURSE_FETCH_ERROR)
+        self._checkStatus(r, ErrorCode.COURSE_FETCH_ERROR, '课表主页')
 
-        semesterId = r.html.find('input[name=semester\\.id]', first=True).attrs['value']
+        semesterId = self._extract(r.content, 'semesterId', PageScanner.semesterId, SuesApi._domSemesterId)
         # what if the webpage changed?
-        courseRequestUrl = 'http://jxxt.sues.edu.cn/eams/' + \
-                           r.html.find('td.frameTable_content>iframe', first=True).attrs[
-                               'src']
+        courseFrameSrc = self._extract(r.content, 'courseFrameSrc', PageScanner.courseFrameSrc,
+                                       SuesApi._domCourseFrameSrc)
+        if semesterId is None or courseFrameSrc is None:
+            raise MyException(ErrorCode.COURSE_FETCH_ERROR, '课表主页中没有找到学期和课表地址，可能是登录已失效或教学管理系统暂时不可用')
+        courseRequestUrl = self.baseUrl + '/eams/' + courseFrameSrc
         payload = {
             'ignoreHead': '1',
             'semester.id': 'semesterId',
@@ -313,102 +1478,893 @@ class SuesApi:
             'startWeek': '1'
         }
 
-        print('获取课程信息中...(1/3)')
+        if self.verbose:
+            print('获取课程信息中...(1/2)')
+        r = self._request('POST', courseRequestUrl, ErrorCode.COURSE_FETCH_ERROR, data=payload)
+        self._checkStatus(r, ErrorCode.COURSE_FETCH_ERROR, '课表')
+        return r.content
+
+
+class AsyncSuesApi:
+    """
+    SuesApi的asyncio版本，方法与SuesApi一一对应，但都需要await。互不依赖的请求会同时发出：
+    newSession在访问主页后同时获取engine.js和验证码，getYears返回后在后台预取每个教学年的学期列表
+    requests的Session不保证线程安全，每个同时进行的请求使用连接池中自己的SuesApi(各有一个keep-alive的HTTP会话)，
+    在线程池中执行；cookie、XHRSessionID和学号保存在self.api中，取出时复制给工作对象，请求结束后把新的cookie合并回来
+    """
+
+    def __init__(self, poolSize: int = 4, **apiOptions):
+        """
+        :param poolSize: 连接池大小，也是同时进行的请求数
+        :param apiOptions: 传给SuesApi的参数(hostLimiter、verbose、cache、requestPolicy、baseUrl等)
+        """
+        import asyncio
+        self.api = SuesApi(**apiOptions)
+        self.poolSize = poolSize
+        self._executor = ThreadPoolExecutor(max_workers=poolSize, thread_name_prefix='sues-async')
+        self._slots = asyncio.Semaphore(poolSize)
+        self._idle = []  # 空闲的工作SuesApi
+        self._captchaTask = None
+        self._termTasks = {}
+
+    def _newWorker(self):
+        api = self.api
+        worker = SuesApi(api.hostLimiter, api.verbose, api.cache, api.cacheOnly, api.requestPolicy, api.baseUrl,
+                         api.metrics)
+        worker._createSession()
+        return worker
+
+    async def _call(self, func, *args):
+        """
+        取出一个空闲的工作SuesApi，在线程池中执行func(worker, *args)
+        cookie只在事件循环所在的线程中复制和合并，工作对象同一时间只被一个线程使用
+        """
+        import asyncio
+        async with self._slots:
+            worker = self._idle.pop() if self._idle else self._newWorker()
+            worker.username = self.api.username
+            worker.xhrOriSessionId = self.api.xhrOriSessionId
+            worker.xhrSessionId = self.api.xhrSessionId
+            worker.session.cookies.clear()
+            if self.api.session is not None:
+                worker.session.cookies.update(self.api.session.cookies)
+            try:
+                return await asyncio.get_running_loop().run_in_executor(self._executor, func, worker, *args)
+            finally:
+                if self.api.session is not None:
+                    self.api.session.cookies.update(worker.session.cookies)
+                self.api.extractPaths.update(worker.extractPaths)
+                self._idle.append(worker)
+
+    async def _awaitPrefetch(self):
+        """
+        等待并丢弃没有被使用的预取请求，预取失败的异常不再抛出
+        """
+        import asyncio
+        pending = [task for task in [self._captchaTask, *self._termTasks.values()] if task]
+        self._captchaTask = None
+        self._termTasks = {}
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    async def newSession(self):
+        """
+        创建新会话，本方法必须在所有函数之前调用
+        """
+        import asyncio
+        await self._awaitPrefetch()
+        if self.api.cacheOnly:
+            return
+        self.api._createSession()
+
+        # 测试连接，主页设置的cookie是后续请求的前提
+        await self._call(lambda api: api._request('GET', api.baseUrl + '/', ErrorCode.CONNECTION_ERROR,
+                                                  '访问教学管理系统主页出错,请检查连接\n'))
+
+        # engine.js和验证码互不依赖，同时获取
+        self._captchaTask = asyncio.ensure_future(self._call(SuesApi.getCaptha))
+        self.api.xhrOriSessionId = await self._call(SuesApi._getXHROriSessionID)
+        self.api.xhrSessionId = self.api._getXHRCallSessionId()
+
+    async def getCaptha(self):
+        """
+        获取验证码，newSession之后第一次调用时返回预取的验证码
+        :return: 验证码图像(bytearray)）
+        """
+        captchaTask, self._captchaTask = self._captchaTask, None
+        if captchaTask:
+            return await captchaTask
+        return await self._call(SuesApi.getCaptha)
+
+    async def login(self, username: str, passwd: str, captcha: str):
+        """
+        登录，参数同SuesApi.login
+        """
+        import asyncio
+        if self._captchaTask:
+            # 预取的验证码没有被使用，等它完成，以免服务器在登录之后才生成新的验证码
+            await asyncio.gather(self._captchaTask, return_exceptions=True)
+            self._captchaTask = None
+        await self._call(SuesApi.login, username, passwd, captcha)
+        self.api.username = username
+
+    async def getYears(self):
+        """
+        获取教学系统允许查询的教学年，同时在后台预取每个教学年的学期列表
+        :return: 字符串列表 例：['2019-2020']
+        """
+        import asyncio
+        yearList = await self._call(SuesApi.getYears)
+        for yearStr in yearList:
+            if yearStr not in self._termTasks:
+                self._termTasks[yearStr] = asyncio.ensure_future(self._call(SuesApi.getTerms, yearStr))
+        return yearList
+
+    async def getTerms(self, yearStr: str):
+        """
+        获取当前教学年对应的学期选项，优先使用getYears预取的结果
+        :param yearStr: self.getYears获取的年份字符串 例:'2019-2020'
+        :return: 学期列表 例：['1','2']
+        """
+        termTask = self._termTasks.pop(yearStr, None)
+        if termTask:
+            return await termTask
+        return await self._call(SuesApi.getTerms, yearStr)
+
+    async def getCourseTable(self, yearStr: str, semester: str):
+        """
+        获取课程列表，参数与返回值同SuesApi.getCourseTable
+        """
+        return await self._call(SuesApi.getCourseTable, yearStr, semester)
+
+    async def close(self):
+        """
+        等待未完成的预取请求，关闭所有会话和线程池
+        """
+        await self._awaitPrefetch()
+        for worker in self._idle:
+            worker.session.close()
+        self._idle = []
+        if self.api.session:
+            self.api.session.close()
+        self._executor.shutdown(wait=False)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, excType, excValue, traceback):
+        await self.close()
+
+
+class EventExporter:
+    """
+    日程导出的基类：把iterCourseEvents产生的CalendarEvent逐个序列化后立即写出，内存占用与日程数无关
+    输出可以是文件名，也可以是任何可写的二进制流(如sys.stdout.buffer、socket.makefile('wb'))，流在close时只刷新不关闭
+    子类实现serialize，需要时覆盖HEADER和FOOTER
+    """
+    EXTENSION = ''  # 默认文件名的扩展名
+    HEADER = b''
+    FOOTER = b''
+    CACHEABLE = True  # serialize的结果只取决于日程本身，可以由EventCache缓存
+
+    def __init__(self, output, bufferSize: int = 64 * 1024):
+        """
+        :param output: 文件名或可写的二进制流
+        :param bufferSize: 输出为文件名时的写缓冲大小
+        """
+        self._ownsFile = isinstance(output, str)
+        self.file = open(output, 'wb', buffering=bufferSize) if self._ownsFile else output
+        self.eventCount = 0
+        self.bytesWritten = 0
+        self.closed = False
+        self._write(self.HEADER)
+
+    def _write(self, data: bytes):
+        self.file.write(data)
+        self.bytesWritten += len(data)
+
+    def serialize(self, event):
+        """
+        :param event: CalendarEvent对象
+        :return: 该日程序列化后的内容
+        """
+        raise NotImplementedError
+
+    def writeEvent(self, event):
+        """
+        写出一个日程
+        :param event: CalendarEvent对象
+        """
+        self._write(self.serialize(event))
+        self.eventCount += 1
+
+    def writeSerialized(self, data: bytes, eventCount: int):
+        """
+        一次写出若干个已经序列化的日程，见writeOccurrences
+        :param data: 与serialize的结果格式相同的内容
+        :param eventCount: data中的日程数
+        """
+        self._write(data)
+        self.eventCount += eventCount
+
+    def close(self):
+        """
+        写出结尾并关闭文件(输出为流时只刷新)，重复调用无副作用
+        """
+        if self.closed:
+            return
+        self.closed = True
+        self._write(self.FOOTER)
+        if self._ownsFile:
+            self.file.close()
+        else:
+            self.file.flush()
+
+    def abort(self):
+        """
+        生成日程出错时调用，已写出的日程仍组成一个完整的文件
+        """
+        self.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+
+class IcsStreamWriter(EventExporter):
+    """
+    流式写出.ics文件：日历头只写一次，每个日程生成后立即通过带缓冲的文件句柄写出，最后写一次日历尾
+    输出内容与 Calendar.to_ical() 完全一致，但不需要在内存中保留整个日历，也不会反复重写文件
+    """
+    EXTENSION = '.ics'
+    CALENDAR_HEADER = HEADER = b'BEGIN:VCALENDAR\r\n'
+    CALENDAR_FOOTER = FOOTER = b'END:VCALENDAR\r\n'
+
+    def serialize(self, event):
+        return event.toIcal().to_ical()
+
+    def writeComponent(self, component):
+        """
+        写出一个日历组件(VEVENT及其包含的VALARM)
+        :param component: icalendar组件对象
+        """
+        self._write(component.to_ical())
+        self.eventCount += 1
+
+
+class IcsMemoryWriter(IcsStreamWriter):
+    """
+    在内存中生成.ics内容，接口与IcsStreamWriter相同，关闭后内容保存在self.content中
+    """
+
+    def __init__(self):
+        from io import BytesIO
+        super().__init__(BytesIO())
+        self.content = None
+
+    def close(self):
+        if not self.closed:
+            super().close()
+            self.content = self.file.getvalue()
+
+
+def _jcalDateTime(value: datetime):
+    # 带时区的时间转换为UTC，与icalendar写出ics时一样不带时区的时间原样输出
+    if value.tzinfo is not None:
+        from datetime import timezone
+        return value.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+    return value.strftime('%Y-%m-%dT%H:%M:%S')
+
+
+class JCalExporter(EventExporter):
+    """
+    写出jCal(RFC 7265，iCalendar的JSON表示)，内容与ics相同，整个文件是一个JSON数组
+    """
+    EXTENSION = '.jcal'
+    HEADER = b'["vcalendar",[],['
+    FOOTER = b']]\n'
+    CACHEABLE = False  # 除第一个外每个日程前有逗号
+
+    def serialize(self, event):
+        properties = [['uid', {}, 'text', event.uid],
+                      ['summary', {}, 'text', event.summary],
+                      ['dtstart', {}, 'date-time', _jcalDateTime(event.dtstart)],
+                      ['dtend', {}, 'date-time', _jcalDateTime(event.dtend)],
+                      ['location', {}, 'text', event.location]]
+        recur = {key: _jcalDateTime(value) if key == 'until' else value.upper() if key == 'freq' else value
+                 for key, value in event.rrule.items()}
+        properties.append(['rrule', {}, 'recur', recur])
+        if event.exdates:
+            properties.append(['exdate', {}, 'date-time', *map(_jcalDateTime, event.exdates)])
+        alarm = ['valarm', [['action', {}, 'text', 'DISPLAY'],
+                            ['description', {}, 'text', event.alarmDescription],
+                            ['trigger', {}, 'duration', event.alarmDuration()]], []]
+        component = json.dumps(['vevent', properties, [alarm]], ensure_ascii=False, separators=(',', ':'))
+        return (',' if self.eventCount else '').encode('utf-8') + component.encode('utf-8')
+
+
+class CsvExporter(EventExporter):
+    """
+    写出CSV，每个日程一行，重复规则为RRULE文本，便于导入表格软件
+    """
+    EXTENSION = '.csv'
+    COLUMNS = ('uid', 'summary', 'location', 'start', 'end', 'rrule', 'exdates', 'alarmMinutes')
+
+    def __init__(self, output, bufferSize: int = 64 * 1024):
+        from io import StringIO
+        self._row = StringIO()
+        self._csvWriter = csv.writer(self._row)
+        super().__init__(output, bufferSize)
+        self._write(self._format(self.COLUMNS))
+
+    def _format(self, row):
+        self._row.seek(0)
+        self._row.truncate()
+        self._csvWriter.writerow(row)
+        return self._row.getvalue().encode('utf-8')
+
+    def serialize(self, event):
+        return self._format(event.toRecord().values())
+
+
+class JsonLinesExporter(EventExporter):
+    """
+    写出JSON Lines，每个日程一行JSON对象，字段同CsvExporter
+    """
+    EXTENSION = '.jsonl'
+
+    def serialize(self, event):
+        return (json.dumps(event.toRecord(), ensure_ascii=False) + '\n').encode('utf-8')
+
+
+# 支持的导出格式 -> 导出类
+EXPORTERS = {'ics': IcsStreamWriter, 'jcal': JCalExporter, 'csv': CsvExporter, 'json': JsonLinesExporter}
+
+
+class EventCache:
+    """
+    日程片段的内存缓存：一个课程格子生成的所有日程序列化后的内容，以格子内容和生成选项的哈希为键
+    同一个班级的学生大多有完全相同的课程格子，批量导出时每个格子只在第一次创建icalendar对象并序列化，
+    之后直接拼接缓存的内容。条目数超过上限时淘汰最久没有使用的条目，可以在多个线程中共享
+    """
+
+    def __init__(self, maxEntries: int = 4096, metrics: Metrics = None):
+        """
+        :param maxEntries: 缓存的课程格子数上限
+        :param metrics: 记录命中(event_cache_requests{result="hit"})、未命中和淘汰次数的Metrics对象，None时使用defaultMetrics
+        """
+        self.maxEntries = maxEntries
+        self.metrics = metrics or defaultMetrics
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # 键 -> (序列化的内容, 日程数)，最近使用的在最后
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(block, options: tuple):
+        """
+        :param block: CourseInfo或CourseSlice
+        :param options: 影响生成结果的其它选项，如课表年份、提醒时间、导出格式
+        :return: 缓存键
+        """
+        content = repr((block.courseId, block.courseName, block.teacherId, block.teacherName, block.roomId,
+                        block.roomName, block.weeks.bits, block.weeks.length, block.day, tuple(block.courses), options))
+        return hashlib.blake2b(content.encode('utf-8'), digest_size=16).digest()
+
+    def get(self, key: bytes):
+        """
+        :return: (序列化的内容, 日程数)，没有时返回None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._entries.move_to_end(key)
+        self.metrics.count('event_cache_requests', result='miss' if entry is None else 'hit')
+        return entry
+
+    def put(self, key: bytes, data: bytes, eventCount: int):
+        evicted = 0
+        with self._lock:
+            self._entries[key] = (data, eventCount)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxEntries:
+                self._entries.popitem(last=False)
+                evicted += 1
+            self.evictions += evicted
+        if evicted:
+            self.metrics.count('event_cache_evictions', evicted)
+
+    def stats(self):
+        """
+        :return: 统计信息字典
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'entries': len(self._entries), 'hitRate': self.hits / lookups if lookups else 0.0}
+
+
+class IcsDiff:
+    """
+    增量导出时本次与上次导出的.ics文件之间的差异
+    """
+
+    def __init__(self):
+        self.added = []  # 新增日程的UID
+        self.changed = []  # 内容变化的日程的UID
+        self.removed = []  # 本次被取消的日程的UID
+        self.unchanged = 0  # 没有变化的日程数
+        self.written = False  # 是否重写了文件
+
+    def hasChanges(self):
+        return bool(self.added or self.changed or self.removed)
+
+    def toDict(self):
+        return {'added': self.added, 'changed': self.changed, 'removed': self.removed, 'unchanged': self.unchanged,
+                'written': self.written}
+
+    def __str__(self):
+        return '新增%d个日程，修改%d个日程，取消%d个日程，%d个日程未变化' % (
+            len(self.added), len(self.changed), len(self.removed), self.unchanged)
+
+
+class IncrementalIcsWriter:
+    """
+    增量写出.ics文件，接口与IcsStreamWriter相同，只能输出到文件
+    按UID和内容哈希与上次导出的文件比较：未变化的日程原样保留，变化的日程SEQUENCE加1，
+    上次有而本次没有的日程以STATUS:CANCELLED保留，所有日程都没有变化时不重写文件
+    差异记录在self.diff中
+    """
+    CALENDAR_HEADER = IcsStreamWriter.CALENDAR_HEADER
+    CALENDAR_FOOTER = IcsStreamWriter.CALENDAR_FOOTER
+    EVENT_BEGIN = b'BEGIN:VEVENT\r\n'
+
+    def __init__(self, icsFileName: str):
+        """
+        :param icsFileName: ics文件的名称，文件不存在时相当于全部日程都是新增的
+        """
+        self.icsFileName = icsFileName
+        self.previous = self._loadPrevious(icsFileName)  # UID -> (日程内容, SEQUENCE, 内容哈希, 是否已取消)
+        self.blocks = []
+        self.seenUids = set()
+        self.eventCount = 0
+        self.diff = IcsDiff()
+        self.closed = False
+        self.bytesWritten = 0  # 没有变化、不重写文件时为0
+
+    @staticmethod
+    def _contentHash(block: bytes):
+        # SEQUENCE和STATUS由本类维护，不属于日程内容
+        return hashlib.sha1(IncrementalIcsWriter._stripStateProps(block)).hexdigest()
+
+    @staticmethod
+    def _loadPrevious(icsFileName: str):
+        previous = {}
         try:
-            r = self.session.post(courseRequestUrl, data=payload, timeout=10)
-        except requests.exceptions.RequestException as e:  # This is the correct syntax
-            raise MyException(ErrorCode.COURSE_FETCH_ERROR, str(e))
+            with open(icsFileName, 'rb') as f:
+                content = f.read()
+        except FileNotFoundError:
+            return previous
+
+        blockBeg = content.find(IncrementalIcsWriter.EVENT_BEGIN)
+        while blockBeg >= 0:
+            blockEnd = content.find(b'END:VEVENT\r\n', blockBeg)
+            if blockEnd < 0:
+                break
+            blockEnd += len(b'END:VEVENT\r\n')
+            block = content[blockBeg:blockEnd]
+            # 展开折行后读取UID、SEQUENCE和STATUS
+            props = {}
+            for line in block.replace(b'\r\n ', b'').split(b'\r\n'):
+                name, _, value = line.partition(b':')
+                props.setdefault(name, value)
+            uid = props.get(b'UID', b'').decode('utf-8')
+            sequence = int(props.get(b'SEQUENCE', b'0') or 0)
+            previous[uid] = (block, sequence, IncrementalIcsWriter._contentHash(block),
+                             props.get(b'STATUS') == b'CANCELLED')
+            blockBeg = content.find(IncrementalIcsWriter.EVENT_BEGIN, blockEnd)
+        return previous
+
+    def _withProps(self, block: bytes, props: bytes):
+        return self.EVENT_BEGIN + props + block[len(self.EVENT_BEGIN):]
+
+    def writeEvent(self, event):
+        """
+        写出一个日程
+        :param event: CalendarEvent对象
+        """
+        self.writeComponent(event.toIcal())
 
-        print('解析课程信息中...(2/3)')
-        # 寻找特定的一个js脚本
-        script = r.html.find('script', containing='new TaskActivity')
-        if (len(script) != 1):
-            raise MyException(ErrorCode.COURSE_FETCH_ERROR, '课表获取失败，可能是因为该时间段没有课程？请检查学期、时间的选择，如果还有问题请联系开发者。')
-        script = script[0]
-        scriptStr = script.html.replace('&#13;', '\r\n')
-
-        rltStartYear = None  # 返回的起始年份
-        rltCouseList = []  # 返回的课程列表，
-        rltAllOccupyWeek = None  # 教学活动起始周
-        rltAllStartWeek = None  # 课表相对起始周 从1开始，一般都为1
-        rltAllEndWeek = None  # 返回的结束周 从1开始
-        # 逐行解析js脚本，获取其中的课程信息
-
-        unMergedCouseList = []  # 未合并的课程列表，
-        unMergedCourseDict = {}
-        # 提取并补充设置所有课程信息的上课星期、上课时间
-        for line in scriptStr.splitlines():
-            if (self.activityMatchRe.match(line)):
-                # 新课程
-                curCourse = CourseInfo(*(i[1:-1] for i in self.activityExtractRe.findall(line)))
-                unMergedCouseList.append(curCourse)
-            elif (self.indexMatchRe.match(line)):
-                # 当前课程的节次信息
-                line = line.replace(' ', '')
-                beg = line.find('=') + 1
-                line = line[beg:-1]
-
-                day, course = line.replace('index =', '').split('*unitCount+')
-                unMergedCouseList[-1].day = day
-                unMergedCouseList[-1].courses.append(course)
-            elif (self.marshallMatchRe.match(line)):
-                # 起始周信息
-                rltAllOccupyWeek, rltAllStartWeek, rltAllEndWeek = self.timeExtractRe.findall(line)[0][1:-1].split(',')
-            elif (self.yearMatchRe.match(line)):
-                # 当前年份信息
-                rltStartYear, _ = self.timeExtractRe.findall(line)[0][1:-1].split(',')
-
-        print('合并课程信息中...(3/3)')
-
-        # 这里需要注意，如果当前validweek放不下js会新建一个课程信息对象把validweek补到前面去
-        # 这个课程信息对象需要特殊处理，否则日期会摆放不正确（这里和jxxt网上处理有一定差异！）
-        # 因此如果发现这种情况需要特殊处理,如果碰到两个课程信息只有validweeks不同就需要进行合并这两个validweeks
-        # 进行课程信息合并
-        for curCourse in unMergedCouseList:
-            needMergeIndicator = 53 - (int(rltAllOccupyWeek) - 1) - int(
-                rltAllEndWeek)  # 表示在当前validweeks字符串中还缺多少位，这个值<0表示需要与其他项合并
-
-            if ('1' in curCourse.validweeks[0:int(rltAllOccupyWeek) - 1] and curCourse.validweeks[0] == '0'):
-                # 特殊情况，这种情况下前面有1但是第一位是0，这表示当前周次需要转换后才能输出(前面补52个0)
-                curCourse.validweeks = (53 - 1) * '0' + curCourse.validweeks
-
-            if curCourse.courseId not in unMergedCourseDict:
-                unMergedCourseDict[curCourse.courseId] = [curCourse]
+    def writeComponent(self, component):
+        """
+        写出一个日历组件(VEVENT及其包含的VALARM)
+        :param component: icalendar组件对象
+        """
+        uid = str(component['uid'])
+        block = component.to_ical()
+        self.seenUids.add(uid)
+        self.eventCount += 1
+
+        previous = self.previous.get(uid)
+        if previous is None:
+            self.diff.added.append(uid)
+        elif previous[3] or previous[2] != self._contentHash(block):
+            # 内容有变化或重新出现的已取消日程，SEQUENCE加1使订阅的客户端更新
+            self.diff.changed.append(uid)
+            block = self._withProps(block, b'SEQUENCE:%d\r\n' % (previous[1] + 1))
+        else:
+            self.diff.unchanged += 1
+            block = previous[0]
+        self.blocks.append(block)
+
+    def close(self):
+        """
+        补充被取消的日程，有变化时写出文件，重复调用无副作用
+        """
+        if self.closed:
+            return
+        self.closed = True
+
+        for uid, (block, sequence, _, cancelled) in self.previous.items():
+            if uid in self.seenUids:
+                continue
+            if cancelled:
+                # 以前就已取消的日程原样保留
+                self.blocks.append(block)
+                continue
+            self.diff.removed.append(uid)
+            self.blocks.append(self._withProps(self._stripStateProps(block),
+                                               b'SEQUENCE:%d\r\nSTATUS:CANCELLED\r\n' % (sequence + 1)))
+
+        if not self.diff.hasChanges() and os.path.exists(self.icsFileName):
+            return
+        tmpFileName = self.icsFileName + '.tmp'
+        with open(tmpFileName, 'wb', buffering=64 * 1024) as f:
+            self.bytesWritten = f.write(self.CALENDAR_HEADER)
+            for block in self.blocks:
+                self.bytesWritten += f.write(block)
+            self.bytesWritten += f.write(self.CALENDAR_FOOTER)
+        os.replace(tmpFileName, self.icsFileName)
+        self.diff.written = True
+
+    @staticmethod
+    def _stripStateProps(block: bytes):
+        return b''.join(line for line in block.splitlines(keepends=True)
+                        if not line.startswith(b'SEQUENCE:') and not line.startswith(b'STATUS:'))
+
+    def abort(self):
+        """
+        生成日程出错时调用，保留上次导出的文件不变
+        """
+        self.closed = True
+
+
+class CalendarEvent(namedtuple('CalendarEvent', ['uid', 'summary', 'dtstart', 'dtend', 'location', 'rrule', 'exdates',
+                                                 'alarmDescription', 'alarmTrigger'])):
+    """
+    iterCourseEvents产生的一个日程，与具体的导出格式无关
+    rrule为icalendar的重复规则字典(展开后的单次日程为None)，exdates为排除的上课时间，alarmTrigger为提醒相对上课时间的偏移(负数)
+    """
+    __slots__ = ()
+
+    def toIcal(self):
+        """
+        :return: icalendar的Event对象(包含VALARM)
+        """
+        from icalendar import Event, Alarm
+        event = Event()
+        event.add('uid', self.uid)
+        event.add('summary', self.summary)
+        event.add('dtstart', self.dtstart)
+        event.add('dtend', self.dtend)
+        event.add('location', self.location)
+        if self.rrule:
+            event.add('rrule', self.rrule)
+        if self.exdates:
+            event.add('exdate', list(self.exdates))
+
+        eventAlarm = Alarm()
+        eventAlarm.add('action', 'display')
+        eventAlarm.add('description', self.alarmDescription)
+        eventAlarm.add('trigger', self.alarmTrigger)
+
+        event.add_component(eventAlarm)
+        return event
+
+    def rruleText(self):
+        """
+        :return: RFC 5545格式的重复规则，例:'FREQ=WEEKLY;UNTIL=20191229T100000'，不重复时为空字符串
+        """
+        if not self.rrule:
+            return ''
+        from icalendar import vRecur
+        return vRecur(self.rrule).to_ical().decode('utf-8')
+
+    def alarmDuration(self):
+        """
+        :return: RFC 5545格式的提醒偏移，例:'-PT15M'
+        """
+        from icalendar import vDuration
+        return vDuration(self.alarmTrigger).to_ical().decode('utf-8')
+
+    def toRecord(self):
+        """
+        :return: CsvExporter和JsonLinesExporter使用的扁平字典
+        """
+        return {'uid': self.uid, 'summary': self.summary, 'location': self.location,
+                'start': self.dtstart.isoformat(), 'end': self.dtend.isoformat(), 'rrule': self.rruleText(),
+                'exdates': ' '.join(exdate.isoformat() for exdate in self.exdates),
+                'alarmMinutes': int(-self.alarmTrigger.total_seconds() // 60)}
+
+
+def iterCourseBlocks(courseList, splitCourse: bool):
+    """
+    流水线第三步：按照用户的选择切分整块的课程
+    :param courseList: CourseInfo的可迭代对象
+    :param splitCourse: 是否将横跨的课程按照1-4节 5-8节 9-14节切分
+    :return: 依次产生CourseInfo或CourseSlice
+    """
+    if not splitCourse:
+        yield from courseList
+        return
+    for curCourse in courseList:
+        buckets = ([], [], [])  # 1-4节 5-8节 9-14节
+        for i in curCourse.courses:
+            if i <= 3:
+                buckets[0].append(i)
+            elif 4 <= i <= 7:
+                buckets[1].append(i)
             else:
-                merged = False
-                if needMergeIndicator < 0:
-                    # 说明需要curCourse和其他项合并周次才完整
-                    for existCIndex, existingCourse in enumerate(unMergedCourseDict[curCourse.courseId]):
-                        if existingCourse.canMergeValidWeek(curCourse):
-                            # print('Merge', curCourse.courseName, existingCourse.validweeks, '+', curCourse.validweeks)
-
-                            # 判断一下Merge先后顺序
-                            if '1' in curCourse.validweeks[0:int(rltAllOccupyWeek) - 1]:
-                                merged = True
-                                existingCourse.mergeValidWeek(curCourse.validweeks)
-                                unMergedCourseDict[curCourse.courseId][existCIndex] = existingCourse
-                                break
-                            elif '1' in existingCourse.validweeks[0:int(rltAllOccupyWeek) - 1]:
-                                merged = True
-                                curCourse.mergeValidWeek(existingCourse.validweeks)
-                                unMergedCourseDict[curCourse.courseId][existCIndex] = curCourse
-                                break
-                            else:
-                                raise MyException(ErrorCode.API_CHANGED,
-                                                  'API有改变，无法合并课程' + curCourse.courseName + ',请联系作者！')
-                if not merged:
-                    unMergedCourseDict[curCourse.courseId].append(curCourse)
-
-        for curCourseList in unMergedCourseDict.values():
-            rltCouseList.extend(curCourseList)
+                buckets[2].append(i)
+        for bucket in buckets:
+            if bucket:
+                yield CourseSlice(curCourse, tuple(bucket))
 
-        return rltStartYear, rltAllOccupyWeek, rltAllStartWeek, rltAllEndWeek, rltCouseList
+
+def _blockClock(curCourse, courseTimes: list, modifyDEFTime: bool):
+    """
+    :param courseTimes: 按slotSortKey排序后的上课节次
+    :return: 上课时间, 下课时间(相对当天0点的timedelta), 是否按D E F楼的时间调整
+    """
+    begTime = courseTimes[0]  # 当前课程开课当天的上课时间
+    endTime = courseTimes[-1]  # 当前课程开课当天的下课时间
+    if modifyDEFTime and curCourse.roomName[0] in ['D', 'E', 'F'] and begTime in [2, 3] and endTime in [2, 3]:
+        return DEFslotTimes[begTime][0], DEFslotTimes[endTime][-1], True  # D、E、F楼上下课时间
+    return slotTimes[begTime][0], slotTimes[endTime][-1], False
+
+
+def iterCourseEvents(courseBlocks, allOccupyWeek: str, firstWeekTime: datetime, alarmTime: int,
+                     modifyDEFTime: bool, compactRRule: bool = False, eventLog: list = None):
+    """
+    流水线第四步：为每个课程格子的每段上课周创建日程
+    :param courseBlocks: iterCourseBlocks的结果
+    :param firstWeekTime: 第一周周日的0点
+    :param compactRRule: 是否按WeekSet.recurrences合并不连续的上课周
+    :param eventLog: 不为None时把每个日程的信息追加到其中，由调用方一次输出
+    :return: 依次产生CalendarEvent
+    """
+    weekOffset = int(allOccupyWeek) - 1
+    alarmTrigger = timedelta(minutes=-abs(alarmTime))
+
+    for curCourse in courseBlocks:
+        courseTimes = sorted(curCourse.courses, key=slotSortKey)  # 排序，找到对应的上课下课时间
+        begTime, endTime, timeModified = _blockClock(curCourse, courseTimes, modifyDEFTime)
+
+        # 第一周中该课程所在当天的0点
+        firstDay = firstWeekTime + timedelta(days=(curCourse.day + 1) % 7)
+
+        # 遍历开课时间段，每个开课时间段（周次）对应课程表上的一个格子，创建一个日程
+        # 压缩时间隔为1且没有排除周的时间段仍与不压缩时完全相同
+        if compactRRule:
+            recurrences = curCourse.weeks.recurrences()
+        else:
+            recurrences = ((runBeg, runEnd - 1, 1, ()) for runBeg, runEnd in curCourse.weeks.runs())
+        for ruleBeg, ruleEnd, step, holes in recurrences:
+            curCourseBegWeek = ruleBeg - weekOffset  # 当前课程第一次开课周次 从0计数
+            curCourseEndWeek = ruleEnd - weekOffset  # 当前课程最后第一次开课周次  从0计数
+
+            # 整合上面运算得到的上下课时间
+            begDay = firstDay + ONE_WEEK * curCourseBegWeek
+            startDayFrom = begDay + begTime
+            startDayTo = begDay + endTime
+            untilDay = firstDay + ONE_WEEK * curCourseEndWeek + endTime
+
+            # 调试信息输出
+            if eventLog is not None:
+                weekDesc = '%d-%d周' % (int(curCourseBegWeek) + 1, int(curCourseEndWeek) + 1)
+                if step > 1:
+                    weekDesc += '(每%d周)' % step
+                if holes:
+                    weekDesc += '(除第%s周)' % ','.join(str(week - weekOffset + 1) for week in holes)
+                eventLog.append('正在添加日程： %23s\t%23s\t%s\t星期%d %d-%d节\t%s%s\n' % (
+                    curCourse.courseName,
+                    curCourse.teacherName,
+                    weekDesc,
+                    curCourse.day + 1,
+                    courseTimes[0] + 1,
+                    courseTimes[-1] + 1,
+                    curCourse.roomName,
+                    '\tDEF楼 3 4节时间调整' if timeModified else '\t'))
+
+            if step == 1 and not holes:
+                rrule = {'freq': 'weekly', 'until': untilDay}  # 每周重复，直到停止
+            else:
+                # 每step周重复，共count次(包括被排除的周)
+                rrule = {'freq': 'weekly', 'count': (ruleEnd - ruleBeg) // step + 1}
+                if step > 1:
+                    rrule['interval'] = step
+
+            # 必须保证UID在本日历内唯一，否则某些日历不能导入
+            yield CalendarEvent(
+                curCourse.courseId + curCourse.roomId + str(curCourse.day) + str(curCourseBegWeek) +
+                str(curCourseEndWeek) + str(courseTimes[0]) + str(courseTimes[-1]),
+                curCourse.courseName + ' ' + curCourse.teacherName,
+                startDayFrom,
+                startDayTo,
+                curCourse.roomName,
+                rrule,
+                tuple(startDayFrom + ONE_WEEK * (week - ruleBeg) for week in holes),
+                curCourse.courseName + ' ' + curCourse.roomName,
+                alarmTrigger)
+
+
+def _firstWeekTime(startYear: str, allOccupyWeek: str):
+    """
+    :return: 第一周周日的0点
+    """
+    # 自动识别第一周的日期（第一天从周日开始）
+
+    # 下面日期中周日是第一天，从0计数，而curCourse.day认为周一是第一天需要-1
+
+    # 特殊年份在python中第0周和第1周相同,需往后顺延一周才能得到正确日期
+    offset = 0
+    if datetime.strptime(startYear + '-01-01', "%Y-%m-%d") \
+            .replace(tzinfo=beijingTz()).weekday() == 6:
+        offset = 1
+
+    return datetime.strptime(''.join([str(startYear), '-W', str(int(allOccupyWeek) - 1 + offset), '-0']),
+                             "%Y-W%U-%w") \
+        .replace(tzinfo=beijingTz())
+
+
+class Occurrences(namedtuple('Occurrences', ['blocks', 'tableBlocks', 'firstWeekTimes', 'blockIndex', 'starts',
+                                             'ends'])):
+    """
+    expandOccurrences的结果
+    blocks为所有课表切分后的课程格子，tableBlocks[i]为第i个课表的格子在blocks中的范围(起, 止)，
+    firstWeekTimes[i]为第i个课表第一周周日的0点；blockIndex、starts、ends为每次上课所属的格子和上下课时间(NumPy数组)，
+    按格子和周次排序，时间为不带时区的datetime64[s]，时区同firstWeekTimes
+    """
+    __slots__ = ()
+
+    def __len__(self):
+        return len(self.blockIndex)
+
+
+def expandOccurrences(courseTables, modifyDEFTime: bool = False, splitCourse: bool = False):
+    """
+    计算所有课表中每次上课的上下课时间，不依赖日历客户端计算RRULE
+    每个课程格子先算出第一周的上课时间，再用NumPy把所有格子的周次位掩码一起展开，一次得到全部上课时间，
+    多个学年、整个班级的课表也只需要一次向量运算
+    :param courseTables: 与SuesApi.getCourseTable的返回值相同的元组的列表
+    :param modifyDEFTime: 是否修正DEF楼课程第三节和第四节的时间
+    :param splitCourse: 是否将横跨的课程按照1-4节 5-8节 9-14节切分
+    :return: Occurrences
+    """
+    import numpy as np
+    blocks, tableBlocks, firstWeekTimes = [], [], []
+    firstStarts, durations, weekOffsets = [], [], []
+    # 同一学期的课表和同一时间的课程格子很多，第一周的日期和上课时间只计算一次
+    firstWeekCache, clockCache = {}, {}
+    for startYear, allOccupyWeek, _, _, courseList in courseTables:
+        firstWeekTime = firstWeekCache.get((startYear, allOccupyWeek))
+        if firstWeekTime is None:
+            firstWeekTime = firstWeekCache[startYear, allOccupyWeek] = _firstWeekTime(startYear, allOccupyWeek)
+        firstWeekTimes.append(firstWeekTime)
+        # 在不带时区的本地时间上计算，写出时再使用课表的时区
+        epochSeconds = (firstWeekTime.replace(tzinfo=None) - datetime(1970, 1, 1)) // timedelta(seconds=1)
+        weekOffset = int(allOccupyWeek) - 1
+        firstBlock = len(blocks)
+        for curCourse in iterCourseBlocks(courseList, splitCourse):
+            clockKey = (curCourse.day, curCourse.courses, curCourse.roomName[:1])
+            clock = clockCache.get(clockKey)
+            if clock is None:
+                begTime, endTime, _ = _blockClock(curCourse, sorted(curCourse.courses, key=slotSortKey), modifyDEFTime)
+                firstDay = timedelta(days=(curCourse.day + 1) % 7)
+                clock = clockCache[clockKey] = ((firstDay + begTime) // timedelta(seconds=1),
+                                                (endTime - begTime) // timedelta(seconds=1))
+            blocks.append(curCourse)
+            firstStarts.append(epochSeconds + clock[0])
+            durations.append(clock[1])
+            weekOffsets.append(weekOffset)
+        tableBlocks.append((firstBlock, len(blocks)))
+
+    # 周次位掩码 -> 每个格子一行的0/1矩阵，非零元素的位置就是(格子, 周次)
+    weekCount = max((len(curCourse.weeks) for curCourse in blocks), default=0)
+    byteCount = (weekCount + 7) // 8
+    masks = np.frombuffer(b''.join(curCourse.weeks.bits.to_bytes(byteCount, 'little') for curCourse in blocks),
+                          np.uint8).reshape(len(blocks), byteCount)
+    blockIndex, weeks = np.nonzero(np.unpackbits(masks, axis=1, bitorder='little')[:, :weekCount])
+    starts = (np.asarray(firstStarts, np.int64)[blockIndex] +
+              (weeks - np.asarray(weekOffsets, np.int64)[blockIndex]) * (ONE_WEEK // timedelta(seconds=1)))
+    ends = starts + np.asarray(durations, np.int64)[blockIndex]
+    return Occurrences(blocks, tableBlocks, firstWeekTimes, blockIndex, starts.astype('datetime64[s]'),
+                       ends.astype('datetime64[s]'))
+
+
+# 可以写出展开后上课时间的导出格式
+EXPANDED_FORMATS = ('ics', 'csv', 'json')
+
+
+def _formatStamps(times, compact: bool):
+    # datetime64[s]数组 -> 字节串列表，compact时为ics的20190902T081500，否则为isoformat的2019-09-02T08:15:00
+    import numpy as np
+    stamps = np.datetime_as_string(times, unit='s').astype('S19')
+    if compact:
+        columns = [0, 1, 2, 3, 5, 6, 8, 9, 10, 11, 12, 14, 15, 17, 18]
+        stamps = np.ascontiguousarray(stamps.view(np.uint8).reshape(-1, 19)[:, columns]).view('S15').ravel()
+    return stamps.tolist()
+
+
+def writeOccurrences(occurrences: Occurrences, writer: EventExporter, alarmTime: int, tableIndex: int = 0):
+    """
+    把expandOccurrences的结果中一个课表的每次上课作为一个不重复的日程写出
+    同一课程格子的日程只有上下课时间和UID不同：用该格子生成一个日程模板，再把批量格式化的时间逐个填入，
+    不需要为每次上课创建icalendar对象
+    :param writer: 导出对象，格式为EXPANDED_FORMATS中的一种
+    :param alarmTime: 提前提醒分钟数
+    :param tableIndex: 课表在expandOccurrences参数中的下标
+    :return: 写出的日程数
+    """
+    import numpy as np
+    firstBlock, endBlock = occurrences.tableBlocks[tableIndex]
+    firstWeekTime = occurrences.firstWeekTimes[tableIndex]
+    bounds = np.searchsorted(occurrences.blockIndex, np.arange(firstBlock, endBlock + 1)).tolist()
+    compact = isinstance(writer, IcsStreamWriter)
+    starts = _formatStamps(occurrences.starts[bounds[0]:bounds[-1]], compact)
+    ends = _formatStamps(occurrences.ends[bounds[0]:bounds[-1]], compact)
+    # 模板中的上下课时间，真实的上课时间不会是0点0分
+    startMark, endMark = firstWeekTime + timedelta(seconds=1), firstWeekTime + timedelta(seconds=2)
+    markFormat = '%Y%m%dT%H%M%S' if compact else '%Y-%m-%dT%H:%M:%S'
+    startStamp, endStamp = (mark.strftime(markFormat).encode('ascii') for mark in (startMark, endMark))
+    alarmTrigger = timedelta(minutes=-abs(alarmTime))
+
+    for curCourse, lo, hi in zip(occurrences.blocks[firstBlock:endBlock], bounds, bounds[1:]):
+        if lo == hi:
+            continue
+        courseTimes = sorted(curCourse.courses, key=slotSortKey)
+        uidPrefix = curCourse.courseId + curCourse.roomId + str(curCourse.day) + str(courseTimes[0]) + \
+            str(courseTimes[-1]) + '-'
+        template = writer.serialize(CalendarEvent(
+            uidPrefix + startStamp.decode('ascii'), curCourse.courseName + ' ' + curCourse.teacherName, startMark,
+            endMark, curCourse.roomName, None, (), curCourse.courseName + ' ' + curCourse.roomName, alarmTrigger))
+        blockStarts, blockEnds = starts[lo - bounds[0]:hi - bounds[0]], ends[lo - bounds[0]:hi - bounds[0]]
+        if template.count(startStamp) == 2 and template.count(endStamp) == 1:
+            template = template.replace(b'%', b'%%').replace(startStamp, b'%(s)s').replace(endStamp, b'%(e)s')
+            writer.writeSerialized(b''.join(template % {b's': start, b'e': end}
+                                            for start, end in zip(blockStarts, blockEnds)), hi - lo)
+        else:
+            # UID过长被折行等模板中找不到时间的情况，逐个生成
+            for start, end in zip(occurrences.starts[lo:hi].tolist(), occurrences.ends[lo:hi].tolist()):
+                start, end = start.replace(tzinfo=firstWeekTime.tzinfo), end.replace(tzinfo=firstWeekTime.tzinfo)
+                writer.writeEvent(CalendarEvent(
+                    uidPrefix + start.strftime(markFormat), curCourse.courseName + ' ' + curCourse.teacherName,
+                    start, end, curCourse.roomName, None, (), curCourse.courseName + ' ' + curCourse.roomName,
+                    alarmTrigger))
+    return int(bounds[-1] - bounds[0])
 
 
 def cvt2Caldav(startYear: str, allOccupyWeek: str, allStartWeek: str, allEndWeek: str, courseList: list, alarmTime: int,
-               modifyDEFTime: bool, splitCourse: bool, icsFileName: str):
+               modifyDEFTime: bool, splitCourse: bool, icsFileName: str, streamOutput: bool = True,
+               verbose: bool = True, writer=None, metrics: Metrics = None, compactRRule: bool = False,
+               exportFormat: str = 'ics', expand: bool = False, eventCache: EventCache = None):
     """
-    将课程信息转换为.ics日历文件
+    将课程信息转换为.ics日历文件，依次经过iterCourseBlocks、iterCourseEvents和导出对象，不保存中间结果
     :param startYear: 课表年份，可以通过SuesApi.getCourseTable获得
     :param allOccupyWeek: 教学活动起始周,可以通过SuesApi.getCourseTable获得 从1计数
     :param allStartWeek: 教学活动起始周,是相对allOccupyWeek的值,一般为1,可以通过SuesApi.getCourseTable获得 从1计数
@@ -417,139 +2373,1319 @@ def cvt2Caldav(startYear: str, allOccupyWeek: str, allStartWeek: str, allEndWeek
     :param alarmTime: 提前提醒分钟数，正整数
     :param modifyDEFTime 是否修正DEF楼课程第三节和第四节的时间
     :param splitCourse: 是否将横跨的课程按照1-4节 5-8节 9-14节切分
-    :param icsFileName: ics文件的名称
+    :param icsFileName: ics文件的名称，也可以是可写的二进制流(如sys.stdout.buffer)
+    :param streamOutput: 是否使用IcsStreamWriter流式写出，False时使用原先的Calendar对象在内存中构建整个日历后一次写出(便于对比)
+    :param verbose: 是否在控制台输出每个日程的信息，输出内容先缓存，生成结束后一次写出
+    :param writer: 自定义的写出对象(如IncrementalIcsWriter)，不为None时忽略icsFileName和streamOutput，本函数结束时会关闭它
+    :param metrics: 记录耗时、日程数和写出字节数的Metrics对象，None时使用defaultMetrics
+    :param compactRRule: 是否压缩重复规则：单双周等不连续的上课周合并为一个带INTERVAL/COUNT/EXDATE的日程，
+                         而不是每段连续上课周一个日程。展开后的上课时间与不压缩时相同
+    :param exportFormat: 导出格式，EXPORTERS中的一项，streamOutput为False时只支持'ics'
+    :param expand: 不使用重复规则，每次上课写出一个日程，供不支持RRULE的客户端使用，见expandOccurrences。
+                   只支持EXPANDED_FORMATS中的格式，writer不为None时必须是EventExporter
+    :param eventCache: 不为None时相同的课程格子直接写出缓存的内容，见EventCache。
+                       verbose、expand、增量导出和jcal格式时不使用
+    :return: 写出的日程数
     """
-    uid = 1
+    metrics = metrics or defaultMetrics
+    begin = time.perf_counter()
+    _checkExportFormat(exportFormat, False, expand)
+    if expand and (compactRRule or not (streamOutput or isinstance(writer, EventExporter))):
+        raise MyException(ErrorCode.INPUT_ERROR, '展开上课时间时不能压缩重复规则，并且只能流式写出')
+    if streamOutput or writer:
+        cal = None
+    elif exportFormat != 'ics':
+        raise MyException(ErrorCode.INPUT_ERROR, '只有ics格式可以不流式写出')
+    else:
+        from icalendar import Calendar
+        cal = Calendar()
 
-    cal = Calendar()
-    weekExtractRe = re.compile(r'[1]+')
+    firstWeekTime = _firstWeekTime(startYear, allOccupyWeek)
 
-    # 自动识别第一周的日期（第一天从周日开始）
+    if verbose:
+        print('\n教学活动范围：%s周-%s周' % (allStartWeek, allEndWeek))
 
-    # 下面日期中周日是第一天，从0计数，而curCourse.day认为周一是第一天需要-1
+    if writer is None and streamOutput:
+        writer = EXPORTERS[exportFormat](icsFileName)
+    eventLog = [] if verbose else None
+    # 流水线：课程 -> 切分后的课程格子 -> 日程 -> 导出对象，每个日程生成后立即写出
+    events = iterCourseEvents(iterCourseBlocks(courseList, splitCourse), allOccupyWeek, firstWeekTime, alarmTime,
+                              modifyDEFTime, compactRRule, eventLog)
+    eventCount = 0
+    try:
+        if expand:
+            occurrences = expandOccurrences([(startYear, allOccupyWeek, allStartWeek, allEndWeek, courseList)],
+                                            modifyDEFTime, splitCourse)
+            eventCount = writeOccurrences(occurrences, writer, alarmTime)
+            events = ()
+            if eventLog is not None:
+                eventLog.append('已展开%d个课程格子的%d次上课\n' % (len(occurrences.blocks), eventCount))
+        elif eventCache and eventCache.maxEntries > 0 and eventLog is None and isinstance(writer, EventExporter) \
+                and writer.CACHEABLE:
+            options = (startYear, allOccupyWeek, alarmTime, modifyDEFTime, splitCourse, compactRRule,
+                       type(writer).__name__)
+            for block in iterCourseBlocks(courseList, splitCourse):
+                key = eventCache.key(block, options)
+                entry = eventCache.get(key)
+                if entry is None:
+                    blockEvents = list(iterCourseEvents((block,), allOccupyWeek, firstWeekTime, alarmTime,
+                                                        modifyDEFTime, compactRRule))
+                    entry = (b''.join(map(writer.serialize, blockEvents)), len(blockEvents))
+                    eventCache.put(key, *entry)
+                writer.writeSerialized(*entry)
+                eventCount += entry[1]
+            events = ()
+        for event in events:
+            if writer:
+                writer.writeEvent(event)
+            else:
+                cal.add_component(event.toIcal())
+            eventCount += 1
+    except BaseException:
+        if writer:
+            writer.abort()
+        raise
+    finally:
+        if eventLog:
+            sys.stdout.write(''.join(eventLog))
+            sys.stdout.flush()
+    if writer:
+        writer.close()
+        bytesWritten = writer.bytesWritten
+
+    if cal is not None:
+        # 整个日历构建完成后一次性写出ics文件
+        with open(os.path.join(icsFileName), 'wb') as f:
+            bytesWritten = f.write(cal.to_ical())
+
+    metrics.record('phase', time.perf_counter() - begin, phase='ics')
+    metrics.count('ics_events', eventCount)
+    metrics.count('ics_bytes_written', bytesWritten)
+    return eventCount
+
+
+class CourseSnapshot:
+    """
+    只读的课表快照文件，通过mmap按需读取，保存了大量学生课表的快照也不需要整体读入内存
+    快照保存SuesApi.getCourseTable的结果，修改提醒时间、DEF楼时间等选项后可以直接重新生成ics，不需要再登录和获取
+    文件由saveSnapshot写出，格式(小端，各部分依次排列)：
+        HEADER                          魔数、版本号和各部分的数量
+        TABLE * tableCount              学号、学年、学期和getCourseTable返回的4个字符串(字符串编号)，该课表的第一门课程和课程数
+        COURSE * courseCount            CourseInfo的6个字符串字段(字符串编号)、节次在节次池中的位置和数量、星期、周次长度和位掩码
+        uint8 * slotCount               节次池，按原顺序保存每门课程的上课节次
+        uint32 * (stringCount + 1)      每个字符串在字符串数据中的起始位置，最后一项为字符串数据的总长度
+        字符串数据                        所有去重后的字符串，UTF-8编码
+    """
+    MAGIC = b'S2CS'
+    VERSION = 1
+    HEADER = struct.Struct('<4sHHIIII')  # 魔数, 版本号, 保留, tableCount, courseCount, slotCount, stringCount
+    TABLE = struct.Struct('<7III')
+    COURSE = struct.Struct('<6IIBBH16s')
+    MAX_WEEKS = 128  # COURSE中周次位掩码的位数
+
+    def __init__(self, path: str):
+        """
+        :param path: saveSnapshot写出的快照文件
+        """
+        import mmap
+        try:
+            with open(path, 'rb') as f:
+                self._buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError) as e:
+            raise MyException(ErrorCode.INPUT_ERROR, '快照读取失败\n' + str(e))
+        if len(self._buffer) < self.HEADER.size:
+            self.close()
+            raise MyException(ErrorCode.INPUT_ERROR, '%s不是课表快照' % path)
+        magic, version, _, self.tableCount, self.courseCount, slotCount, self.stringCount = \
+            self.HEADER.unpack_from(self._buffer)
+        if magic != self.MAGIC:
+            self.close()
+            raise MyException(ErrorCode.INPUT_ERROR, '%s不是课表快照' % path)
+        if version != self.VERSION:
+            self.close()
+            raise MyException(ErrorCode.INPUT_ERROR, '不支持的快照版本%d，请重新导出' % version)
+        self._courseOffset = self.HEADER.size + self.TABLE.size * self.tableCount
+        self._slotOffset = self._courseOffset + self.COURSE.size * self.courseCount
+        self._stringIndexOffset = self._slotOffset + slotCount
+        self._stringDataOffset = self._stringIndexOffset + 4 * (self.stringCount + 1)
+        self._strings = {}  # 已解码的字符串
+        self._index = None  # (学号, 学年, 学期) -> 课表编号，第一次调用get时建立
+
+    def _string(self, index: int):
+        string = self._strings.get(index)
+        if string is None:
+            beg, end = struct.unpack_from('<II', self._buffer, self._stringIndexOffset + 4 * index)
+            string = self._buffer[self._stringDataOffset + beg:self._stringDataOffset + end].decode('utf-8')
+            self._strings[index] = string
+        return string
+
+    def _table(self, index: int):
+        return self.TABLE.unpack_from(self._buffer, self.HEADER.size + self.TABLE.size * index)
+
+    def keys(self):
+        """
+        :return: 快照中所有课表的(学号, 学年, 学期)，按保存时的顺序
+        """
+        return [tuple(self._string(i) for i in self._table(index)[:3]) for index in range(self.tableCount)]
 
-    # 特殊年份在python中第0周和第1周相同,需往后顺延一周才能得到正确日期
-    offset = 0
-    if datetime.strptime(startYear + '-01-01', "%Y-%m-%d") \
-            .replace(tzinfo=tz.gettz('Beijing')).weekday() is 6:
-        offset = 1
+    def get(self, key: tuple):
+        """
+        :param key: (学号, 学年, 学期)
+        :return: 与SuesApi.getCourseTable相同的元组，没有该课表时返回None
+        """
+        if self._index is None:
+            self._index = {tableKey: index for index, tableKey in enumerate(self.keys())}
+        index = self._index.get(tuple(key))
+        return None if index is None else self._courseTable(self._table(index))
+
+    def _courseTable(self, table: tuple):
+        startYear, allOccupyWeek, allStartWeek, allEndWeek = (self._string(i) for i in table[3:7])
+        firstCourse, courseCount = table[7:]
+        courseList = []
+        for index in range(firstCourse, firstCourse + courseCount):
+            fields = self.COURSE.unpack_from(self._buffer, self._courseOffset + self.COURSE.size * index)
+            slotBeg, slotCount, day, weeksLength, weeksBits = fields[6:]
+            courses = self._buffer[self._slotOffset + slotBeg:self._slotOffset + slotBeg + slotCount]
+            courseList.append(CourseInfo(*(self._string(i) for i in fields[:6]),
+                                         WeekSet(int.from_bytes(weeksBits, 'little'), weeksLength), day,
+                                         tuple(courses)))
+        return startYear, allOccupyWeek, allStartWeek, allEndWeek, courseList
+
+    def items(self):
+        """
+        依次产生快照中的((学号, 学年, 学期), 课表)
+        """
+        for index in range(self.tableCount):
+            table = self._table(index)
+            yield tuple(self._string(i) for i in table[:3]), self._courseTable(table)
 
-    firstWeekTime = datetime.strptime(''.join([str(startYear), '-W', str(int(allOccupyWeek) - 1 + offset), '-0']),
-                                      "%Y-W%U-%w") \
-        .replace(tzinfo=tz.gettz('Beijing'))
+    def __len__(self):
+        return self.tableCount
 
-    print('\n教学活动范围：%s周-%s周' % (allStartWeek, allEndWeek))
+    def close(self):
+        self._buffer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
 
-    # 按照用户的选择切分整块的日程
-    splitedCourseList = []
-    if not splitCourse:
-        splitedCourseList = courseList
-    else:
-        for curCourse in courseList:
-            bucket1_4 = []
-            bucket5_8 = []
-            bucket9_14 = []
-            for i in curCourse.courses:
-                i = int(i)
-                if i <= 3:
-                    bucket1_4.append(str(i))
-                elif 4 <= i <= 7:
-                    bucket5_8.append(str(i))
-                else:
-                    bucket9_14.append(str(i))
-            if len(bucket1_4) > 0:
-                cache = copy.copy(curCourse)
-                cache.courses = bucket1_4
-                splitedCourseList.append(cache)
-            if len(bucket5_8) > 0:
-                cache = copy.copy(curCourse)
-                cache.courses = bucket5_8
-                splitedCourseList.append(cache)
-            if len(bucket9_14) > 0:
-                cache = copy.copy(curCourse)
-                cache.courses = bucket9_14
-                splitedCourseList.append(cache)
-
-    for curCourse in splitedCourseList:
-        # 遍历开课时间段，每个开课时间段（周次）对应课程表上的一个格子，创建一个日程
 
-        for validweek in weekExtractRe.finditer(curCourse.validweeks):
-            curCourseBegWeek = validweek.start() - (int(allOccupyWeek) - 1)  # 当前课程第一次开课周次 从0计数
-            curCourseEndWeek = (validweek.end() - 1) - (int(allOccupyWeek) - 1)  # 当前课程最后第一次开课周次  从0计数
+def saveSnapshot(path: str, courseTables: dict, update: bool = False):
+    """
+    把课表保存为快照文件，见CourseSnapshot
+    :param path: 快照文件路径
+    :param courseTables: {(学号, 学年, 学期): SuesApi.getCourseTable的返回值}
+    :param update: 为True且文件已存在时保留其中的其它课表，相同的课表被替换
+    :return: 快照中的课表数
+    """
+    if update and os.path.exists(path):
+        merged = loadSnapshot(path)
+        merged.update(courseTables)
+        courseTables = merged
+
+    strings = {}  # 字符串 -> 编号
+    where = ''  # 出错时说明是哪个课表
+
+    def stringIndex(string: str):
+        if not isinstance(string, str):
+            raise MyException(ErrorCode.INPUT_ERROR, '%s中有非字符串的字段(%r)，不能保存为快照' % (where, string))
+        return strings.setdefault(string, len(strings))
+
+    tables, courses, slots = [], [], bytearray()
+    for (username, year, term), (startYear, allOccupyWeek, allStartWeek, allEndWeek, courseList) in \
+            courseTables.items():
+        where = '%s %s第%s学期的课表' % (username, year, term)
+        tables.append(CourseSnapshot.TABLE.pack(*map(stringIndex, (username, year, term, startYear, allOccupyWeek,
+                                                                   allStartWeek, allEndWeek)),
+                                                len(courses), len(courseList)))
+        for course in courseList:
+            if len(course.weeks) > CourseSnapshot.MAX_WEEKS or len(course.courses) > 255:
+                raise MyException(ErrorCode.INPUT_ERROR, '%s的周次或节次过多，不能保存为快照' % course.courseName)
+            # 星期和节次各占一个字节
+            if not all(isinstance(value, int) and 0 <= value <= 255 for value in (course.day, *course.courses)):
+                raise MyException(ErrorCode.INPUT_ERROR, '%s中%s的星期(%r)或节次(%r)无效，不能保存为快照'
+                                  % (where, course.courseName, course.day, course.courses))
+            courses.append(CourseSnapshot.COURSE.pack(
+                *map(stringIndex, (course.teacherId, course.teacherName, course.courseId, course.courseName,
+                                   course.roomId, course.roomName)),
+                len(slots), len(course.courses), course.day, len(course.weeks),
+                course.weeks.bits.to_bytes(CourseSnapshot.MAX_WEEKS // 8, 'little')))
+            slots.extend(course.courses)
+
+    stringData, stringOffsets = bytearray(), [0]
+    for string in strings:
+        stringData += string.encode('utf-8')
+        stringOffsets.append(len(stringData))
+
+    tmpPath = '%s.%d.tmp' % (path, threading.get_ident())
+    try:
+        with open(tmpPath, 'wb') as f:
+            f.write(CourseSnapshot.HEADER.pack(CourseSnapshot.MAGIC, CourseSnapshot.VERSION, 0, len(tables),
+                                               len(courses), len(slots), len(strings)))
+            f.write(b''.join(tables))
+            f.write(b''.join(courses))
+            f.write(slots)
+            f.write(struct.pack('<%dI' % len(stringOffsets), *stringOffsets))
+            f.write(stringData)
+        os.replace(tmpPath, path)
+    except OSError as e:
+        if os.path.exists(tmpPath):
+            os.remove(tmpPath)
+        raise MyException(ErrorCode.INPUT_ERROR, '快照写入失败\n' + str(e))
+    return len(tables)
+
+
+def loadSnapshot(path: str):
+    """
+    读取快照文件中的所有课表，大量课表只需要其中几个时可以直接使用CourseSnapshot
+    :return: {(学号, 学年, 学期): 与SuesApi.getCourseTable相同的元组}
+    """
+    with CourseSnapshot(path) as snapshot:
+        return dict(snapshot.items())
 
-            courseTimes = sorted([int(time) for time in curCourse.courses],
-                                 key=cmp_to_key(cmp_courseTime))  # 排序，找到对应的上课下课时间
 
-            begTime = courseTimes[0]  # 当前课程开课当天的上课时间
-            endTime = courseTimes[-1]  # 当前课程开课当天的下课时间
-            timeModified = False
-            if modifyDEFTime and curCourse.roomName[0] in ['D', 'E', 'F'] and begTime in [2, 3] and endTime in [2, 3]:
-                begTime = DEFtimeTable[begTime][0]  # D、E、F楼上课时间
-                endTime = DEFtimeTable[endTime][-1]  # D、E、F楼下课时间
-                timeModified = True
+def renderSnapshot(path: str, outputDir: str = '.', alarmTime: int = 15, modifyDEFTime: bool = False,
+                   splitCourse: bool = False, incremental: bool = False, compactRRule: bool = False,
+                   usernames=None, progress=None, exportFormat: str = 'ics', expand: bool = False,
+                   eventCache: EventCache = None):
+    """
+    用快照中的课表重新生成ics文件，只在本地计算，不访问教学管理系统
+    expand时所有课表的上课时间由expandOccurrences一次展开，再分别写出
+    :param path: 快照文件路径
+    :param usernames: 只生成这些学号的课表，None时生成全部
+    :param progress: 每生成一个文件调用一次 progress(result: dict)，result同返回值中的一项
+    :param eventCache: 所有课表共享的日程片段缓存，None时新建一个(默认大小)
+    其余参数同export
+    :return: 结果字典列表，每项包含username/year/term/file/eventCount/diff/elapsed
+    """
+    if not 0 <= alarmTime <= 120:
+        raise MyException(ErrorCode.INPUT_ERROR, '提醒时间只能为上课前0-120分钟')
+    _checkExportFormat(exportFormat, incremental, expand)
+    if expand and compactRRule:
+        raise MyException(ErrorCode.INPUT_ERROR, '展开上课时间时不能压缩重复规则')
+    progress = progress or (lambda result: None)
+    eventCache = eventCache or EventCache()
+    os.makedirs(outputDir, exist_ok=True)
+    results = []
+    with CourseSnapshot(path) as snapshot:
+        tables = ((key, courseTable) for key, courseTable in snapshot.items()
+                  if usernames is None or key[0] in usernames)
+        if expand:
+            tables = list(tables)
+            occurrences = expandOccurrences([courseTable for _, courseTable in tables], modifyDEFTime, splitCourse)
+        for tableIndex, ((username, year, term), courseTable) in enumerate(tables):
+            begin = time.perf_counter()
+            icsFileName = os.path.join(outputDir, _exportFileName(username, year, term, exportFormat))
+            writer = IncrementalIcsWriter(icsFileName) if incremental else None
+            if expand:
+                with EXPORTERS[exportFormat](icsFileName) as exporter:
+                    eventCount = writeOccurrences(occurrences, exporter, alarmTime, tableIndex)
             else:
-                begTime = timetable[begTime][0]  # 上课时间
-                endTime = timetable[endTime][-1]  # 下课时间
-            begTime = begTime.split(':')
-            endTime = endTime.split(':')
+                eventCount = cvt2Caldav(*courseTable, alarmTime, modifyDEFTime, splitCourse, icsFileName,
+                                        verbose=False, writer=writer, compactRRule=compactRRule,
+                                        exportFormat=exportFormat, eventCache=eventCache)
+            results.append({'username': username, 'year': year, 'term': term, 'file': icsFileName,
+                            'eventCount': eventCount, 'diff': writer.diff if writer else None,
+                            'elapsed': round(time.perf_counter() - begin, 3)})
+            progress(results[-1])
+    return results
 
-            # 整合上面运算得到的上下课时间
-            startDayFrom = firstWeekTime \
-                           + timedelta(weeks=int(curCourseBegWeek)) \
-                           + timedelta(days=(int(curCourse.day) + 1) % 7) \
-                           + timedelta(hours=int(begTime[0]), minutes=int(begTime[1]))
 
-            startDayTo = firstWeekTime \
-                         + timedelta(weeks=int(curCourseBegWeek)) \
-                         + timedelta(days=(int(curCourse.day) + 1) % 7) \
-                         + timedelta(hours=int(endTime[0]), minutes=int(endTime[1]))
+# 控制台输入锁，批量导出时多个任务需要依次提示用户输入
+_consoleLock = threading.Lock()
 
-            untilDay = firstWeekTime \
-                       + timedelta(weeks=int(curCourseEndWeek)) \
-                       + timedelta(days=(int(curCourse.day) + 1) % 7) \
-                       + timedelta(hours=int(endTime[0]), minutes=int(endTime[1]))
 
-            # 调试信息输出
-            print('正在添加日程： %23s\t%23s\t%d-%d周\t星期%d %d-%d节\t%s' % (
-                curCourse.courseName,
-                curCourse.teacherName,
-                int(curCourseBegWeek) + 1,
-                int(curCourseEndWeek) + 1,
-                int(curCourse.day) + 1,
-                int(courseTimes[0]) + 1,
-                int(courseTimes[-1]) + 1,
-                curCourse.roomName), end='')
-            if (timeModified):
-                print('\tDEF楼 3 4节时间调整')
+def promptCaptcha(capthaBytes: bytes, prompt: str = '\n请输入验证码(图片另弹窗口):'):
+    """
+    弹出验证码图片并请用户输入
+    :param capthaBytes: SuesApi.getCaptha获取的验证码图像
+    :param prompt: 输入提示
+    :return: 用户输入的验证码
+    """
+    from io import BytesIO
+    from PIL import Image
+    i = Image.open(BytesIO(capthaBytes))
+    i = i.resize((i.size[0] * 4, i.size[1] * 4))
+    i.show('验证码')
+    return input(prompt)
+
+
+def resolvePassword(passwordSource: str, username: str):
+    """
+    解析批量导出清单中的密码来源
+    :param passwordSource: 'env:变量名' 从环境变量读取，'file:路径' 从文件第一行读取，'prompt' 在控制台输入，其他值视为密码本身
+    :param username: 学号，用于输入提示
+    :return: 密码
+    """
+    if passwordSource.startswith('env:'):
+        passwd = os.environ.get(passwordSource[4:])
+        if passwd is None:
+            raise MyException(ErrorCode.INPUT_ERROR, '环境变量%s不存在' % passwordSource[4:])
+        return passwd
+    if passwordSource.startswith('file:'):
+        try:
+            with open(passwordSource[5:], encoding='utf-8') as f:
+                return f.readline().rstrip('\r\n')
+        except OSError as e:
+            raise MyException(ErrorCode.INPUT_ERROR, '密码文件读取失败\n' + str(e))
+    if passwordSource == 'prompt':
+        with _consoleLock:
+            return getpass.getpass('\n请输入%s的密码:' % username)
+    return passwordSource
+
+
+class BatchJob:
+    """
+    批量导出中的一个任务，对应一个学生的一个学期
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+
+    def __init__(self, username: str, passwordSource: str, year: str = '', term: str = '', fileName: str = ''):
+        """
+        :param username: 学号
+        :param passwordSource: 密码来源，见resolvePassword
+        :param year: 学年 例:'2019-2020'，为空时使用教学系统返回的第一个(最近的)学年
+        :param term: 学期 例:'1'，为空时使用教学系统返回的第一个(最近的)学期
+        :param fileName: 导出的ics文件名，为空时与交互模式的命名相同
+        """
+        self.username = username
+        self.passwordSource = passwordSource
+        self.year = year
+        self.term = term
+        self.fileName = fileName
+        self.status = BatchJob.PENDING
+        self.detail = ''
+        self.eventCount = 0
+        self.elapsed = 0.0
+        self.diff = None  # 增量导出时的IcsDiff
+
+    def toDict(self):
+        return {'username': self.username, 'year': self.year, 'term': self.term, 'fileName': self.fileName,
+                'status': self.status, 'detail': self.detail, 'eventCount': self.eventCount,
+                'elapsed': round(self.elapsed, 3), 'diff': self.diff.toDict() if self.diff else None}
+
+
+def loadBatchManifest(manifestPath: str):
+    """
+    读取批量导出清单
+    清单可以是JSON(对象列表)或CSV(带表头)，字段为 username,password,year,term,fileName，后三项可省略
+    :param manifestPath: 清单文件路径
+    :return: BatchJob列表
+    """
+    try:
+        with open(manifestPath, encoding='utf-8-sig', newline='') as f:
+            if manifestPath.lower().endswith('.json'):
+                rows = json.load(f)
             else:
-                print('\t')
+                rows = list(csv.DictReader(f))
+    except (OSError, ValueError) as e:
+        raise MyException(ErrorCode.INPUT_ERROR, '批量导出清单读取失败\n' + str(e))
 
-            event = Event()
-            # 必须保证UID在本日历内唯一，否则某些日历不能导入
-            event.add('uid', curCourse.courseId + curCourse.roomId + curCourse.day +
-                      str(curCourseBegWeek) + str(curCourseEndWeek) + str(courseTimes[0]) + str(courseTimes[-1]))
-            uid += 1
-            event.add('summary', curCourse.courseName + ' ' + curCourse.teacherName)
-            event.add('dtstart', startDayFrom)
-            event.add('dtend', startDayTo)
-            event.add('location', curCourse.roomName)
-            event.add('rrule', {'freq': 'weekly', 'until': untilDay})  # 每周重复，直到停止
-
-            eventAlarm = Alarm()
-            eventAlarm.add('action', 'display')
-            eventAlarm.add('description', curCourse.courseName + ' ' + curCourse.roomName)
-            eventAlarm.add('trigger', timedelta(minutes=-abs(alarmTime)))
-
-            event.add_component(eventAlarm)
-            cal.add_component(event)
-            # 写出ics文件
-            with open(os.path.join(icsFileName), 'wb') as f:
-                f.write(cal.to_ical())
-            f.close()
+    jobs = []
+    for lineNo, row in enumerate(rows, 1):
+        if not row.get('username') or not row.get('password'):
+            raise MyException(ErrorCode.INPUT_ERROR, '批量导出清单第%d项缺少username或password' % lineNo)
+        jobs.append(BatchJob(str(row['username']).strip(), str(row['password']).strip(),
+                             str(row.get('year') or '').strip(), str(row.get('term') or '').strip(),
+                             str(row.get('fileName') or '').strip()))
+    return jobs
 
 
-if __name__ == '__main__':
-    print('''
+def _consoleCaptchaProvider(suesApi: SuesApi, job: BatchJob):
+    with _consoleLock:
+        return promptCaptcha(suesApi.getCaptha(), '\n请输入%s的验证码(图片另弹窗口):' % job.username)
+
+
+def _failingCaptchaProvider(suesApi: SuesApi, job: BatchJob):
+    """
+    不能人工输入验证码时(如后台运行的serve)使用，需要登录而没有可用的会话时直接失败，不阻塞在控制台
+    """
+    raise MyException(ErrorCode.CAPTCHA_FETCH_ERROR, '%s需要输入验证码，请指定--captcha-model或--prompt-captcha' % job.username)
+
+
+def _stderrCaptchaProvider(captchaProvider):
+    """
+    JSON输出模式下标准输出只能有JSON记录，验证码的输入提示改为写到标准错误
+    """
+    def provider(*args):
+        with redirect_stdout(sys.stderr):
+            return captchaProvider(*args)
+
+    return provider
+
+
+def _exportFileName(username: str, year: str, term: str, exportFormat: str = 'ics'):
+    """
+    :return: 与交互模式相同的默认文件名，扩展名随导出格式
+    """
+    return ''.join([username, '_', year, '学年_第', term, '学期 课表导出', EXPORTERS[exportFormat].EXTENSION])
+
+
+def _checkExportFormat(exportFormat: str, incremental: bool, expand: bool = False):
+    if exportFormat not in EXPORTERS:
+        raise MyException(ErrorCode.INPUT_ERROR, '不支持的导出格式%s，可选%s' % (exportFormat, '/'.join(EXPORTERS)))
+    if incremental and exportFormat != 'ics':
+        raise MyException(ErrorCode.INPUT_ERROR, '增量导出只支持ics格式')
+    if expand and exportFormat not in EXPANDED_FORMATS:
+        raise MyException(ErrorCode.INPUT_ERROR, '展开上课时间只支持%s格式' % '/'.join(EXPANDED_FORMATS))
+    if expand and incremental:
+        raise MyException(ErrorCode.INPUT_ERROR, '增量导出不支持展开上课时间')
+
+
+def export(username: str, passwd: str, year: str = '', term: str = '', alarmTime: int = 15,
+           modifyDEFTime: bool = False, splitCourse: bool = False, outputDir: str = '.', fileName: str = '',
+           captchaProvider=None, incremental: bool = False, cache: ResponseCache = None, cacheOnly: bool = False,
+           sessionStore: SessionStore = None, requestPolicy: RequestPolicy = None,
+           hostLimiter: HostConcurrencyLimiter = None, progress=None, baseUrl: str = DEFAULT_BASE_URL,
+           compactRRule: bool = False, snapshot: dict = None, exportFormat: str = 'ics', expand: bool = False,
+           eventCache: EventCache = None):
+    """
+    非交互地导出一个学生一个学期的课表，供脚本和其它程序调用，所有参数与交互模式的提示一一对应
+    :param username: 学号
+    :param passwd: 教学管理系统密码，离线模式下可以为空
+    :param year: 学年 例:'2019-2020'，为空时使用教学系统返回的第一个(最近的)学年
+    :param term: 学期 例:'1'，为空时使用教学系统返回的第一个(最近的)学期
+    :param alarmTime: 课前提醒分钟数(0-120)
+    :param modifyDEFTime: 是否修正DEF楼课程第三节和第四节的时间
+    :param splitCourse: 是否将横跨的课程按照1-4节 5-8节 9-14节切分
+    :param outputDir: ics文件输出目录
+    :param fileName: ics文件名，为空时与交互模式的命名相同(扩展名随导出格式)，为'-'时写到标准输出
+    :param captchaProvider: 验证码获取函数 captchaProvider(suesApi) -> str，None时在控制台弹窗输入
+    :param incremental: 是否与上次导出的文件比较，只更新有变化的日程
+    :param cache: 响应缓存，None时不使用缓存
+    :param cacheOnly: 离线模式，只从缓存读取，不访问教学管理系统
+    :param sessionStore: 会话存储，None时总是重新登录
+    :param requestPolicy: 重试、限速和熔断策略，None时使用defaultRequestPolicy
+    :param hostLimiter: 主机并发限制器，None时使用defaultHostLimiter
+    :param progress: 进度回调 progress(event: dict)，event['event']依次为'login'、'term'、'courseTable'
+    :param baseUrl: 教学管理系统地址
+    :param compactRRule: 是否压缩重复规则，见cvt2Caldav
+    :param snapshot: 不为None时把获取的课表以(学号, 学年, 学期)为键存入其中，可以用saveSnapshot保存
+    :param exportFormat: 导出格式，EXPORTERS中的一项，增量导出只支持'ics'
+    :param expand: 是否展开为每次上课一个日程，见cvt2Caldav
+    :param eventCache: 与其它导出共享的日程片段缓存，None时不使用
+    :return: 结果字典，包含username/year/term/file/eventCount/loginMode/diff(增量导出时的IcsDiff)/elapsed
+    """
+    begin = time.perf_counter()
+    if not 0 <= alarmTime <= 120:
+        raise MyException(ErrorCode.INPUT_ERROR, '提醒时间只能为上课前0-120分钟')
+    _checkExportFormat(exportFormat, incremental, expand)
+    if incremental and fileName == '-':
+        raise MyException(ErrorCode.INPUT_ERROR, '增量导出需要与上次的文件比较，不能写到标准输出')
+    progress = progress or (lambda event: None)
+    if captchaProvider is None:
+        captchaProvider = lambda api: promptCaptcha(api.getCaptha())  # noqa: E731
+
+    suesApi = SuesApi(hostLimiter, verbose=False, cache=cache, cacheOnly=cacheOnly, requestPolicy=requestPolicy,
+                      baseUrl=baseUrl)
+    loginMode = suesApi.ensureLogin(username, passwd, lambda: captchaProvider(suesApi), sessionStore)
+    loginMode = 'offline' if cacheOnly else loginMode
+    progress({'event': 'login', 'username': username, 'mode': loginMode})
+
+    year = year or suesApi.getYears()[0]
+    term = term or suesApi.getTerms(year)[0]
+    progress({'event': 'term', 'username': username, 'year': year, 'term': term})
+
+    courseTable = suesApi.getCourseTable(year, term)
+    progress({'event': 'courseTable', 'username': username, 'courses': len(courseTable[4])})
+    if snapshot is not None:
+        snapshot[(username, year, term)] = courseTable
+
+    if fileName == '-':
+        icsFileName, output = fileName, sys.stdout.buffer
+    else:
+        fileName = fileName or _exportFileName(username, year, term, exportFormat)
+        os.makedirs(outputDir, exist_ok=True)
+        icsFileName = output = os.path.join(outputDir, fileName)
+    writer = IncrementalIcsWriter(icsFileName) if incremental else None
+    eventCount = cvt2Caldav(*courseTable, alarmTime, modifyDEFTime, splitCourse, output, verbose=False,
+                            writer=writer, compactRRule=compactRRule, exportFormat=exportFormat, expand=expand,
+                            eventCache=eventCache)
+    return {'username': username, 'year': year, 'term': term, 'file': icsFileName, 'eventCount': eventCount,
+            'loginMode': loginMode, 'diff': writer.diff if writer else None,
+            'elapsed': round(time.perf_counter() - begin, 3)}
+
+
+def _runBatchJob(job: BatchJob, hostLimiter: HostConcurrencyLimiter, alarmTime: int, modifyDEFTime: bool,
+                 splitCourse: bool, outputDir: str, captchaProvider, incremental: bool, cache: ResponseCache,
+                 cacheOnly: bool, sessionStore: SessionStore, requestPolicy: RequestPolicy, progress, baseUrl: str,
+                 compactRRule: bool, snapshot: dict, exportFormat: str, expand: bool, eventCache: EventCache):
+    job.status = BatchJob.RUNNING
+    begin = time.perf_counter()
+
+    def onProgress(event):
+        if event['event'] == 'term':
+            job.year, job.term = event['year'], event['term']
+        progress(event)
+
+    try:
+        # 离线模式不需要登录，只记录学号用于查找缓存
+        passwd = '' if cacheOnly else resolvePassword(job.passwordSource, job.username)
+        # 每个任务使用独立的SuesApi对象，即独立的会话和cookie
+        result = export(job.username, passwd, job.year, job.term, alarmTime, modifyDEFTime, splitCourse, outputDir,
+                        job.fileName, lambda suesApi: captchaProvider(suesApi, job), incremental, cache, cacheOnly,
+                        sessionStore, requestPolicy, hostLimiter, onProgress, baseUrl, compactRRule, snapshot,
+                        exportFormat, expand, eventCache)
+        job.fileName = os.path.basename(result['file'])
+        job.eventCount = result['eventCount']
+        job.diff = result['diff']
+        if job.diff:
+            job.detail = str(job.diff)
+        job.status = BatchJob.SUCCEEDED
+    except MyException as e:
+        job.status = BatchJob.FAILED
+        job.detail = str(e)
+    except Exception as e:
+        job.status = BatchJob.FAILED
+        job.detail = '未识别的异常：' + repr(e)
+        if DBG_MODE:
+            raise e
+    finally:
+        job.elapsed = time.perf_counter() - begin
+    progress({'event': 'job', **job.toDict()})
+    return job
+
+
+def _printJobProgress(event: dict):
+    if event['event'] == 'job':
+        print('[%s] %s %s %s %s' % (event['status'], event['username'], event['year'], event['term'],
+                                    event['detail']), flush=True)
+
+
+def runBatch(jobs: list, workers: int = 4, hostConcurrency: int = 2, alarmTime: int = 15, modifyDEFTime: bool = False,
+             splitCourse: bool = False, outputDir: str = '.', captchaProvider=None, incremental: bool = False,
+             cache: ResponseCache = None, cacheOnly: bool = False, sessionStore: SessionStore = None,
+             requestPolicy: RequestPolicy = None, progress=None, baseUrl: str = DEFAULT_BASE_URL,
+             compactRRule: bool = False, snapshot: dict = None, exportFormat: str = 'ics', expand: bool = False,
+             eventCache: EventCache = None):
+    """
+    使用线程池并发执行批量导出任务
+    :param jobs: BatchJob列表，执行后各任务的status/detail/eventCount/elapsed会被更新
+    :param workers: 同时执行的任务数
+    :param hostConcurrency: 对同一主机同时进行的HTTP请求数上限，0表示不限制
+    :param alarmTime: 提前提醒分钟数
+    :param modifyDEFTime: 是否修正DEF楼课程第三节和第四节的时间
+    :param splitCourse: 是否将横跨的课程按照1-4节 5-8节 9-14节切分
+    :param outputDir: ics文件输出目录
+    :param captchaProvider: 验证码获取函数 captchaProvider(suesApi, job) -> str，None时在控制台弹窗输入
+    :param incremental: 是否与输出目录中上次导出的文件比较，只更新有变化的日程
+    :param cache: 响应缓存，None时不使用缓存
+    :param cacheOnly: 离线模式，只从缓存读取，不访问教学管理系统
+    :param sessionStore: 会话存储，用于复用之前登录的会话，None时每个任务都重新登录
+    :param requestPolicy: 所有任务共享的重试、限速和熔断策略，None时使用defaultRequestPolicy
+    :param progress: 进度回调 progress(event: dict)，可能在多个线程中调用，见export；
+                     每个任务结束时还会收到event为'job'的记录，内容同BatchJob.toDict。None时在控制台输出每个任务的结果
+    :param baseUrl: 教学管理系统地址
+    :param compactRRule: 是否压缩重复规则，见cvt2Caldav
+    :param snapshot: 不为None时把成功获取的课表存入其中，见export
+    :param exportFormat: 导出格式，见export
+    :param expand: 是否展开为每次上课一个日程，见cvt2Caldav
+    :param eventCache: 所有任务共享的日程片段缓存，None时新建一个(默认大小)
+    :return: jobs
+    """
+    hostLimiter = HostConcurrencyLimiter(hostConcurrency)
+    eventCache = eventCache or EventCache()
+    requestPolicy = requestPolicy or defaultRequestPolicy
+    captchaProvider = captchaProvider or _consoleCaptchaProvider
+    progress = progress or _printJobProgress
+    os.makedirs(outputDir, exist_ok=True)
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        list(pool.map(lambda job: _runBatchJob(job, hostLimiter, alarmTime, modifyDEFTime, splitCourse, outputDir,
+                                               captchaProvider, incremental, cache, cacheOnly, sessionStore,
+                                               requestPolicy, progress, baseUrl, compactRRule, snapshot,
+                                               exportFormat, expand, eventCache),
+                      jobs))
+    return jobs
+
+
+def printBatchReport(jobs: list, totalElapsed: float):
+    """
+    输出批量导出的汇总报告
+    """
+    succeeded = [job for job in jobs if job.status == BatchJob.SUCCEEDED]
+    print('\n%-12s %-10s %-4s %-10s %6s %8s' % ('学号', '学年', '学期', '状态', '日程数', '耗时(秒)'))
+    for job in jobs:
+        print('%-12s %-10s %-4s %-10s %6d %8.2f' % (job.username, job.year, job.term, job.status, job.eventCount,
+                                                   job.elapsed))
+    print('\n共%d个任务，成功%d个，失败%d个，总耗时%.2f秒' % (len(jobs), len(succeeded), len(jobs) - len(succeeded),
+                                                 totalElapsed))
+
+
+def jsonLine(event: dict):
+    """
+    以JSON Lines格式向标准输出写出一条进度或结果记录，可以在多个线程中调用
+    :param event: 记录内容，其中带toDict方法的对象(如IcsDiff)会被转换为字典
+    """
+    line = json.dumps(event, ensure_ascii=False, default=lambda o: o.toDict())
+    with _consoleLock:
+        print(line, flush=True)
+
+
+def _buildParser():
+    import argparse
+    # 生成日程的选项
+    calendar = argparse.ArgumentParser(add_help=False)
+    calendar.add_argument('--alarm', type=int, default=15, help='课前提醒分钟数(0-120)')
+    calendar.add_argument('--def-time', action='store_true', help='调整D E F楼3-4节课的时间')
+    calendar.add_argument('--split', action='store_true', help='拆分跨越中、晚休息时间的日程')
+    recurrence = calendar.add_mutually_exclusive_group()
+    recurrence.add_argument('--compact', action='store_true', help='单双周等不连续上课的课程合并为一个日程(INTERVAL/COUNT/EXDATE)')
+    recurrence.add_argument('--expand', action='store_true',
+                            help='不使用重复规则，每次上课一个日程，供不支持RRULE的客户端使用(只支持ics/csv/json格式)')
+    # export、batch和serve访问教学管理系统的选项
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--cache-dir', help='响应缓存目录，不指定时不使用缓存')
+    common.add_argument('--cache-only', action='store_true', help='离线模式，只使用缓存中的数据')
+    common.add_argument('--session-dir', help='加密保存登录会话的目录，之后的运行可以跳过验证码和登录')
+    common.add_argument('--retries', type=int, default=2, help='请求失败后的重试次数')
+    common.add_argument('--rate', type=float, default=0, help='每秒对教学管理系统发出的请求数上限，0表示不限制')
+    common.add_argument('--captcha-model', help='验证码样本库(.npz)或已标注样本目录，指定时自动识别验证码，识别失败时再手动输入')
+    common.add_argument('--min-confidence', type=float, default=0.3, help='接受验证码识别结果的最低置信度(0-1)')
+    common.add_argument('--base-url', default=DEFAULT_BASE_URL, help='教学管理系统地址，测试时可以指向mock-server')
+    common.add_argument('--metrics', help='结束时将请求和各阶段的耗时、计数写入该文件，扩展名为.json时为JSON，否则为Prometheus文本格式')
+    # export、batch和render写出文件时的选项
+    output = argparse.ArgumentParser(add_help=False)
+    output.add_argument('--output-dir', default='.', help='ics文件输出目录')
+    output.add_argument('--incremental', action='store_true', help='与上次导出的文件比较，只更新有变化的日程')
+    output.add_argument('--json', action='store_true', help='以JSON Lines格式在标准输出报告进度和结果')
+    output.add_argument('--format', choices=tuple(EXPORTERS), default='ics', help='导出格式，增量导出只支持ics')
+
+    parser = argparse.ArgumentParser(prog='sues_s2c.py', description='SUES 课表转iCalendar日程工具，不带参数运行时进入交互模式')
+    commands = parser.add_subparsers(dest='command', metavar='COMMAND')
+
+    interactive = commands.add_parser('interactive', help='按提示逐步输入(默认)')
+    interactive.add_argument('--session-dir', help='加密保存登录会话的目录，之后的运行可以跳过验证码和登录')
+    interactive.add_argument('--incremental', action='store_true', help='与上次导出的文件比较，只更新有变化的日程')
+
+    exportParser = commands.add_parser('export', parents=[calendar, common, output], help='非交互地导出一个学生的课表')
+    exportParser.add_argument('--username', required=True, help='学号')
+    exportParser.add_argument('--password', default='prompt',
+                              help='密码来源：env:变量名、file:路径、prompt(默认，在控制台输入)，其他值视为密码本身')
+    exportParser.add_argument('--year', default='', help='学年 例:2019-2020，不指定时使用最近的学年')
+    exportParser.add_argument('--term', default='', help='学期 例:1，不指定时使用最近的学期')
+    exportParser.add_argument('--file', default='', help='ics文件名，不指定时与交互模式的命名相同，为-时写到标准输出')
+    exportParser.add_argument('--snapshot', help='同时把课表保存到该快照文件(已有的其它课表保留)，之后可以用render子命令重新生成')
+
+    batch = commands.add_parser('batch', parents=[calendar, common, output], help='按清单批量导出')
+    batch.add_argument('manifest', help='批量导出清单(CSV或JSON)')
+    batch.add_argument('--workers', type=int, default=4, help='同时执行的任务数')
+    batch.add_argument('--host-concurrency', type=int, default=2, help='对教学管理系统同时进行的请求数上限，0表示不限制')
+    batch.add_argument('--report', help='将每个任务的结果以JSON格式写入该文件')
+    batch.add_argument('--snapshot', help='同时把成功获取的课表保存到该快照文件(已有的其它课表保留)')
+    batch.add_argument('--event-cache', type=int, default=4096, help='各任务共享缓存的课程格子数，0表示不缓存')
+
+    render = commands.add_parser('render', parents=[calendar, output], help='用快照中的课表重新生成ics，不访问教学管理系统')
+    render.add_argument('snapshot', help='export/batch --snapshot保存的快照文件')
+    render.add_argument('--username', action='append', help='只生成该学号的课表，可以指定多次')
+    render.add_argument('--event-cache', type=int, default=4096, help='各课表共享缓存的课程格子数，0表示不缓存')
+
+    analyze = commands.add_parser('analyze', parents=[calendar], help='分析快照中多个学生课表的教室、教师占用和重复安排')
+    analyze.add_argument('snapshot', help='export/batch --snapshot保存的快照文件')
+    analyze.add_argument('--year', help='只分析该学年的课表，快照中有多个学期时必须指定')
+    analyze.add_argument('--term', help='只分析该学期的课表')
+    analyze.add_argument('--free', nargs=3, metavar=('WEEK', 'DAY', 'SLOTS'),
+                         help='列出空闲教室，例:--free 5 3 3-4 表示第5周星期三第3-4节')
+    analyze.add_argument('--room', action='append', help='列出该教室(ID)的所有课程，可以指定多次')
+    analyze.add_argument('--teacher', action='append', help='列出该教师(ID)的所有课程，可以指定多次')
+    analyze.add_argument('--calendars', metavar='DIR', help='为每个教室和每个教师生成一个日历文件，保存到DIR')
+    analyze.add_argument('--format', choices=tuple(EXPORTERS), default='ics', help='--calendars的导出格式')
+    analyze.add_argument('--json', action='store_true', help='以JSON格式输出结果')
+
+    serve = commands.add_parser('serve', parents=[calendar, common], help='按清单通过HTTP提供webcal日历订阅')
+    serve.add_argument('manifest', help='订阅清单，格式与batch相同，fileName不为空时作为订阅名')
+    serve.add_argument('--host', default='127.0.0.1', help='监听地址')
+    serve.add_argument('--port', type=int, default=8000, help='监听端口')
+    serve.add_argument('--refresh', type=float, default=3600, help='后台重新获取课表的间隔(秒)，0表示不刷新')
+    serve.add_argument('--prompt-captcha', action='store_true',
+                       help='需要登录时在控制台输入验证码(默认不输入，没有--captcha-model或识别失败时该订阅返回503)')
+
+    captcha = commands.add_parser('captcha', help='采集、训练和评估本地验证码识别')
+    captchaCommands = captcha.add_subparsers(dest='captchaCommand', metavar='ACTION')
+    collect = captchaCommands.add_parser('collect', help='获取验证码并人工标注，保存到DIR')
+    collect.add_argument('dir')
+    collect.add_argument('--count', type=int, default=50, help='获取的数量')
+    train = captchaCommands.add_parser('train', help='用DIR中的已标注验证码建立样本库')
+    train.add_argument('dir')
+    train.add_argument('--model', required=True, help='样本库输出路径(.npz)')
+    train.add_argument('--length', type=int, default=4, help='验证码的字符数')
+    evaluate = captchaCommands.add_parser('eval', help='在DIR中的已标注验证码上测量准确率和耗时')
+    evaluate.add_argument('dir')
+    evaluate.add_argument('--model', required=True, help='样本库路径(.npz)')
+    evaluate.add_argument('--min-confidence', type=float, default=0.3, help='置信度阈值')
+
+    mockServer = commands.add_parser('mock-server', help='启动本地模拟的教学管理系统')
+    mockServer.add_argument('--port', type=int, default=8080, help='监听端口')
+    mockServer.add_argument('--courses', type=int, default=60, help='课表中TaskActivity的数量')
+    mockServer.add_argument('--latency', type=float, default=0.0, help='每个响应的模拟延迟(秒)')
+    mockServer.add_argument('--failure-rate', type=float, default=0.0, help='随机返回503的概率')
+
+    benchmark = commands.add_parser('benchmark', help='在本地模拟的教学管理系统上分阶段测量导出耗时')
+    benchmark.add_argument('--courses', type=int, default=2000, help='课表中TaskActivity的数量')
+    benchmark.add_argument('--rounds', type=int, default=5, help='重复次数，结果取中位数')
+    benchmark.add_argument('--latency', type=float, default=0.0, help='每个响应的模拟延迟(秒)')
+    benchmark.add_argument('--split', action='store_true', help='拆分跨越中、晚休息时间的日程')
+    benchmark.add_argument('--memory', action='store_true', help='另外测量解析和生成ics阶段的峰值内存(较慢)')
+    benchmark.add_argument('--occupancy', action='store_true',
+                           help='改为测量教室、教师占用索引的查询耗时，--courses为全校TaskActivity的数量')
+    benchmark.add_argument('--students', type=int, default=5000, help='--occupancy时合成的学生数')
+    benchmark.add_argument('--extract', metavar='DIR', nargs='?', const='',
+                           help='改为在保存的页面上比较直接扫描和DOM解析提取锚点的耗时，默认使用tests/fixtures')
+    benchmark.add_argument('--stage', choices=('parse', 'merge', 'events'),
+                           help='改为单独测量流水线的一个步骤，并与改写前的实现对比：parse为解析课表脚本的速度(行/秒)，'
+                                'merge为在--courses个TaskActivity的合成课表上合并跨年课程的耗时，'
+                                'events为在合成课表上计算日程时间和写出ics的速度(VEVENT/秒)')
+    benchmark.add_argument('--page', help='--stage parse使用的课表页面，默认为tests/fixtures/courseTable.html')
+    benchmark.add_argument('--sections', type=int, default=200, help='--stage merge时每门课程的教学班数')
+    benchmark.add_argument('--baseline', help='与该文件中保存的基线比较，有阶段变慢时退出码为1')
+    benchmark.add_argument('--save-baseline', help='将本次结果保存为基线')
+    benchmark.add_argument('--tolerance', type=float, default=0.2, help='允许比基线慢的比例')
+    benchmark.add_argument('--json', action='store_true', help='以JSON格式输出结果')
+    return parser
+
+
+def _commonOptions(args):
+    """
+    检查export和batch共用的选项
+    :return: (cache, sessionStore, requestPolicy, solver)，solver在未指定--captcha-model时为None
+    """
+    if not 0 <= args.alarm <= 120:
+        raise MyException(ErrorCode.INPUT_ERROR, '提醒时间只能为上课前0-120分钟')
+    if args.cache_only and not args.cache_dir:
+        raise MyException(ErrorCode.INPUT_ERROR, '离线模式需要通过--cache-dir指定缓存目录')
+    if args.retries < 0 or args.rate < 0:
+        raise MyException(ErrorCode.INPUT_ERROR, '重试次数和请求速率不能为负数')
+    cache = ResponseCache(args.cache_dir) if args.cache_dir else None
+    sessionStore = SessionStore(args.session_dir) if args.session_dir else None
+    from s2c_captcha import TemplateCaptchaSolver
+    solver = TemplateCaptchaSolver.load(args.captcha_model) if args.captcha_model else None
+    return cache, sessionStore, RequestPolicy(retries=args.retries, ratePerHost=args.rate), solver
+
+
+def exportMain(args):
+    """
+    export子命令
+    :return: 进程退出码
+    """
+    try:
+        cache, sessionStore, requestPolicy, solver = _commonOptions(args)
+        if args.file == '-' and args.json:
+            raise MyException(ErrorCode.INPUT_ERROR, '--json和--file -都使用标准输出，不能同时指定')
+        passwd = '' if args.cache_only else resolvePassword(args.password, args.username)
+        if solver:
+            from s2c_captcha import solveCaptcha
+            captchaProvider = lambda api: solveCaptcha(api, solver, args.min_confidence,  # noqa: E731
+                                                       fallback=promptCaptcha)
+        else:
+            captchaProvider = lambda api: promptCaptcha(api.getCaptha())  # noqa: E731
+        snapshot = {} if args.snapshot else None
+        result = export(args.username, passwd, args.year, args.term, args.alarm, args.def_time, args.split,
+                        args.output_dir, args.file,
+                        _stderrCaptchaProvider(captchaProvider) if args.json else captchaProvider,
+                        args.incremental, cache, args.cache_only, sessionStore, requestPolicy,
+                        progress=jsonLine if args.json else None, baseUrl=args.base_url, compactRRule=args.compact,
+                        snapshot=snapshot, exportFormat=args.format, expand=args.expand)
+    except MyException as e:
+        if args.json:
+            jsonLine({'event': 'result', 'status': BatchJob.FAILED, 'username': args.username,
+                      'errorCode': e.errorCode.errorcode, 'detail': str(e)})
+        else:
+            print('\n[异常]', e, file=sys.stderr)
+        return 1
+    finally:
+        if args.metrics:
+            defaultMetrics.save(args.metrics)
+
+    if args.json:
+        jsonLine({'event': 'result', 'status': BatchJob.SUCCEEDED, **result})
+    else:
+        # 写到标准输出时提示信息改为输出到标准错误
+        out = sys.stderr if args.file == '-' else sys.stdout
+        print('已导出%d个日程到%s' % (result['eventCount'], result['file']), file=out)
+        if result['diff']:
+            print(result['diff'], file=out)
+    if args.snapshot and not _saveSnapshotOption(args, snapshot):
+        return 1
+    return 0
+
+
+def _saveSnapshotOption(args, snapshot: dict):
+    """
+    export和batch结束后把获取的课表加入--snapshot指定的快照，失败时报告错误，已导出的文件不受影响
+    :param snapshot: {(学号, 学年, 学期): 课表}
+    :return: 是否保存成功
+    """
+    try:
+        saveSnapshot(args.snapshot, snapshot, update=True)
+    except MyException as e:
+        if args.json:
+            jsonLine({'event': 'snapshot', 'status': BatchJob.FAILED, 'file': args.snapshot,
+                      'errorCode': e.errorCode.errorcode, 'detail': str(e)})
+        else:
+            print('\n[异常]', e, file=sys.stderr)
+        return False
+    return True
+
+
+def _batchCaptchaProvider(solver: 's2c_captcha.CaptchaSolver', minConfidence: float, prompt: bool = True):
+    """
+    :param solver: 指定--captcha-model时的CaptchaSolver对象，None时总是在控制台输入
+    :param prompt: 是否允许在控制台输入，False时识别失败或没有solver就抛出异常
+    :return: 供runBatch和CalendarFeedServer使用的验证码获取函数 captchaProvider(suesApi, job) -> str
+    """
+    if solver is None:
+        return _consoleCaptchaProvider if prompt else _failingCaptchaProvider
+    from s2c_captcha import solveCaptcha
+
+    def captchaProvider(suesApi, job):
+        def fallback(capthaBytes):
+            with _consoleLock:
+                return promptCaptcha(capthaBytes, '\n请输入%s的验证码(图片另弹窗口):' % job.username)
+        return solveCaptcha(suesApi, solver, minConfidence, fallback=fallback if prompt else None)
+    return captchaProvider
+
+
+def batchMain(args):
+    """
+    batch子命令
+    :return: 进程退出码
+    """
+    try:
+        cache, sessionStore, requestPolicy, solver = _commonOptions(args)
+        _checkExportFormat(args.format, args.incremental, args.expand)
+        jobs = loadBatchManifest(args.manifest)
+    except MyException as e:
+        if args.json:
+            jsonLine({'event': 'summary', 'status': BatchJob.FAILED, 'errorCode': e.errorCode.errorcode,
+                      'detail': str(e)})
+        else:
+            print('\n[异常]', e, file=sys.stderr)
+        return 1
+
+    captchaProvider = _batchCaptchaProvider(solver, args.min_confidence)
+    snapshot = {} if args.snapshot else None
+    eventCache = EventCache(args.event_cache)
+    begin = time.perf_counter()
+    runBatch(jobs, args.workers, args.host_concurrency, args.alarm, args.def_time, args.split, args.output_dir,
+             _stderrCaptchaProvider(captchaProvider) if args.json else captchaProvider, args.incremental, cache,
+             args.cache_only, sessionStore, requestPolicy, jsonLine if args.json else None, args.base_url,
+             args.compact, snapshot, args.format, args.expand, eventCache)
+    totalElapsed = time.perf_counter() - begin
+    snapshotSaved = not snapshot or _saveSnapshotOption(args, snapshot)
+    stats = requestPolicy.stats()
+    succeeded = sum(job.status == BatchJob.SUCCEEDED for job in jobs)
+    if args.json:
+        jsonLine({'event': 'summary', 'jobs': len(jobs), 'succeeded': succeeded, 'failed': len(jobs) - succeeded,
+                  'elapsed': round(totalElapsed, 3), 'requests': stats, 'eventCache': eventCache.stats()})
+    else:
+        printBatchReport(jobs, totalElapsed)
+        print('HTTP请求%d次，重试%d次，失败%d次，熔断拒绝%d次，平均耗时%.3f秒' % (
+            stats['attempts'], stats['retried'], stats['failures'], stats['rejected'], stats['latencyAvg']))
+        _printEventCacheStats(eventCache)
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump([job.toDict() for job in jobs], f, ensure_ascii=False, indent=2)
+    if args.metrics:
+        defaultMetrics.save(args.metrics)
+    return 0 if succeeded == len(jobs) and snapshotSaved else 1
+
+
+def _printEventCacheStats(eventCache: EventCache):
+    stats = eventCache.stats()
+    if stats['hits'] + stats['misses']:
+        print('日程缓存命中%d次，未命中%d次，命中率%.1f%%' % (stats['hits'], stats['misses'], stats['hitRate'] * 100))
+
+
+def renderMain(args):
+    """
+    render子命令
+    :return: 进程退出码
+    """
+    def printResult(result):
+        if args.json:
+            jsonLine({'event': 'result', 'status': BatchJob.SUCCEEDED, **result})
+        else:
+            print('已导出%d个日程到%s' % (result['eventCount'], result['file']))
+            if result['diff']:
+                print(result['diff'])
+
+    begin = time.perf_counter()
+    eventCache = EventCache(args.event_cache)
+    try:
+        results = renderSnapshot(args.snapshot, args.output_dir, args.alarm, args.def_time, args.split,
+                                 args.incremental, args.compact, args.username, printResult, args.format,
+                                 args.expand, eventCache)
+    except MyException as e:
+        if args.json:
+            jsonLine({'event': 'summary', 'status': BatchJob.FAILED, 'errorCode': e.errorCode.errorcode,
+                      'detail': str(e)})
+        else:
+            print('\n[异常]', e, file=sys.stderr)
+        return 1
+    totalElapsed = time.perf_counter() - begin
+    if args.json:
+        jsonLine({'event': 'summary', 'files': len(results), 'elapsed': round(totalElapsed, 3),
+                  'eventCache': eventCache.stats()})
+    else:
+        print('共生成%d个文件，总耗时%.2f秒' % (len(results), totalElapsed))
+        _printEventCacheStats(eventCache)
+    return 0
+
+
+def _parseSlots(slotsStr: str):
+    """
+    :param slotsStr: 节次或节次范围(从1计数)，例:3 或 3-4
+    :return: 从0计数的节次range
+    """
+    match = re.fullmatch(r'(\d+)(?:-(\d+))?', slotsStr.strip())
+    if not match:
+        raise MyException(ErrorCode.INPUT_ERROR, '节次格式错误：' + slotsStr)
+    first = int(match.group(1))
+    last = int(match.group(2) or first)
+    if not 1 <= first <= last <= len(timetable):
+        raise MyException(ErrorCode.INPUT_ERROR, '节次只能为1-%d：%s' % (len(timetable), slotsStr))
+    return range(first - 1, last)
+
+
+def _courseDict(course: CourseInfo, weekOffset: int):
+    # analyze --json输出的教学班信息，周次为教学周，星期和节次从1计数
+    return {'courseId': course.courseId, 'courseName': course.courseName, 'teacherId': course.teacherId,
+            'teacherName': course.teacherName, 'roomId': course.roomId, 'roomName': course.roomName,
+            'day': course.day + 1, 'slots': [slot + 1 for slot in sorted(course.courses)],
+            'weeks': [week - weekOffset + 1
+                      for runBeg, runEnd in course.weeks.runs() for week in range(runBeg, runEnd)]}
+
+
+def _weekRanges(weeks):
+    # 教学周列表 -> '1-4,6,8-9'
+    ranges = []
+    for week in sorted(weeks):
+        if ranges and ranges[-1][1] == week - 1:
+            ranges[-1][1] = week
+        else:
+            ranges.append([week, week])
+    return ','.join(str(beg) if beg == end else '%d-%d' % (beg, end) for beg, end in ranges)
+
+
+def _courseLine(course: CourseInfo, weekOffset: int):
+    weeks = _weekRanges(week - weekOffset + 1 for runBeg, runEnd in course.weeks.runs() for week in range(runBeg, runEnd))
+    slots = sorted(course.courses)
+    return '%s %s\t%s周 星期%d %d-%d节\t%s' % (course.courseName, course.teacherName, weeks, course.day + 1,
+                                             slots[0] + 1, slots[-1] + 1, course.roomName)
+
+
+def analyzeMain(args):
+    """
+    analyze子命令，默认输出统计信息和所有重复安排
+    :return: 进程退出码
+    """
+    from s2c_occupancy import OccupancyIndex
+    begin = time.perf_counter()
+    try:
+        if args.year is None and args.term is None:
+            with CourseSnapshot(args.snapshot) as snapshot:
+                semesters = {key[1:] for key in snapshot.keys()}
+            if len(semesters) > 1:
+                raise MyException(ErrorCode.INPUT_ERROR, '快照中有多个学期的课表(%s)，请用--year和--term指定'
+                                  % '、'.join('%s第%s学期' % semester for semester in sorted(semesters)))
+        if args.free:
+            if not args.free[0].isdigit() or args.free[1] not in ('1', '2', '3', '4', '5', '6', '7'):
+                raise MyException(ErrorCode.INPUT_ERROR, '--free的周次应为正整数，星期应为1-7')
+            freeSlots = _parseSlots(args.free[2])
+        index = OccupancyIndex.fromSnapshot(args.snapshot, args.year, args.term)
+        calendarCount = 0
+        if args.calendars:
+            if not 0 <= args.alarm <= 120:
+                raise MyException(ErrorCode.INPUT_ERROR, '提醒时间只能为上课前0-120分钟')
+            for kind in (OccupancyIndex.ROOM, OccupancyIndex.TEACHER):
+                calendarCount += index.exportCalendars(kind, args.calendars, args.alarm, args.def_time, args.split,
+                                                       args.compact, args.format, args.expand)
+    except MyException as e:
+        print('\n[异常]', e, file=sys.stderr)
+        return 1
+    elapsed = time.perf_counter() - begin
+    weekOffset = int(index.header[1]) - 1
+
+    result = {'summary': index.summary(), 'elapsed': round(elapsed, 3)}
+    if args.free:
+        week, day = int(args.free[0]), int(args.free[1]) - 1
+        result['freeRooms'] = [{'roomId': roomId, 'roomName': index.names[OccupancyIndex.ROOM][roomId]}
+                               for roomId in index.freeRooms(week, day, freeSlots)]
+    resources = [(OccupancyIndex.ROOM, resourceId) for resourceId in args.room or ()]
+    resources += [(OccupancyIndex.TEACHER, resourceId) for resourceId in args.teacher or ()]
+    if resources:
+        result['resources'] = [{'kind': kind, 'id': resourceId, 'name': index.names[kind].get(resourceId),
+                                'courses': [_courseDict(course, weekOffset)
+                                            for course in index.resourceSections(kind, resourceId)]}
+                               for kind, resourceId in resources]
+    elif not args.free:
+        result['conflicts'] = [{'kind': conflict.kind, 'id': conflict.resourceId,
+                                'name': index.names[conflict.kind][conflict.resourceId],
+                                'courses': [_courseDict(conflict.first, weekOffset),
+                                            _courseDict(conflict.second, weekOffset)],
+                                'cells': [[week, day + 1, slot + 1] for week, day, slot in conflict.cells]}
+                               for conflict in index.conflicts()]
+    if args.calendars:
+        result['calendars'] = calendarCount
+
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False))
+        return 0
+    summary = result['summary']
+    print('%d个学生，%d个教学班(去重前%d个)，%d个教室，%d个教师，教室重复安排%d处，教师重复安排%d处，耗时%.2f秒' % (
+        summary['students'], summary['sections'], summary['enrolments'], summary['rooms'], summary['teachers'],
+        summary['roomConflicts'], summary['teacherConflicts'], elapsed))
+    if 'freeRooms' in result:
+        print('第%s周星期%s第%s节空闲的教室(%d个)：' % (args.free[0], args.free[1], args.free[2], len(result['freeRooms'])))
+        print(' '.join(room['roomName'] for room in result['freeRooms']))
+    for kind, resourceId in resources:
+        courses = index.resourceSections(kind, resourceId)
+        print('\n[%s %s %s] %d个教学班' % ('教室' if kind == OccupancyIndex.ROOM else '教师', resourceId,
+                                          index.names[kind].get(resourceId, '未知'), len(courses)))
+        for course in courses:
+            print('  ' + _courseLine(course, weekOffset))
+    for conflict in index.conflicts() if 'conflicts' in result else ():
+        cells = sorted({(day, slot) for _, day, slot in conflict.cells})
+        print('\n[%s冲突] %s 第%s周 %s' % ('教室' if conflict.kind == OccupancyIndex.ROOM else '教师',
+                                        index.names[conflict.kind][conflict.resourceId],
+                                        _weekRanges({week for week, _, _ in conflict.cells}),
+                                        ' '.join('星期%d第%d节' % (day + 1, slot + 1) for day, slot in cells)))
+        print('  ' + _courseLine(conflict.first, weekOffset))
+        print('  ' + _courseLine(conflict.second, weekOffset))
+    if args.calendars:
+        print('已生成%d个日历文件到%s' % (calendarCount, args.calendars))
+    return 0
+
+
+def serveMain(args):
+    """
+    serve子命令，在前台运行直到Ctrl+C
+    :return: 进程退出码
+    """
+    from s2c_feed import CalendarFeedServer
+    try:
+        cache, sessionStore, requestPolicy, solver = _commonOptions(args)
+        jobs = loadBatchManifest(args.manifest)
+    except MyException as e:
+        print('\n[异常]', e, file=sys.stderr)
+        return 1
+
+    server = CalendarFeedServer(jobs, args.host, args.port, args.refresh, args.alarm, args.def_time, args.split,
+                                _batchCaptchaProvider(solver, args.min_confidence, args.prompt_captcha), cache,
+                                args.cache_only, sessionStore, requestPolicy, args.base_url, compactRRule=args.compact,
+                                expand=args.expand).start()
+    print('日历订阅已在http://%s:%d/启动，Ctrl+C退出' % (server.host, server.port))
+    for feed in server.feeds.values():
+        print(feed.name, server.feedUrl(feed))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+        if args.metrics:
+            defaultMetrics.save(args.metrics)
+    return 0
+
+
+def captchaMain(args):
+    """
+    captcha子命令
+    :return: 进程退出码
+    """
+    from s2c_captcha import TemplateCaptchaSolver, collectCaptchas
+    try:
+        if args.captchaCommand == 'collect':
+            suesApi = SuesApi()
+            suesApi.newSession()
+            collectCaptchas(suesApi, args.dir, args.count)
+        elif args.captchaCommand == 'train':
+            solver = TemplateCaptchaSolver.train(args.dir, args.length)
+            solver.save(args.model)
+            print('样本库包含%d个字符样本，已保存到%s' % (len(solver.labels), args.model))
+        elif args.captchaCommand == 'eval':
+            stats = TemplateCaptchaSolver.load(args.model).evaluate(args.dir, args.min_confidence)
+            print('共%d张，准确率%.1f%%；置信度不低于%g的%d张，准确率%.1f%%；平均耗时%.2fms，P95 %.2fms' % (
+                stats['samples'], stats['accuracy'] * 100, args.min_confidence, stats['accepted'],
+                stats['acceptedAccuracy'] * 100, stats['latencyAvg'] * 1000, stats['latencyP95'] * 1000))
+        else:
+            _buildParser().parse_args(['captcha', '-h'])
+    except MyException as e:
+        print('\n[异常]', e, file=sys.stderr)
+        return 1
+    return 0
+
+
+def mockServerMain(args):
+    """
+    mock-server子命令，在前台运行直到Ctrl+C
+    :return: 进程退出码
+    """
+    from bench.mockjxxt import MockJxxtServer
+    server = MockJxxtServer(args.courses, latency=args.latency, failureRate=args.failure_rate, port=args.port).start()
+    print('模拟的教学管理系统已在%s启动，使用 --base-url %s 访问，Ctrl+C退出' % (server.baseUrl, server.baseUrl))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+    return 0
+
+
+def benchmarkMain(args):
+    """
+    benchmark子命令
+    :return: 进程退出码，与基线比较有阶段变慢时为1
+    """
+    if args.occupancy:
+        return _occupancyBenchmarkMain(args)
+    if args.extract is not None:
+        return _extractBenchmarkMain(args)
+    if args.stage:
+        return _stageBenchmarkMain(args)
+    from bench.pipeline import runBenchmark, compareBenchmark
+    result = runBenchmark(args.courses, args.rounds, args.latency, args.split, args.memory)
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = compareBenchmark(result, json.load(f), args.tolerance)
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2)
+
+    if args.json:
+        print(json.dumps(dict(result, regressions=[phase for phase, _, _ in regressions])))
+    else:
+        print('%d个TaskActivity，%d个日程，%d次取中位数' % (result['courses'], result['events'], result['rounds']))
+        for phase, seconds in result['phases'].items():
+            print('%-10s %10.2fms' % (phase, seconds * 1000))
+        print('%-10s %10.2fms' % ('total', sum(result['phases'].values()) * 1000))
+        for phase, peak in result.get('peakMemory', {}).items():
+            print('[峰值内存] %-10s %8.2fMB' % (phase, peak / 1024 / 1024))
+        for phase, base, seconds in regressions:
+            print('[退化] %s: %.2fms -> %.2fms' % (phase, base * 1000, seconds * 1000))
+    return 1 if regressions else 0
+
+
+def _extractBenchmarkMain(args):
+    """
+    benchmark --extract
+    :return: 进程退出码
+    """
+    from bench.extract import FIXTURE_DIR, runExtractBenchmark
+    try:
+        result = runExtractBenchmark(args.extract or FIXTURE_DIR, args.rounds, args.memory)
+    except OSError as e:
+        print('\n[异常]', MyException(ErrorCode.INPUT_ERROR, '页面读取失败\n' + str(e)), file=sys.stderr)
+        return 1
+    if args.json:
+        print(json.dumps(result))
+        return 0
+    for anchor, timings in result.items():
+        print('%-20s %8dB  直接扫描%10.2fus  DOM解析%10.2fus  %6.1fx' % (
+            anchor, timings['bytes'], timings['fast'] * 1000000, timings['dom'] * 1000000,
+            timings['dom'] / timings['fast'] if timings['fast'] else float('inf')))
+        if 'fastPeak' in timings:
+            print('%-20s %9s  峰值内存%8.1fKB  峰值内存%8.1fKB' % ('', '', timings['fastPeak'] / 1024,
+                                                           timings['domPeak'] / 1024))
+    return 0
+
+
+def _stageBenchmarkMain(args):
+    """
+    benchmark --stage
+    :return: 进程退出码
+    """
+    from bench import stages
+    if args.stage == 'events':
+        result = stages.runEventBenchmark(args.courses, args.rounds)
+        if args.json:
+            print(json.dumps(result))
+            return 0
+        print('%d个课程，%d个日程' % (result['courses'], result['events']))
+        for name in ('legacy', 'builder', 'ics'):
+            print('%-10s %10.2fms %12.0fVEVENT/秒' % (name, result[name] * 1000, result[name + 'EventsPerSec']))
+        return 0
+    if args.stage == 'merge':
+        result = stages.runMergeBenchmark(args.courses, args.sections, args.rounds)
+        if args.json:
+            print(json.dumps(result))
+            return 0
+        print('%d个TaskActivity，合并后%d个课程，每门课程%d个教学班' % (
+            result['records'], result['courses'], result['sectionsPerCourse']))
+        for name in ('legacy', 'indexed'):
+            print('%-10s %10.2fms' % (name, result[name] * 1000))
+        return 0
+
+    try:
+        scriptStr = stages.loadPageScript(args.page) if args.page else stages.loadPageScript()
+    except OSError as e:
+        print('\n[异常]', MyException(ErrorCode.INPUT_ERROR, '页面读取失败\n' + str(e)), file=sys.stderr)
+        return 1
+    if scriptStr is None:
+        print('\n[异常]', MyException(ErrorCode.INPUT_ERROR, '页面中没有课表脚本'), file=sys.stderr)
+        return 1
+    result = stages.runParseBenchmark(scriptStr, args.rounds)
+    if args.json:
+        print(json.dumps(result))
+        return 0
+    print('%d行，%d个TaskActivity' % (result['lines'], result['records']))
+    for name in ('legacy', 'tokenize', 'parse'):
+        print('%-10s %10.2fms %12.0f行/秒' % (name, result[name] * 1000, result[name + 'LinesPerSec']))
+    return 0
+
+
+def _occupancyBenchmarkMain(args):
+    """
+    benchmark --occupancy
+    :return: 进程退出码
+    """
+    from bench.pipeline import runOccupancyBenchmark
+    result = runOccupancyBenchmark(args.courses, args.students)
+    if args.json:
+        print(json.dumps(result))
+        return 0
+    print('%d个学生，%d个教学班(去重前%d个)，%d个教室，%d个教师' % (
+        result['students'], result['sections'], result['enrolments'], result['rooms'], result['teachers']))
+    print('%-16s %10.2fms' % ('build', result['build'] * 1000))
+    for name in ('occupancy', 'linearOccupancy', 'freeRooms'):
+        print('%-16s %10.2fus/次' % (name, result[name] * 1000000))
+    print('%-16s %10.2fms (%d处)' % ('conflicts', result['conflicts'] * 1000,
+                                     result['roomConflicts'] + result['teacherConflicts']))
+    return 0
+
+
+NOTIFICATION_URL = 'https://raw.githubusercontent.com/GammaPi/SUES-S2C-Tool/master/Notification.txt'
+
+
+def startNotificationFetch(timeout: float = 3):
+    """
+    在后台线程中获取Github上的更新提示，不阻塞程序启动
+    :param timeout: 请求超时时间(秒)
+    :return: (线程, 结果字典)，线程结束后结果字典的'text'为提示内容，获取失败时为None
+    """
+    result = {}
+
+    def fetch():
+        import requests
+        try:
+            result['text'] = requests.get(NOTIFICATION_URL, timeout=timeout).text
+        except requests.exceptions.RequestException:
+            result['text'] = None
+
+    thread = threading.Thread(target=fetch, name='notification', daemon=True)
+    thread.start()
+    return thread, result
+
+
+BANNER = '''
 ------------------------------------------------------------------------------
  ____  _   _ _____ ____      ____ ____   ____   _____           _ 
 / ___|| | | | ____/ ___|    / ___|___ \ / ___| |_   _|__   ___ | |
@@ -559,37 +3695,55 @@ if __name__ == '__main__':
 
 SUES 课表转iCalendar日程工具 by XtTech 
 源代码/Issue/贡献 https://github.com/GammaPi/SUES-S2C-Tool 如果觉得好用别忘记Star哦！
-------------------------------------------------------------------------------''')
+------------------------------------------------------------------------------'''
+
+
+def interactiveMain(args):
+    """
+    交互模式，按提示逐步输入
+    :return: 进程退出码
+    """
+    print(BANNER)
 
+    exitCode = 1
     # 1.get captha
     try:
-        print('连接Github获取更新提示中(最多3秒)...', end='', flush=True)
-        try:
-            r = requests.get('https://raw.githubusercontent.com/GammaPi/SUES-S2C-Tool/master/Notification.txt',
-                             timeout=3)
-            print('成功!')
-            print('\n', r.text, sep='')
-        except requests.exceptions.RequestException as e:  # This is the correct syntax
-            print('')
-            print('无法获取Github上的更新提示，建议您查看项目主页以确保软件最新，以免导出出错。')
+        sessionStore = SessionStore(args.session_dir) if args.session_dir else None
 
-        print('测试http://jxxt.sues.edu.cn是否能正常访问(最多10秒)...', end='', flush=True)
-        suesApi = SuesApi()
-        suesApi.newSession()
-        print('连接成功!')
+        # 更新提示在后台获取，与连接教学管理系统同时进行
+        notificationThread, notification = startNotificationFetch()
 
-        username = input('\n请输入学号:')
-        passwd = input("\n请输入密码:")
+        suesApi = SuesApi()
+        resumed = False
+        if sessionStore:
+            # 先尝试复用保存的会话，成功时不需要newSession的几次请求
+            username = input('\n请输入学号:')
+            passwd = input("\n请输入密码:")
+            resumed = suesApi.resumeSession(sessionStore, username, passwd)
+        if not resumed:
+            print('测试http://jxxt.sues.edu.cn是否能正常访问(最多10秒)...', end='', flush=True)
+            suesApi.newSession()
+            print('连接成功!')
+
+        notificationThread.join(timeout=0.5)
+        if notification.get('text'):
+            print('\n', notification['text'], sep='')
+        else:
+            print('无法获取Github上的更新提示，建议您查看项目主页以确保软件最新，以免导出出错。')
 
-        print('\n获取验证码中,验证码将在另外窗口中弹出...')
-        capthaBytes = suesApi.getCaptha()
-        i = Image.open(BytesIO(capthaBytes))
-        i = i.resize((i.size[0] * 4, i.size[1] * 4))
-        i.show('验证码')
+        if not sessionStore:
+            username = input('\n请输入学号:')
+            passwd = input("\n请输入密码:")
 
-        captcha = input('\n请输入验证码(图片另弹窗口):')
+        if resumed:
+            print('\n已复用上次保存的登录会话，无需输入验证码')
+        else:
+            print('\n获取验证码中,验证码将在另外窗口中弹出...')
+            captcha = promptCaptcha(suesApi.getCaptha())
 
-        suesApi.login(username, passwd, captcha)
+            suesApi.login(username, passwd, captcha)
+            if sessionStore:
+                sessionStore.save(suesApi, passwd)
 
         yearList = suesApi.getYears()
         print('')
@@ -637,10 +3791,14 @@ SUES 课表转iCalendar日程工具 by XtTech
             raise MyException(ErrorCode.INPUT_ERROR, '提醒时间只能为上课前0-120分钟')
 
         fileName = ''.join([username, '_', yearSelection, '学年_第', termSelection, '学期 课表导出.ics'])
+        writer = IncrementalIcsWriter(fileName) if args.incremental else None
         cvt2Caldav(startYear, allOccupyWeek, allStartWeek, allEndWeek, couseList,
-                   alarmTime, modifyDefTime, splitLargeEvent, fileName)
+                   alarmTime, modifyDefTime, splitLargeEvent, fileName, writer=writer)
         print('\n上面的内容是为了方便您与教学管理系统课表进行核对，产学合作等不在课表上的课程不会被添加！')
+        if writer:
+            print('与上次导出相比:', writer.diff)
         print('日历生成好了，快去导入吧！ ics文件位置在本程序根目录下，文件名为:' + fileName)
+        exitCode = 0
     except MyException as e:
         print('\n[异常]', e, file=sys.stderr)
         if DBG_MODE:
@@ -653,3 +3811,25 @@ SUES 课表转iCalendar日程工具 by XtTech
             raise e
 
     input('\n按回车键退出')
+    return exitCode
+
+
+def main(argv: list):
+    """
+    命令行入口，不带参数时进入交互模式
+    :param argv: 命令行参数(不含程序名)
+    :return: 进程退出码
+    """
+    if not argv:
+        argv = ['interactive']
+    args = _buildParser().parse_args(argv)
+    if args.command is None:
+        _buildParser().print_help()
+        return 2
+    return {'interactive': interactiveMain, 'export': exportMain, 'batch': batchMain, 'render': renderMain,
+            'analyze': analyzeMain, 'serve': serveMain, 'captcha': captchaMain, 'mock-server': mockServerMain,
+            'benchmark': benchmarkMain}[args.command](args)
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,56 @@
+# 测试直接导入仓库根目录下的sues_s2c和bench，不需要安装
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sues_s2c import SuesApi, RequestPolicy, HostConcurrencyLimiter, Metrics  # noqa: E402
+from bench.mockjxxt import MockJxxtServer  # noqa: E402
+
+
+@pytest.fixture
+def mockServer():
+    with MockJxxtServer(40) as server:
+        yield server
+
+
+@pytest.fixture
+def loginApi(mockServer):
+    """
+    :return: 在mockServer上登录的函数 loginApi(**SuesApi的参数) -> SuesApi，默认不重试、不熔断
+    """
+    def login(**kwargs):
+        kwargs.setdefault('requestPolicy', RequestPolicy(retries=0, breakerThreshold=0))
+        suesApi = SuesApi(HostConcurrencyLimiter(), verbose=False, baseUrl=mockServer.baseUrl, metrics=Metrics(),
+                          **kwargs)
+        suesApi.newSession()
+        suesApi.login('0123', 'pw', suesApi.getCaptha())
+        return suesApi
+    return login
+
+
+@pytest.fixture
+def icsOccurrences():
+    """
+    :return: 展开ics内容的函数 icsOccurrences(content) -> 排序后的[(摘要, 地点, 上课时间, 下课时间)]，
+             带RRULE的日程用dateutil展开并去掉EXDATE中的时间
+    """
+    from dateutil.rrule import rrulestr
+    from icalendar import Calendar
+
+    def expand(content: bytes):
+        occurrences = []
+        for event in Calendar.from_ical(content).walk('VEVENT'):
+            start, end = event.decoded('dtstart'), event.decoded('dtend')
+            starts = [start]
+            if 'rrule' in event:
+                exdates = event.get('exdate', [])
+                exdates = {dt.dt for item in (exdates if isinstance(exdates, list) else [exdates]) for dt in item.dts}
+                starts = [begin for begin in rrulestr(event['rrule'].to_ical().decode(), dtstart=start)
+                          if begin not in exdates]
+            occurrences.extend((str(event['summary']), str(event['location']), begin, begin + (end - start))
+                               for begin in starts)
+        return sorted(occurrences)
+    return expand
@@ -0,0 +1,99 @@
+# AsyncSuesApi：同时发出互不依赖的请求，结果与SuesApi相同，在有网络延迟的模拟系统上整体耗时更短
+import asyncio
+import time
+
+from sues_s2c import AsyncSuesApi, SuesApi, RequestPolicy, HostConcurrencyLimiter, Metrics
+from bench.mockjxxt import MockJxxtServer
+
+LATENCY = 0.1
+
+
+def apiOptions(server):
+    return dict(hostLimiter=HostConcurrencyLimiter(), verbose=False, baseUrl=server.baseUrl, metrics=Metrics(),
+                requestPolicy=RequestPolicy(retries=0, breakerThreshold=0))
+
+
+def serverCaptcha(server, api):
+    # checkCaptcha时登录需要服务器为该会话生成的验证码
+    return server.sessions[api.session.cookies['JSESSIONID']]['captcha']
+
+
+def blockingExport(server):
+    api = SuesApi(**apiOptions(server))
+    api.newSession()
+    api.getCaptha()
+    api.login('0123', 'pw', serverCaptcha(server, api))
+    yearStr = api.getYears()[0]
+    table = api.getCourseTable(yearStr, api.getTerms(yearStr)[0])
+    api.session.close()
+    return table
+
+
+async def asyncExport(server):
+    async with AsyncSuesApi(**apiOptions(server)) as api:
+        await api.newSession()
+        await api.getCaptha()
+        await api.login('0123', 'pw', serverCaptcha(server, api.api))
+        yearStr = (await api.getYears())[0]
+        return await api.getCourseTable(yearStr, (await api.getTerms(yearStr))[0])
+
+
+def timed(run):
+    begin = time.perf_counter()
+    result = run()
+    return result, time.perf_counter() - begin
+
+
+def tableKey(table):
+    startYear, occupyWeek, startWeek, endWeek, courses = table
+    return startYear, occupyWeek, startWeek, endWeek, [(c.courseId, c.day, c.courses, c.validweeks) for c in courses]
+
+
+def test_same_course_table_as_blocking():
+    with MockJxxtServer(40, checkCaptcha=True) as server:
+        assert tableKey(asyncio.run(asyncExport(server))) == tableKey(blockingExport(server))
+
+
+def test_session_requests_overlap():
+    async def run(server):
+        async with AsyncSuesApi(**apiOptions(server)) as api:
+            await api.newSession()
+            # engine.js和验证码同时到达服务器，预取的验证码属于同一个会话，可以用来登录
+            assert server.maxInFlight == 2
+            requestCount = server.requestCount
+            assert await api.getCaptha()
+            assert server.requestCount == requestCount
+            captcha = server.sessions[api.api.session.cookies['JSESSIONID']]['captcha']
+            await api.login('0123', 'pw', captcha)
+
+            server.maxInFlight = 0
+            years = await api.getYears()
+            await asyncio.sleep(LATENCY / 2)
+            assert server.maxInFlight == len(years)
+            # 学期列表已经在后台获取，不再发出请求
+            requestCount = server.requestCount
+            assert [await api.getTerms(yearStr) for yearStr in years] == [server.terms] * len(years)
+            assert server.requestCount == requestCount
+            assert api.api.username == '0123'
+
+    with MockJxxtServer(20, years=('2019-2020', '2018-2019', '2017-2018'), latency=LATENCY, checkCaptcha=True) \
+            as server:
+        asyncio.run(run(server))
+
+
+def test_export_wall_clock():
+    with MockJxxtServer(40, latency=LATENCY, checkCaptcha=True) as server:
+        blockingExport(server)  # 预热：加载requests_html、生成课表页面
+        _, blocking = timed(lambda: blockingExport(server))
+        _, overlapped = timed(lambda: asyncio.run(asyncExport(server)))
+
+        async def exportMany(count):
+            return await asyncio.gather(*(asyncExport(server) for _ in range(count)))
+        tables, concurrent = timed(lambda: asyncio.run(exportMany(4)))
+
+    # 一次导出要依次访问主页、engine.js、验证码、登录、教学年、学期、课表主页和课表，
+    # 同时获取engine.js和验证码省去一次往返；多个学生的导出在同一个事件循环中并行，总耗时接近一次导出
+    print('blocking %.3fs, async %.3fs, 4 concurrent async %.3fs' % (blocking, overlapped, concurrent))
+    assert overlapped < blocking - LATENCY / 4
+    assert concurrent < 2 * overlapped
+    assert len({len(table[4]) for table in tables}) == 1
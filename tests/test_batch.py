@@ -0,0 +1,94 @@
+# 批量导出：清单解析、按主机的并发限制和任务之间的错误隔离
+import json
+import os
+
+import pytest
+
+from sues_s2c import BatchJob, ErrorCode, MyException, RequestPolicy, loadBatchManifest, runBatch
+from bench.mockjxxt import MockJxxtServer
+
+
+def writeFile(path, content: str, encoding='utf-8'):
+    with open(path, 'w', encoding=encoding, newline='') as f:
+        f.write(content)
+    return str(path)
+
+
+def jobFields(jobs):
+    return [(job.username, job.passwordSource, job.year, job.term, job.fileName) for job in jobs]
+
+
+def test_csv_manifest(tmp_path):
+    # Excel保存的CSV带BOM，可以省略的列留空
+    path = writeFile(tmp_path / 'jobs.csv', 'username,password,year,term,fileName\r\n'
+                                            ' 0123 ,env:PW,2019-2020,1,a.ics\r\n'
+                                            '0456,file:pw.txt,,,\r\n', 'utf-8-sig')
+    assert jobFields(loadBatchManifest(path)) == [('0123', 'env:PW', '2019-2020', '1', 'a.ics'),
+                                                  ('0456', 'file:pw.txt', '', '', '')]
+
+
+def test_json_manifest(tmp_path):
+    path = writeFile(tmp_path / 'jobs.JSON', json.dumps([{'username': 123, 'password': 'pw', 'term': 2},
+                                                         {'username': '0456', 'password': 'prompt', 'year': None}]))
+    jobs = loadBatchManifest(path)
+    assert jobFields(jobs) == [('123', 'pw', '', '2', ''), ('0456', 'prompt', '', '', '')]
+    assert all(job.status == BatchJob.PENDING for job in jobs)
+
+
+@pytest.mark.parametrize('name, content, message', [
+    ('jobs.csv', 'username,password\r\n0123,pw\r\n0456,\r\n', '第2项缺少username或password'),
+    ('jobs.json', '[{"username": "0123"}]', '第1项缺少username或password'),
+    ('jobs.json', '[{"username": "0123", ', '读取失败'),
+])
+def test_bad_manifest(tmp_path, name, content, message):
+    with pytest.raises(MyException) as info:
+        loadBatchManifest(writeFile(tmp_path / name, content))
+    assert info.value.errorCode == ErrorCode.INPUT_ERROR and message in info.value.detail
+
+
+def test_missing_manifest(tmp_path):
+    with pytest.raises(MyException) as info:
+        loadBatchManifest(str(tmp_path / 'missing.csv'))
+    assert info.value.errorCode == ErrorCode.INPUT_ERROR
+
+
+def batch(server, jobs, outputDir, **kwargs):
+    events = []
+    runBatch(jobs, captchaProvider=lambda suesApi, job: 'abcd', outputDir=str(outputDir), progress=events.append,
+             requestPolicy=RequestPolicy(retries=0, breakerThreshold=0), baseUrl=server.baseUrl, **kwargs)
+    return events
+
+
+@pytest.mark.parametrize('hostConcurrency', [1, 2])
+def test_host_concurrency_cap(tmp_path, hostConcurrency):
+    with MockJxxtServer(20, latency=0.02) as server:
+        jobs = [BatchJob('%04d' % i, 'pw') for i in range(6)]
+        batch(server, jobs, tmp_path, workers=6, hostConcurrency=hostConcurrency)
+    assert [job.status for job in jobs] == [BatchJob.SUCCEEDED] * 6
+    assert 1 <= server.maxInFlight <= hostConcurrency
+
+
+def test_unlimited_concurrency_overlaps(tmp_path):
+    # 对照：不限制时6个任务的请求确实会同时到达服务器，上面的上限不是因为任务本身串行
+    with MockJxxtServer(20, latency=0.02) as server:
+        batch(server, [BatchJob('%04d' % i, 'pw') for i in range(6)], tmp_path, workers=6, hostConcurrency=0)
+    assert server.maxInFlight > 2
+
+
+def test_failed_jobs_do_not_affect_others(tmp_path, monkeypatch):
+    monkeypatch.delenv('S2C_MISSING_PASSWORD', raising=False)
+    jobs = [BatchJob('0001', 'right1'), BatchJob('0002', 'wrong'), BatchJob('0003', 'env:S2C_MISSING_PASSWORD'),
+            BatchJob('0004', 'right4', '2018-2019', '2', 'custom.ics')]
+    with MockJxxtServer(20, passwords={'0001': 'right1', '0002': 'right2', '0004': 'right4'}) as server:
+        events = batch(server, jobs, tmp_path, workers=4, hostConcurrency=2)
+
+    assert [job.status for job in jobs] == [BatchJob.SUCCEEDED, BatchJob.FAILED, BatchJob.FAILED,
+                                            BatchJob.SUCCEEDED]
+    assert '密码错误' in jobs[1].detail and 'S2C_MISSING_PASSWORD' in jobs[2].detail
+    assert jobs[0].year == '2019-2020' and jobs[0].term == '1' and jobs[0].eventCount > 0
+    assert jobs[3].fileName == 'custom.ics' and os.path.exists(str(tmp_path / 'custom.ics'))
+    assert sorted(os.listdir(str(tmp_path))) == sorted([jobs[0].fileName, 'custom.ics'])
+    # 每个任务结束时各有一条job记录，内容同BatchJob.toDict
+    jobEvents = sorted((event for event in events if event['event'] == 'job'), key=lambda event: event['username'])
+    assert [(event['username'], event['status']) for event in jobEvents] == \
+        [(job.username, job.status) for job in jobs]
@@ -0,0 +1,58 @@
+# benchmark子命令的基线保存和比较，性能测量本身见bench/
+import json
+import os
+
+import sues_s2c
+from bench.pipeline import BENCHMARK_PHASES, TimedIcsWriter, runBenchmark, compareBenchmark
+from bench.mockjxxt import generateCourseScript
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bench', 'baseline.json')
+
+
+def test_runBenchmark_phases():
+    result = runBenchmark(courseCount=40, rounds=1)
+    assert list(result['phases']) == list(BENCHMARK_PHASES) == \
+        ['session', 'login', 'fetch', 'parse', 'merge', 'build', 'write']
+    assert all(seconds > 0 for seconds in result['phases'].values())
+    assert result['courses'] == 40 and result['events'] > 0
+
+
+def test_timed_writer_output(tmp_path):
+    # 计时不改变写出的内容
+    scriptStr = generateCourseScript(40)
+    startYear, occupyWeek, startWeek, endWeek = sues_s2c.scanCourseTableHeader(scriptStr)
+    courses = list(sues_s2c.iterMergedCourses(sues_s2c.iterCourseRecords(scriptStr), occupyWeek, endWeek))
+    table = (startYear, occupyWeek, startWeek, endWeek, courses)
+    writer = TimedIcsWriter(str(tmp_path / 'timed.ics'))
+    sues_s2c.cvt2Caldav(*table, 15, False, False, None, verbose=False, writer=writer)
+    sues_s2c.cvt2Caldav(*table, 15, False, False, str(tmp_path / 'plain.ics'), verbose=False)
+    assert (tmp_path / 'timed.ics').read_bytes() == (tmp_path / 'plain.ics').read_bytes()
+    assert writer.writeSeconds > 0
+
+
+def test_committed_baseline():
+    with open(BASELINE_PATH, encoding='utf-8') as f:
+        baseline = json.load(f)
+    assert list(baseline['phases']) == list(BENCHMARK_PHASES)
+    assert compareBenchmark(baseline, baseline) == []
+
+
+def test_compareBenchmark_regressions():
+    baseline = {'phases': {'parse': 0.010, 'build': 0.020, 'fetch': 0.001}}
+    result = {'phases': {'parse': 0.020, 'build': 0.021, 'fetch': 0.0025, 'write': 0.5}}
+    # build在容忍范围内，fetch变慢的绝对值低于minDelta，基线中没有的阶段不比较
+    assert compareBenchmark(result, baseline, tolerance=0.2) == [('parse', 0.010, 0.020)]
+
+
+def test_benchmark_baseline_roundtrip(tmp_path, capsys):
+    baselinePath = str(tmp_path / 'baseline.json')
+    assert sues_s2c.main(['benchmark', '--courses', '40', '--rounds', '1', '--save-baseline', baselinePath]) == 0
+    with open(baselinePath, encoding='utf-8') as f:
+        baseline = json.load(f)
+    # 基线中每个阶段都放大很多，本次结果不会被判为退化
+    baseline['phases'] = {phase: seconds * 100 + 1 for phase, seconds in baseline['phases'].items()}
+    with open(baselinePath, 'w', encoding='utf-8') as f:
+        json.dump(baseline, f)
+    capsys.readouterr()
+    assert sues_s2c.main(['benchmark', '--courses', '40', '--rounds', '1', '--baseline', baselinePath, '--json']) == 0
+    assert json.loads(capsys.readouterr().out)['regressions'] == []
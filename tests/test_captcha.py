@@ -0,0 +1,111 @@
+# 验证码识别：在tests/fixtures/captcha的已标注样本上训练、识别和评估，solveCaptcha的重新获取和手动输入
+# 样本由MockJxxtServer.captchaImage生成(Pillow默认字体，字符可能粘连)，train和eval中的验证码不重复
+import os
+
+import pytest
+
+from sues_s2c import ErrorCode, MyException
+from s2c_captcha import CaptchaSolver, TemplateCaptchaSolver, solveCaptcha
+from bench.extract import FIXTURE_DIR
+
+TRAIN_DIR = os.path.join(FIXTURE_DIR, 'captcha', 'train')
+EVAL_DIR = os.path.join(FIXTURE_DIR, 'captcha', 'eval')
+
+
+@pytest.fixture(scope='module')
+def solver():
+    return TemplateCaptchaSolver.train(TRAIN_DIR)
+
+
+def test_train(solver):
+    samples = TemplateCaptchaSolver.loadLabelled(TRAIN_DIR)
+    # 切分出的字符数与标注不一致的图片被跳过，其余每张图提供4个字符样本
+    assert len(samples) == 80 and 0 < len(solver.labels) <= 4 * len(samples) and len(solver.labels) % 4 == 0
+    assert solver.templates.shape == (len(solver.labels), 12 * 16)
+    label, capthaBytes = samples[0]
+    assert solver.solve(capthaBytes) == (label, pytest.approx(1.0, abs=1e-3))
+
+
+def test_evaluate(solver):
+    result = solver.evaluate(EVAL_DIR, minConfidence=0.3)
+    assert result['samples'] == 30
+    assert result['accuracy'] >= 0.6
+    # 拒绝低置信度的结果后准确率更高，被拒绝的验证码实际使用时会重新获取
+    assert result['accepted'] < result['samples'] and result['acceptedAccuracy'] >= 0.85
+    assert 0 < result['latencyAvg'] <= result['latencyP95']
+    assert solver.evaluate(EVAL_DIR)['accepted'] == 30
+
+
+def test_save_and_load(solver, tmp_path):
+    path = str(tmp_path / 'model.npz')
+    solver.save(path)
+    loaded = TemplateCaptchaSolver.load(path)
+    assert (loaded.length, loaded.k, list(loaded.labels)) == (solver.length, solver.k, list(solver.labels))
+    samples = TemplateCaptchaSolver.loadLabelled(EVAL_DIR)
+    assert [loaded.solve(b) for _, b in samples] == [solver.solve(b) for _, b in samples]
+
+
+def test_bad_input(solver, tmp_path):
+    # 不是图片(如被重定向到错误页)时置信度为0
+    assert solver.solve(b'<html></html>') == ('', 0.0)
+    assert TemplateCaptchaSolver().solve(TemplateCaptchaSolver.loadLabelled(EVAL_DIR)[0][1]) == ('', 0.0)
+    with pytest.raises(MyException) as info:
+        TemplateCaptchaSolver.train(str(tmp_path))
+    assert info.value.errorCode == ErrorCode.INPUT_ERROR
+    (tmp_path / 'model.npz').write_bytes(b'not a model')
+    with pytest.raises(MyException) as info:
+        TemplateCaptchaSolver.load(str(tmp_path / 'model.npz'))
+    assert info.value.errorCode == ErrorCode.INPUT_ERROR
+
+
+class FakeApi:
+    """
+    依次返回images中的验证码
+    """
+
+    def __init__(self, images):
+        self.images = list(images)
+        self.fetches = 0
+
+    def getCaptha(self):
+        self.fetches += 1
+        return self.images.pop(0)
+
+
+class FakeSolver(CaptchaSolver):
+    """
+    验证码图像即为 '结果:置信度'
+    """
+
+    def solve(self, capthaBytes):
+        text, confidence = capthaBytes.decode().split(':')
+        return text, float(confidence)
+
+
+def test_refetch_on_low_confidence():
+    api = FakeApi([b'ab12:0.1', b'cd34:0.2', b'ef56:0.9', b'gh78:0.9'])
+    assert solveCaptcha(api, FakeSolver(), minConfidence=0.3, maxFetches=3) == 'ef56'
+    assert api.fetches == 3
+
+
+def test_fallback_after_max_fetches():
+    api = FakeApi([b'ab12:0.1', b'cd34:0.2', b'ef56:0.9'])
+    prompted = []
+    assert solveCaptcha(api, FakeSolver(), 0.3, maxFetches=2,
+                        fallback=lambda capthaBytes: prompted.append(capthaBytes) or 'typed') == 'typed'
+    # 只有最后一张验证码有效，手动输入时显示的是它
+    assert api.fetches == 2 and prompted == [b'cd34:0.2']
+
+    with pytest.raises(MyException) as info:
+        solveCaptcha(FakeApi([b'ab12:0.1']), FakeSolver(), 0.3, maxFetches=1)
+    assert info.value.errorCode == ErrorCode.CAPTCHA_FETCH_ERROR
+
+
+def test_real_solver_with_fallback(solver):
+    # 训练样本识别的置信度接近1，直接返回；eval中置信度为0的样本交给手动输入
+    samples = dict(TemplateCaptchaSolver.loadLabelled(EVAL_DIR))
+    confident = [(label, b) for label, b in samples.items() if solver.solve(b) == (label, pytest.approx(1.0, abs=1e-3))]
+    rejected = [b for b in samples.values() if solver.solve(b)[1] == 0.0]
+    assert confident and rejected
+    assert solveCaptcha(FakeApi([rejected[0], confident[0][1]]), solver, 0.3) == confident[0][0]
+    assert solveCaptcha(FakeApi(rejected[:2]), solver, 0.3, maxFetches=2, fallback=lambda b: 'typed') == 'typed'
@@ -0,0 +1,85 @@
+# export/batch子命令：--json时标准输出只有JSON记录，验证码提示写到标准错误，--snapshot保存失败时报告错误
+import builtins
+import json
+import os
+
+import pytest
+
+import sues_s2c
+from bench.mockjxxt import MockJxxtServer
+
+
+@pytest.fixture
+def captchaServer(monkeypatch):
+    """
+    检查验证码的模拟系统；控制台输入验证码时从服务器读取正确的验证码，输入提示像input一样写到sys.stdout
+    """
+    with MockJxxtServer(40, passwords={'0123': 'pw', '0456': 'pw'}, checkCaptcha=True) as server:
+        def fakeInput(prompt=''):
+            print(prompt, end='')
+            return [session['captcha'] for session in server.sessions.values() if session['captcha']][-1]
+        from PIL import Image
+        monkeypatch.setattr(Image.Image, 'show', lambda self, title=None: None)
+        monkeypatch.setattr(builtins, 'input', fakeInput)
+        monkeypatch.setenv('S2C_TEST_PASSWORD', 'pw')
+        yield server
+
+
+def exportArgs(server, tmp_path, *extra):
+    return ['export', '--username', '0123', '--password', 'env:S2C_TEST_PASSWORD', '--base-url', server.baseUrl,
+            '--retries', '0', '--output-dir', str(tmp_path), *extra]
+
+
+def jsonRecords(out: str):
+    return [json.loads(line) for line in out.splitlines()]
+
+
+def test_export_json_lines(captchaServer, tmp_path, capsys):
+    assert sues_s2c.main(exportArgs(captchaServer, tmp_path, '--json')) == 0
+    captured = capsys.readouterr()
+    records = jsonRecords(captured.out)
+    assert '请输入验证码' in captured.err and '请输入验证码' not in captured.out
+    assert [record['event'] for record in records][-1] == 'result'
+    assert {'login', 'courseTable'} <= {record['event'] for record in records}
+    result = records[-1]
+    assert result['status'] == sues_s2c.BatchJob.SUCCEEDED and result['eventCount'] > 0
+    assert (result['year'], result['term']) == ('2019-2020', '1')
+    assert os.path.exists(result['file']) and os.path.dirname(result['file']) == str(tmp_path)
+
+
+def test_export_json_failure(captchaServer, tmp_path, capsys, monkeypatch):
+    monkeypatch.setenv('S2C_TEST_PASSWORD', 'wrong')
+    assert sues_s2c.main(exportArgs(captchaServer, tmp_path, '--json')) == 1
+    result = jsonRecords(capsys.readouterr().out)[-1]
+    assert (result['event'], result['status'], result['username']) == ('result', sues_s2c.BatchJob.FAILED, '0123')
+    assert result['errorCode'] == sues_s2c.ErrorCode.LOGIN_ERROR.errorcode and '密码错误' in result['detail']
+
+
+def test_export_snapshot_error(captchaServer, tmp_path, capsys):
+    # 快照路径是目录，无法读写；已导出的文件保留，另外报告快照错误
+    snapshotPath = tmp_path / 'snapshot'
+    snapshotPath.mkdir()
+    assert sues_s2c.main(exportArgs(captchaServer, tmp_path, '--json', '--snapshot', str(snapshotPath))) == 1
+    result, snapshot = jsonRecords(capsys.readouterr().out)[-2:]
+    assert result['event'] == 'result' and result['status'] == sues_s2c.BatchJob.SUCCEEDED
+    assert os.path.exists(result['file'])
+    assert (snapshot['event'], snapshot['status'], snapshot['file']) == \
+        ('snapshot', sues_s2c.BatchJob.FAILED, str(snapshotPath))
+    assert snapshot['errorCode'] == sues_s2c.ErrorCode.INPUT_ERROR.errorcode
+
+
+def test_batch_snapshot_error(captchaServer, tmp_path, capsys):
+    manifest = tmp_path / 'jobs.csv'
+    manifest.write_text('username,password\n0123,env:S2C_TEST_PASSWORD\n0456,pw\n', encoding='utf-8')
+    snapshotPath = tmp_path / 'snapshot'
+    snapshotPath.mkdir()
+    assert sues_s2c.main(['batch', str(manifest), '--base-url', captchaServer.baseUrl, '--workers', '1',
+                          '--output-dir', str(tmp_path), '--snapshot', str(snapshotPath)]) == 1
+    captured = capsys.readouterr()
+    assert '快照读取失败' in captured.err
+    assert '成功2个' in captured.out
+
+
+def test_legacy_batch_flag_removed(tmp_path):
+    with pytest.raises(SystemExit):
+        sues_s2c.main(['--batch', str(tmp_path / 'jobs.csv')])
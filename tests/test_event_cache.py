@@ -0,0 +1,117 @@
+# 日程片段缓存：LRU淘汰和命中统计，多线程共享，不能使用缓存的情况，以及使用缓存时导出的内容逐字节相同
+import io
+import threading
+
+import pytest
+
+from sues_s2c import (scanCourseTableHeader, iterCourseRecords, iterMergedCourses, cvt2Caldav, EventCache,
+                      IncrementalIcsWriter, CourseInfo, Metrics)
+from bench.mockjxxt import generateCourseScript
+
+
+def courseTable(courseCount, **options):
+    scriptStr = generateCourseScript(courseCount, **options)
+    startYear, occupyWeek, startWeek, endWeek = scanCourseTableHeader(scriptStr)
+    return (startYear, occupyWeek, startWeek, endWeek,
+            list(iterMergedCourses(iterCourseRecords(scriptStr), occupyWeek, endWeek)))
+
+
+def exportBytes(table, exportFormat='ics', alarmTime=15, **kwargs):
+    stream = io.BytesIO()
+    cvt2Caldav(*table, alarmTime, True, False, stream, verbose=False, exportFormat=exportFormat, **kwargs)
+    return stream.getvalue()
+
+
+def lookups(cache):
+    return cache.hits + cache.misses
+
+
+def test_lru_eviction_and_counts():
+    metrics = Metrics()
+    cache = EventCache(2, metrics)
+    cache.put(b'a', b'A', 1)
+    cache.put(b'b', b'B', 2)
+    assert cache.get(b'a') == (b'A', 1)
+    # a刚被使用，加入c时淘汰最久没有使用的b
+    cache.put(b'c', b'C', 3)
+    assert cache.get(b'b') is None
+    assert cache.get(b'a') == (b'A', 1) and cache.get(b'c') == (b'C', 3)
+    # 更新已有的键不淘汰其它条目
+    cache.put(b'c', b'CC', 4)
+    assert cache.get(b'c') == (b'CC', 4)
+    assert cache.stats() == {'hits': 4, 'misses': 1, 'evictions': 1, 'entries': 2, 'hitRate': 0.8}
+    assert metrics.toDict()['counters'] == {'event_cache_requests{result="hit"}': 4,
+                                            'event_cache_requests{result="miss"}': 1, 'event_cache_evictions': 1}
+    assert EventCache(metrics=Metrics()).stats()['hitRate'] == 0.0
+
+
+def test_key():
+    def block(roomName='A101'):
+        return CourseInfo('T1', '教师', 'C1', '课程', '7', roomName, '0' * 35 + '1' * 16, 0, (0, 1))
+    options = ('2019', '36', 15, True, False, False, 'IcsStreamWriter')
+    # 内容相同的不同对象共用缓存；任何字段或选项不同时键不同
+    assert EventCache.key(block(), options) == EventCache.key(block(), options)
+    assert EventCache.key(block('B202'), options) != EventCache.key(block(), options)
+    assert EventCache.key(block(), options[:2] + (30,) + options[3:]) != EventCache.key(block(), options)
+
+
+def test_thread_safety():
+    metrics = Metrics()
+    cache = EventCache(16, metrics)
+    keys = [bytes([i]) for i in range(32)]
+
+    def work(seed):
+        for i in range(2000):
+            key = keys[(seed * 7 + i) % len(keys)]
+            if cache.get(key) is None:
+                cache.put(key, key * 2, 1)
+    threads = [threading.Thread(target=work, args=(seed,)) for seed in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats = cache.stats()
+    assert stats['hits'] + stats['misses'] == 16000 and stats['entries'] == 16
+    counters = metrics.toDict()['counters']
+    assert counters['event_cache_requests{result="hit"}'] == stats['hits']
+    assert counters['event_cache_requests{result="miss"}'] == stats['misses']
+    assert all(cache.get(key) in (None, (key * 2, 1)) for key in keys)
+
+
+@pytest.mark.parametrize('exportFormat', ['ics', 'csv', 'json'])
+def test_cached_output_is_identical(exportFormat):
+    table = courseTable(60)
+    expected = exportBytes(table, exportFormat)
+    cache = EventCache(metrics=Metrics())
+    assert exportBytes(table, exportFormat, eventCache=cache) == expected
+    cold = cache.stats()
+    assert cold['hits'] == 0 and cold['misses'] == cold['entries'] > 0
+    assert exportBytes(table, exportFormat, eventCache=cache) == expected
+    assert cache.hits == cold['misses']
+    # 选项不同的导出不使用之前的条目
+    assert exportBytes(table, exportFormat, alarmTime=30, eventCache=cache) == exportBytes(table, exportFormat, 30)
+    assert cache.hits == cold['misses'] and cache.stats()['entries'] == 2 * cold['entries']
+    # 缓存太小时不断淘汰，结果仍然相同
+    small = EventCache(3, Metrics())
+    assert exportBytes(table, exportFormat, eventCache=small) == expected
+    assert small.evictions == cold['misses'] - 3
+
+
+def test_bypass(tmp_path, capsys):
+    table = courseTable(30)
+    cache = EventCache(metrics=Metrics())
+    # 输出每个日程的调试信息时
+    cvt2Caldav(*table, 15, True, False, io.BytesIO(), verbose=True, eventCache=cache)
+    assert '正在添加日程' in capsys.readouterr().out
+    # 展开上课时间、jCal(日程之间的逗号取决于位置)
+    exportBytes(table, 'csv', expand=True, eventCache=cache)
+    exportBytes(table, 'jcal', eventCache=cache)
+    # 增量导出
+    writer = IncrementalIcsWriter(str(tmp_path / 'a.ics'))
+    cvt2Caldav(*table, 15, True, False, None, verbose=False, writer=writer, eventCache=cache)
+    assert writer.eventCount > 0
+    assert lookups(cache) == 0 and cache.stats()['entries'] == 0
+    # 上限为0时不缓存
+    disabled = EventCache(0, Metrics())
+    assert exportBytes(table, eventCache=disabled) == exportBytes(table)
+    assert lookups(disabled) == 0
@@ -0,0 +1,55 @@
+# 日程时间：iterCourseEvents查表计算的上课、下课和重复截止时间与改写前逐个解析上课时间的结果一致
+import pytest
+
+from sues_s2c import (scanCourseTableHeader, iterCourseRecords, iterMergedCourses, iterCourseBlocks, iterCourseEvents,
+                      _firstWeekTime)
+from bench.legacy import legacyParseCourseScript, legacyMergeCourses, legacySplitCourses, legacyIterEventTimes
+from bench.mockjxxt import generateCourseScript
+from bench.stages import runEventBenchmark
+
+
+@pytest.mark.parametrize('modifyDEFTime', [False, True])
+@pytest.mark.parametrize('splitCourse', [False, True])
+@pytest.mark.parametrize('startYear', [2019, 2023])
+def test_same_times_as_legacy(modifyDEFTime, splitCourse, startYear):
+    # 2023年1月1日是周日，第一周的日期需要顺延
+    scriptStr = generateCourseScript(300, startYear=startYear)
+    startYear, occupyWeek, _, endWeek = scanCourseTableHeader(scriptStr)
+    courses = list(iterMergedCourses(iterCourseRecords(scriptStr), occupyWeek, endWeek))
+    legacyCourses = legacyMergeCourses(legacyParseCourseScript(scriptStr)[4], occupyWeek, endWeek)
+    if splitCourse:
+        legacyCourses = legacySplitCourses(legacyCourses)
+
+    events = [(event.uid, event.dtstart, event.dtend, event.rrule['until'])
+              for event in iterCourseEvents(iterCourseBlocks(courses, splitCourse), occupyWeek,
+                                            _firstWeekTime(startYear, occupyWeek), 15, modifyDEFTime)]
+    assert events == list(legacyIterEventTimes(legacyCourses, startYear, occupyWeek, modifyDEFTime))
+
+
+def test_event_benchmark():
+    result = runEventBenchmark(courseCount=60, rounds=1)
+    assert result['courses'] == 60 and result['events'] > result['courses']
+    assert result['legacyEventsPerSec'] > 0 and result['builderEventsPerSec'] > 0 and result['icsEventsPerSec'] > 0
+
+
+def test_hand_written_times():
+    from datetime import datetime
+    from sues_s2c import CourseInfo
+    courses = [
+        # 星期日(6)算在一周的第一天；DEF楼第3-4节使用DEF楼的时间；只上一周时重复截止于当天
+        CourseInfo('1', '教师', 'C1', '课程', '7', 'D201', '0' * 35 + '1' + '0' * 17, 6, (2, 3)),
+        # 到第5节的课不使用DEF楼的时间
+        CourseInfo('1', '教师', 'C2', '课程', '7', 'D201', '0' * 35 + '1' + '0' * 17, 0, (2, 3, 4)),
+        # 合并后的跨年课程从当年9月连续上到下一年1月
+        CourseInfo('1', '教师', 'C3', '课程', '7', 'A101', '0' * 35 + '1' * 18 + '11' + '0' * 51, 2, (12, 13))]
+    # 比较北京时间的钟点，与系统是否有Beijing时区数据无关
+    events = [tuple(time.replace(tzinfo=None) for time in (event.dtstart, event.dtend, event.rrule['until']))
+              for event in iterCourseEvents(iterCourseBlocks(courses, False), '36', _firstWeekTime('2019', '36'), 15,
+                                            True)]
+    assert events == [(datetime(2019, 9, 1, 10, 25), datetime(2019, 9, 1, 11, 55), datetime(2019, 9, 1, 11, 55)),
+                      (datetime(2019, 9, 2, 10, 5), datetime(2019, 9, 2, 13, 45), datetime(2019, 9, 2, 13, 45)),
+                      (datetime(2019, 9, 4, 16, 30), datetime(2019, 9, 4, 18, 0), datetime(2020, 1, 15, 18, 0))]
+
+
+def test_no_courses():
+    assert list(iterCourseEvents(iterCourseBlocks([], True), '36', _firstWeekTime('2019', '36'), 15, True)) == []
@@ -0,0 +1,105 @@
+# 展开上课时间：expandOccurrences/--expand写出的每次上课与dateutil展开RRULE得到的上课时间完全相同
+import io
+import json
+
+import pytest
+
+from sues_s2c import (scanCourseTableHeader, iterCourseRecords, iterMergedCourses, cvt2Caldav, expandOccurrences,
+                      writeOccurrences, IcsMemoryWriter, EXPORTERS, CourseInfo)
+from bench.mockjxxt import generateCourseScript
+
+
+def courseTable(courseCount, **options):
+    scriptStr = generateCourseScript(courseCount, **options)
+    startYear, occupyWeek, startWeek, endWeek = scanCourseTableHeader(scriptStr)
+    return (startYear, occupyWeek, startWeek, endWeek,
+            list(iterMergedCourses(iterCourseRecords(scriptStr), occupyWeek, endWeek)))
+
+
+def exportIcs(table, splitCourse, modifyDEFTime, expand):
+    writer = IcsMemoryWriter()
+    cvt2Caldav(*table, 15, modifyDEFTime, splitCourse, None, verbose=False, writer=writer, expand=expand)
+    return writer.content
+
+
+@pytest.mark.parametrize('modifyDEFTime', [False, True])
+@pytest.mark.parametrize('splitCourse', [False, True])
+@pytest.mark.parametrize('options', [{}, {'startYear': 2023, 'seed': 2}])
+def test_expanded_ics_matches_rrule(icsOccurrences, modifyDEFTime, splitCourse, options):
+    table = courseTable(60, **options)
+    expanded = exportIcs(table, splitCourse, modifyDEFTime, True)
+    occurrences = icsOccurrences(expanded)
+    assert b'RRULE' not in expanded
+    assert occurrences == icsOccurrences(exportIcs(table, splitCourse, modifyDEFTime, False))
+    # 每次上课一个日程，UID在日历内唯一
+    uids = [line for line in expanded.splitlines() if line.startswith(b'UID:')]
+    assert len(uids) == len(set(uids)) == len(occurrences)
+
+
+@pytest.mark.parametrize('exportFormat', ['csv', 'json'])
+def test_expanded_records_match_rrule(icsOccurrences, exportFormat):
+    table = courseTable(60)
+    stream = io.BytesIO()
+    cvt2Caldav(*table, 15, True, True, stream, verbose=False, exportFormat=exportFormat, expand=True)
+    lines = stream.getvalue().decode('utf-8').splitlines()
+    if exportFormat == 'csv':
+        import csv
+        records = list(csv.DictReader(lines))
+        assert lines[0].split(',') == list(EXPORTERS['csv'].COLUMNS)
+    else:
+        records = [json.loads(line) for line in lines]
+    assert all(not record['rrule'] for record in records)
+    assert sorted((record['summary'], record['location'], record['start'], record['end']) for record in records) == \
+        [(summary, location, start.isoformat(), end.isoformat())
+         for summary, location, start, end in icsOccurrences(exportIcs(table, True, True, False))]
+
+
+def test_multiple_tables_in_one_pass(icsOccurrences):
+    # 不同学年、不同教学周的课表一起展开
+    tables = [courseTable(40), courseTable(40, startYear=2023, seed=1),
+              courseTable(40, startYear=2020, occupyWeek=8, endWeek=18, seed=2)]
+    occurrences = expandOccurrences(tables, modifyDEFTime=True)
+    assert len(occurrences.starts) == len(occurrences.ends) == len(occurrences.blockIndex)
+    for tableIndex, table in enumerate(tables):
+        writer = IcsMemoryWriter()
+        with writer:
+            writeOccurrences(occurrences, writer, 15, tableIndex)
+        assert icsOccurrences(writer.content) == icsOccurrences(exportIcs(table, False, True, False))
+
+
+def test_no_courses():
+    occurrences = expandOccurrences([])
+    assert occurrences.blocks == [] and len(occurrences.starts) == 0
+    # 空课表和没有上课周的课程格子不产生日程，仍写出完整的文件
+    empty = ('2019', '36', '1', '18', [CourseInfo('T1', '教师', 'C1', '课程', '7', 'A101', '0' * 53, 0, (0, 1))])
+    for table in (empty[:4] + ([],), empty):
+        writer = IcsMemoryWriter()
+        with writer:
+            assert writeOccurrences(expandOccurrences([table]), writer, 15) == 0
+        assert writer.content == b'BEGIN:VCALENDAR\r\nEND:VCALENDAR\r\n'
+
+
+def test_hand_written_occurrences(icsOccurrences):
+    from datetime import datetime
+    courses = [
+        # 只上第1周；课程名中的%不影响模板替换
+        CourseInfo('T1', '教师', 'C1', '100%课程', '7', 'A101', '0' * 35 + '1' + '0' * 17, 0, (0, 1)),
+        # UID过长被折行时逐个生成日程
+        CourseInfo('T1', '教师', 'C2' * 40, '长课程', '7', 'A101', '0' * 35 + '11' + '0' * 16, 0, (2, 3))]
+    table = ('2019', '36', '1', '18', courses)
+    writer = IcsMemoryWriter()
+    with writer:
+        assert writeOccurrences(expandOccurrences([table]), writer, 15) == 3
+    assert icsOccurrences(writer.content) == [
+        ('100%课程 教师', 'A101', datetime(2019, 9, 2, 8, 15), datetime(2019, 9, 2, 9, 45)),
+        ('长课程 教师', 'A101', datetime(2019, 9, 2, 10, 5), datetime(2019, 9, 2, 11, 35)),
+        ('长课程 教师', 'A101', datetime(2019, 9, 9, 10, 5), datetime(2019, 9, 9, 11, 35))]
+    assert b'UID:C17001-20190902T081500\r\n' in writer.content
+    assert icsOccurrences(writer.content) == icsOccurrences(exportIcs(table, False, False, False))
+
+    stream = io.BytesIO()
+    cvt2Caldav(*table, 15, False, False, stream, verbose=False, exportFormat='json', expand=True)
+    records = [json.loads(line) for line in stream.getvalue().decode('utf-8').splitlines()]
+    assert [(record['uid'], record['start'], record['end']) for record in records][0] == \
+        ('C17001-2019-09-02T08:15:00', '2019-09-02T08:15:00', '2019-09-02T09:45:00')
+    assert len(records) == 3 and len({record['uid'] for record in records}) == 3
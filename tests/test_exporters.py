@@ -0,0 +1,167 @@
+# 流式导出：ics与改写前一次序列化整个Calendar的内容逐字节相同，各格式写到文件、流和socket的内容相同，峰值内存与课程数无关
+# 另外用手写的日程检查空课表和含逗号、引号、换行的课程名在各格式中的转义
+import csv
+import gc
+import io
+import json
+import socket
+import threading
+import tracemalloc
+
+import pytest
+
+from sues_s2c import (scanCourseTableHeader, iterCourseRecords, iterMergedCourses, cvt2Caldav, EXPORTERS, EventCache,
+                      IcsMemoryWriter, Metrics, CalendarEvent)
+from bench.legacy import legacyParseCourseScript, legacyMergeCourses, legacySplitCourses, legacyIcs
+from bench.mockjxxt import generateCourseScript
+
+
+def courseTable(courseCount, **options):
+    scriptStr = generateCourseScript(courseCount, **options)
+    startYear, occupyWeek, startWeek, endWeek = scanCourseTableHeader(scriptStr)
+    return (startYear, occupyWeek, startWeek, endWeek,
+            list(iterMergedCourses(iterCourseRecords(scriptStr), occupyWeek, endWeek)))
+
+
+def export(table, output, exportFormat='ics', splitCourse=False, **kwargs):
+    return cvt2Caldav(*table, 15, True, splitCourse, output, verbose=False, exportFormat=exportFormat, **kwargs)
+
+
+def exportBytes(table, exportFormat='ics', **kwargs):
+    stream = io.BytesIO()
+    export(table, stream, exportFormat, **kwargs)
+    return stream.getvalue()
+
+
+@pytest.mark.parametrize('splitCourse', [False, True])
+def test_ics_matches_legacy_calendar(tmp_path, splitCourse):
+    scriptStr = generateCourseScript(120)
+    startYear, occupyWeek, _, endWeek = scanCourseTableHeader(scriptStr)
+    legacyCourses = legacyMergeCourses(legacyParseCourseScript(scriptStr)[4], occupyWeek, endWeek)
+    if splitCourse:
+        legacyCourses = legacySplitCourses(legacyCourses)
+    expected = legacyIcs(legacyCourses, startYear, occupyWeek, 15, True)
+
+    table = courseTable(120)
+    assert exportBytes(table, splitCourse=splitCourse) == expected
+    writer = IcsMemoryWriter()
+    export(table, None, splitCourse=splitCourse, writer=writer)
+    assert writer.content == expected
+    # 不流式写出时仍在Calendar对象中构建整个日历，结果相同
+    path = str(tmp_path / 'a.ics')
+    export(table, path, splitCourse=splitCourse, streamOutput=False)
+    with open(path, 'rb') as f:
+        assert f.read() == expected
+
+
+@pytest.mark.parametrize('exportFormat', sorted(EXPORTERS))
+def test_same_bytes_for_every_output(tmp_path, exportFormat):
+    table = courseTable(60)
+    expected = exportBytes(table, exportFormat)
+
+    path = str(tmp_path / ('a' + EXPORTERS[exportFormat].EXTENSION))
+    export(table, path, exportFormat)
+    with open(path, 'rb') as f:
+        assert f.read() == expected
+
+    # 通过socket写出，另一端读到连接关闭为止
+    sender, receiver = socket.socketpair()
+    received = []
+    reader = threading.Thread(target=lambda: received.append(receiver.makefile('rb').read()))
+    reader.start()
+    with sender.makefile('wb') as stream:
+        export(table, stream, exportFormat)
+    sender.close()
+    reader.join(10)
+    receiver.close()
+    assert received == [expected]
+
+    if EXPORTERS[exportFormat].CACHEABLE:
+        cache = EventCache(metrics=Metrics())
+        assert exportBytes(table, exportFormat, eventCache=cache) == expected
+        assert exportBytes(table, exportFormat, eventCache=cache) == expected
+
+
+def test_formats_describe_same_events():
+    from icalendar import Calendar
+    table = courseTable(60)
+    ics = [(str(event['uid']), event.decoded('dtstart').isoformat(), event.decoded('dtend').isoformat(),
+            event['rrule'].to_ical().decode()) for event in Calendar.from_ical(exportBytes(table)).walk('VEVENT')]
+
+    jcal = json.loads(exportBytes(table, 'jcal'))
+    assert [tuple(prop[3] for prop in event[1] if prop[0] in ('uid', 'dtstart', 'dtend')) for event in jcal[2]] == \
+        [event[:3] for event in ics]
+    records = [json.loads(line) for line in exportBytes(table, 'json').decode('utf-8').splitlines()]
+    assert [(record['uid'], record['start'], record['end'], record['rrule']) for record in records] == ics
+    rows = list(csv.DictReader(io.StringIO(exportBytes(table, 'csv').decode('utf-8'))))
+    assert rows == [{key: str(value) for key, value in record.items()} for record in records]
+
+
+def test_peak_memory_is_flat(tmp_path):
+    def peak(courseCount):
+        table = courseTable(courseCount)
+        gc.collect()
+        tracemalloc.start()
+        try:
+            export(table, str(tmp_path / 'a.ics'))
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    # 第一次导出包含导入模块等一次性的分配
+    peak(5)
+    # 课程数增加到8倍，写出的峰值内存基本不变
+    assert peak(400) < peak(50) * 1.5
+
+
+@pytest.mark.parametrize('exportFormat, expected', [
+    ('ics', b'BEGIN:VCALENDAR\r\nEND:VCALENDAR\r\n'),
+    ('jcal', b'["vcalendar",[],[]]\n'),
+    ('csv', b'uid,summary,location,start,end,rrule,exdates,alarmMinutes\r\n'),
+    ('json', b'')])
+def test_empty_course_list(exportFormat, expected):
+    # 没有课程时只有文件头和文件尾，仍是完整的文件
+    table = courseTable(1)[:4] + ([],)
+    assert exportBytes(table, exportFormat) == expected
+    stream = io.BytesIO()
+    with EXPORTERS[exportFormat](stream):
+        pass
+    assert stream.getvalue() == expected and not stream.closed
+
+
+def test_hand_written_events():
+    from datetime import datetime, timedelta
+    from icalendar import Calendar
+    # 课程名和教室中有逗号、分号、引号和换行
+    events = [CalendarEvent('C1', '高等数学,A;"上"\n第二行', datetime(2019, 9, 2, 8, 15), datetime(2019, 9, 2, 9, 45),
+                            'A101,北', {'freq': 'weekly', 'count': 4, 'interval': 2}, (datetime(2019, 9, 16, 8, 15),),
+                            '高等数学 A101', timedelta(minutes=-15)),
+              CalendarEvent('C2', '体育', datetime(2019, 9, 3, 13, 0), datetime(2019, 9, 3, 14, 30), '操场',
+                            {'freq': 'weekly', 'until': datetime(2019, 12, 31, 14, 30)}, (), '体育 操场',
+                            timedelta(minutes=-5))]
+    outputs = {}
+    for exportFormat, exporter in EXPORTERS.items():
+        stream = io.BytesIO()
+        with exporter(stream) as writer:
+            for event in events:
+                writer.writeEvent(event)
+        assert writer.eventCount == 2
+        outputs[exportFormat] = stream.getvalue()
+
+    icsEvents = Calendar.from_ical(outputs['ics']).walk('VEVENT')
+    assert [(str(event['summary']), str(event['location'])) for event in icsEvents] == \
+        [(event.summary, event.location) for event in events]
+    assert icsEvents[0]['rrule'].to_ical() == b'FREQ=WEEKLY;COUNT=4;INTERVAL=2'
+    # jCal的日程之间有且只有一个逗号
+    jcal = json.loads(outputs['jcal'])
+    assert [[prop[3] for prop in event[1] if prop[0] == 'summary'] for event in jcal[2]] == \
+        [[event.summary] for event in events]
+    assert jcal[2][0][1][-1] == ['exdate', {}, 'date-time', '2019-09-16T08:15:00']
+    assert jcal[2][1][1][-1] == ['rrule', {}, 'recur', {'freq': 'WEEKLY', 'until': '2019-12-31T14:30:00'}]
+    records = [json.loads(line) for line in outputs['json'].decode('utf-8').splitlines()]
+    assert records[0] == {'uid': 'C1', 'summary': events[0].summary, 'location': 'A101,北',
+                          'start': '2019-09-02T08:15:00', 'end': '2019-09-02T09:45:00',
+                          'rrule': 'FREQ=WEEKLY;COUNT=4;INTERVAL=2', 'exdates': '2019-09-16T08:15:00',
+                          'alarmMinutes': 15}
+    assert records[1]['alarmMinutes'] == 5 and records[1]['exdates'] == ''
+    rows = list(csv.DictReader(io.StringIO(outputs['csv'].decode('utf-8'), newline='')))
+    assert rows == [{key: str(value) for key, value in record.items()} for record in records]
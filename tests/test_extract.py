@@ -0,0 +1,57 @@
+# PageScanner直接扫描与DOM解析在保存的页面上结果相同，页面结构不对时抛出MyException，见bench/extract.py
+import os
+
+import pytest
+
+import sues_s2c
+from sues_s2c import ErrorCode, MyException, SuesApi, PageScanner
+from bench.extract import FIXTURE_DIR, EXTRACT_ANCHORS, runExtractBenchmark
+
+
+def readFixture(name):
+    with open(os.path.join(FIXTURE_DIR, name), 'rb') as f:
+        return f.read()
+
+
+def dom(content):
+    import requests_html
+    return requests_html.HTML(html=content)
+
+
+@pytest.mark.parametrize('anchor, fileName, scan, domFind', EXTRACT_ANCHORS)
+def test_fast_path_matches_dom(anchor, fileName, scan, domFind):
+    content = readFixture(fileName)
+    fast = scan(content)
+    assert fast is not None
+    if anchor == 'taskActivityScript':
+        # DOM返回的是整个<script>元素，比较解析结果
+        fastRecords = list(sues_s2c.iterCourseRecords(fast))
+        domScript = domFind(dom(content))
+        assert sues_s2c.scanCourseTableHeader(fast) == sues_s2c.scanCourseTableHeader(domScript)
+        assert len(fastRecords) == len(list(sues_s2c.iterCourseRecords(domScript))) > 0
+    else:
+        assert fast == domFind(dom(content))
+
+
+@pytest.mark.parametrize('fileName', ['loginPage.html', 'unavailable.html', 'loginError.html'])
+def test_wrong_page_extracts_none(fileName):
+    content = readFixture(fileName)
+    for scan, domFind in ((PageScanner.semesterId, SuesApi._domSemesterId),
+                          (PageScanner.courseFrameSrc, SuesApi._domCourseFrameSrc)):
+        assert scan(content) is None and domFind(dom(content)) is None
+
+
+def test_logged_out_course_table_raises(mockServer, loginApi):
+    suesApi = loginApi()
+    for session in mockServer.sessions.values():
+        session['user'] = None
+    with pytest.raises(MyException) as info:
+        suesApi.getCourseTable('2019-2020', '1')
+    assert info.value.errorCode == ErrorCode.COURSE_FETCH_ERROR
+    assert suesApi.extractPaths['semesterId'] == 'dom'
+
+
+def test_fast_path_is_faster():
+    result = runExtractBenchmark(rounds=5)
+    for anchor, timings in result.items():
+        assert timings['fast'] < timings['dom'], anchor
@@ -0,0 +1,99 @@
+# CalendarFeedServer在会话过期、意外错误和需要验证码时的表现
+import builtins
+import threading
+
+import pytest
+import requests
+
+import s2c_feed
+import sues_s2c
+from sues_s2c import BatchJob, ErrorCode, MyException, RequestPolicy
+from s2c_feed import CalendarFeedServer
+from s2c_captcha import CaptchaSolver
+
+
+@pytest.fixture
+def feedServer(mockServer):
+    server = CalendarFeedServer([BatchJob('0123', 'pw', '2019-2020', '1', 'alice')], port=0, refreshInterval=0,
+                                captchaProvider=lambda suesApi, job: '1234', baseUrl=mockServer.baseUrl,
+                                requestPolicy=RequestPolicy(retries=0, breakerThreshold=0))
+    with server:
+        yield server
+
+
+def feedGet(server):
+    return requests.get('http://127.0.0.1:%d/feeds/alice.ics' % server.port, timeout=10)
+
+
+def test_expired_session_is_renewed(mockServer, feedServer):
+    feed = feedServer.feeds['alice']
+    first = feedGet(feedServer)
+    assert first.status_code == 200 and first.content.startswith(b'BEGIN:VCALENDAR')
+    for session in mockServer.sessions.values():
+        session['user'] = None
+    assert feedServer.refresh(feed) is False
+    assert feed.error == '' and feed.suesApi.isSessionValid()
+
+
+def test_unexpected_error_returns_503(monkeypatch, feedServer):
+    def broken(*args, **kwargs):
+        raise RuntimeError('broken')
+    monkeypatch.setattr(s2c_feed, 'cvt2Caldav', broken)
+    r = feedGet(feedServer)
+    assert r.status_code == 503 and 'RuntimeError: broken' in r.text
+    monkeypatch.undo()
+    assert feedGet(feedServer).status_code == 200
+
+
+def test_refresh_loop_survives_errors(monkeypatch, mockServer):
+    calls = []
+    recovered = threading.Event()
+    original = s2c_feed.cvt2Caldav
+
+    def flaky(*args, **kwargs):
+        calls.append(1)
+        if len(calls) == 1:
+            raise RuntimeError('broken')
+        recovered.set()
+        return original(*args, **kwargs)
+    monkeypatch.setattr(s2c_feed, 'cvt2Caldav', flaky)
+    server = CalendarFeedServer([BatchJob('0123', 'pw', '2019-2020', '1', 'alice')], port=0, refreshInterval=0.05,
+                                captchaProvider=lambda suesApi, job: '1234', baseUrl=mockServer.baseUrl)
+    feed = server.feeds['alice']
+    with server:
+        assert recovered.wait(10)
+        # 等待这次刷新结束
+        with feed.lock:
+            assert feed.content is not None and feed.error == ''
+
+
+def test_default_captcha_provider_does_not_prompt(monkeypatch, mockServer):
+    # 后台服务默认不在控制台等待输入，需要验证码时该订阅返回503
+    def noInput(prompt=''):
+        raise AssertionError('不应读取控制台')
+    monkeypatch.setattr(builtins, 'input', noInput)
+    server = CalendarFeedServer([BatchJob('0123', 'pw', '2019-2020', '1', 'alice')], port=0, refreshInterval=0,
+                                baseUrl=mockServer.baseUrl, requestPolicy=RequestPolicy(retries=0, breakerThreshold=0))
+    with server:
+        r = feedGet(server)
+    assert r.status_code == 503 and '--prompt-captcha' in r.text
+    assert server.feeds['alice'].error
+
+
+def test_serve_captcha_provider(monkeypatch):
+    class LowConfidenceSolver(CaptchaSolver):
+        def solve(self, capthaBytes):
+            return '1234', 0.1
+
+    class FakeApi:
+        def getCaptha(self):
+            return b''
+    job = BatchJob('0123', 'pw')
+    monkeypatch.setattr(sues_s2c, 'promptCaptcha', lambda capthaBytes, prompt: 'typed')
+    for solver in (None, LowConfidenceSolver()):
+        with pytest.raises(MyException) as info:
+            sues_s2c._batchCaptchaProvider(solver, 0.3, prompt=False)(FakeApi(), job)
+        assert info.value.errorCode == ErrorCode.CAPTCHA_FETCH_ERROR
+    # --prompt-captcha时识别失败再手动输入
+    assert sues_s2c._batchCaptchaProvider(LowConfidenceSolver(), 0.3, prompt=True)(FakeApi(), job) == 'typed'
+    assert sues_s2c._batchCaptchaProvider(None, 0.3, prompt=True) is sues_s2c._consoleCaptchaProvider
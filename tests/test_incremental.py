@@ -0,0 +1,114 @@
+# 增量导出：IncrementalIcsWriter按UID比较上次导出的文件，变化的日程SEQUENCE加1，消失的日程标记为取消，没有变化时不重写文件
+import os
+from datetime import datetime, timedelta
+
+from sues_s2c import CalendarEvent, IncrementalIcsWriter
+
+
+def event(uid, location='A101', hour=8):
+    start = datetime(2019, 9, 2, hour, 15)
+    return CalendarEvent(uid, '课程 教师', start, start + timedelta(minutes=90), location,
+                         {'freq': 'weekly', 'until': start + timedelta(weeks=17)}, (), '课程 ' + location,
+                         timedelta(minutes=-15))
+
+
+def export(path, events):
+    writer = IncrementalIcsWriter(str(path))
+    for e in events:
+        writer.writeEvent(e)
+    writer.close()
+    assert writer.eventCount == len(events)
+    return writer.diff
+
+
+def calendar(path):
+    """
+    :return: UID -> (SEQUENCE, STATUS, LOCATION)
+    """
+    with open(str(path), 'rb') as f:
+        content = f.read().decode('utf-8')
+    assert content.startswith('BEGIN:VCALENDAR\r\n') and content.endswith('END:VCALENDAR\r\n')
+    result = {}
+    for block in content.split('BEGIN:VEVENT\r\n')[1:]:
+        props = {}
+        for line in block.replace('\r\n ', '').split('\r\n'):
+            name, _, value = line.partition(':')
+            props.setdefault(name, value)
+        result[props['UID']] = (int(props.get('SEQUENCE', 0)), props.get('STATUS'), props['LOCATION'])
+    return result
+
+
+def test_first_export(tmp_path):
+    path = tmp_path / 'a.ics'
+    diff = export(path, [event('u1'), event('u2')])
+    assert (diff.added, diff.changed, diff.removed, diff.unchanged, diff.written) == (['u1', 'u2'], [], [], 0, True)
+    assert calendar(path) == {'u1': (0, None, 'A101'), 'u2': (0, None, 'A101')}
+
+
+def test_added_and_changed(tmp_path):
+    path = tmp_path / 'a.ics'
+    export(path, [event('u1'), event('u2')])
+    diff = export(path, [event('u1'), event('u2', location='B202'), event('u3')])
+    assert (diff.added, diff.changed, diff.removed, diff.unchanged) == (['u3'], ['u2'], [], 1)
+    assert calendar(path) == {'u1': (0, None, 'A101'), 'u2': (1, None, 'B202'), 'u3': (0, None, 'A101')}
+    # 再次修改时在上次的SEQUENCE上加1
+    export(path, [event('u1'), event('u2', hour=10), event('u3')])
+    assert calendar(path)['u2'] == (2, None, 'A101')
+
+
+def test_removed_cancelled_and_reappearing(tmp_path):
+    path = tmp_path / 'a.ics'
+    export(path, [event('u1'), event('u2', location='B202')])
+    export(path, [event('u1', location='C303'), event('u2', location='B202')])
+
+    diff = export(path, [event('u2', location='B202')])
+    assert (diff.added, diff.changed, diff.removed, diff.unchanged) == ([], [], ['u1'], 1)
+    # 取消的日程保留上次的内容，SEQUENCE加1
+    assert calendar(path) == {'u1': (2, 'CANCELLED', 'C303'), 'u2': (0, None, 'B202')}
+
+    # 以前取消的日程原样保留，不再算作本次取消；文件中只有一个STATUS
+    diff = export(path, [event('u2', location='B202'), event('u3')])
+    assert (diff.added, diff.removed) == (['u3'], [])
+    assert calendar(path)['u1'] == (2, 'CANCELLED', 'C303')
+    with open(str(path), 'rb') as f:
+        assert f.read().count(b'STATUS:') == 1
+
+    # 重新出现的日程即使内容与取消前相同也算作修改，去掉STATUS并且SEQUENCE加1
+    diff = export(path, [event('u1', location='C303'), event('u2', location='B202'), event('u3')])
+    assert (diff.added, diff.changed, diff.removed) == ([], ['u1'], [])
+    assert calendar(path)['u1'] == (3, None, 'C303')
+
+
+def test_no_change_keeps_file(tmp_path):
+    path = tmp_path / 'a.ics'
+    export(path, [event('u1'), event('u2')])
+    os.utime(str(path), (1000000000, 1000000000))
+    with open(str(path), 'rb') as f:
+        content = f.read()
+
+    writer = IncrementalIcsWriter(str(path))
+    for e in [event('u2'), event('u1')]:
+        writer.writeEvent(e)
+    writer.close()
+    writer.close()
+    assert not writer.diff.hasChanges() and not writer.diff.written and writer.bytesWritten == 0
+    assert writer.diff.unchanged == 2
+    assert os.stat(str(path)).st_mtime == 1000000000
+    with open(str(path), 'rb') as f:
+        assert f.read() == content
+
+
+def test_abort_keeps_previous_file(tmp_path):
+    path = tmp_path / 'a.ics'
+    export(path, [event('u1'), event('u2')])
+    with open(str(path), 'rb') as f:
+        content = f.read()
+
+    writer = IncrementalIcsWriter(str(path))
+    writer.writeEvent(event('u3'))
+    writer.abort()
+    writer.close()
+    assert writer.diff.added == ['u3'] and not writer.diff.written
+    with open(str(path), 'rb') as f:
+        assert f.read() == content
+    assert os.listdir(str(tmp_path)) == ['a.ics']
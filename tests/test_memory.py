@@ -0,0 +1,66 @@
+# 用tracemalloc测量课程记录和切分日程的内存，与bench/legacy中改写前的实现对比
+import gc
+import os
+import tracemalloc
+
+import pytest
+
+from sues_s2c import iterCourseRecords, iterCourseBlocks, iterMergedCourses, scanCourseTableHeader, cvt2Caldav
+from bench.legacy import legacyParseCourseScript, legacySplitCourses
+from bench.mockjxxt import generateCourseScript
+
+
+def traced(build):
+    """
+    :return: build()的结果, 结束时仍被占用的字节数, 峰值字节数
+    """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = build()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, current, peak
+
+
+@pytest.fixture(scope='module')
+def script():
+    return generateCourseScript(3000)
+
+
+def test_course_records_are_smaller(script):
+    courses, courseBytes, _ = traced(lambda: list(iterCourseRecords(script)))
+    legacyCourses, legacyBytes, _ = traced(lambda: legacyParseCourseScript(script)[4])
+    assert len(courses) == len(legacyCourses)
+    # 两者保存的字符串相同，差别在__slots__、WeekSet和整数的星期、节次
+    assert courseBytes / len(courses) < legacyBytes / len(legacyCourses) * 0.9
+
+
+def test_split_views_do_not_copy_courses(script):
+    courses = list(iterCourseRecords(script))
+    legacyCourses = legacyParseCourseScript(script)[4]
+    blocks, blockBytes, _ = traced(lambda: list(iterCourseBlocks(courses, True)))
+    legacyBlocks, legacyBytes, _ = traced(lambda: legacySplitCourses(legacyCourses))
+    assert len(blocks) == len(legacyBlocks) > len(courses)
+    assert [block.courses for block in blocks] == [tuple(map(int, block.courses)) for block in legacyBlocks]
+    # CourseSlice只引用原课程，不复制其__dict__
+    assert blockBytes < legacyBytes / 3
+
+
+def test_split_export_allocations(tmp_path):
+    script = generateCourseScript(200)
+    startYear, occupyWeek, startWeek, endWeek = scanCourseTableHeader(script)
+    courses = list(iterMergedCourses(iterCourseRecords(script), occupyWeek, endWeek))
+    fileName = str(tmp_path / 'a.ics')
+
+    def export(splitCourse):
+        return cvt2Caldav(startYear, occupyWeek, startWeek, endWeek, courses, 15, False, splitCourse, fileName,
+                          verbose=False)
+    # 第一次导出包含导入模块等一次性的分配
+    export(True)
+    wholeEvents, _, wholePeak = traced(lambda: export(False))
+    splitEvents, _, splitPeak = traced(lambda: export(True))
+    assert splitEvents > wholeEvents and os.path.getsize(fileName) > 0
+    # 切分的日程是逐个产生的视图，导出的峰值内存与不切分时相当
+    assert splitPeak < wholePeak * 1.5
@@ -0,0 +1,61 @@
+# 跨年课程合并：iterMergedCourses按mergeKey索引的合并与改写前逐个比较的合并结果一致
+import pytest
+
+from sues_s2c import (scanCourseTableHeader, iterCourseRecords, iterMergedCourses, iterCourseBlocks, iterCourseEvents,
+                      _firstWeekTime)
+from bench.legacy import legacyParseCourseScript, legacyMergeCourses
+from bench.mockjxxt import generateCourseScript
+from bench.stages import runMergeBenchmark
+
+
+def fields(course):
+    return (course.teacherId, course.courseId, course.roomId, str(course.validweeks), int(course.day),
+            tuple(int(i) for i in course.courses))
+
+
+@pytest.mark.parametrize('options', [{}, {'sectionsPerCourse': 1}, {'sectionsPerCourse': 150},
+                                     {'occupyWeek': 1, 'endWeek': 18}, {'occupyWeek': 40, 'endWeek': 22, 'seed': 5}])
+def test_same_result_as_legacy(options):
+    scriptStr = generateCourseScript(900, **options)
+    _, occupyWeek, _, endWeek = scanCourseTableHeader(scriptStr)
+    merged = list(iterMergedCourses(iterCourseRecords(scriptStr), occupyWeek, endWeek))
+    legacy = legacyMergeCourses(legacyParseCourseScript(scriptStr)[4], occupyWeek, endWeek)
+    assert [fields(course) for course in merged] == [fields(course) for course in legacy]
+
+
+def test_merge_benchmark():
+    result = runMergeBenchmark(courseCount=300, sectionsPerCourse=50, rounds=1)
+    # 五分之一的课程跨年，被拆成两个TaskActivity后重新合并
+    assert result['records'] == 360 and result['courses'] == 300
+    assert result['legacy'] > 0 and result['indexed'] > 0
+
+
+def crossYearScript(wrapUnits):
+    # 同一教学班同一天的课程跨年，被拆成当年(第1-2节)和下一年(wrapUnits)两个TaskActivity
+    main = '0' * 35 + '1' * 18
+    wrap = '11' + '0' * 51
+    lines = ['var table0 = new CourseTable(2019,98);']
+    for weeks, units in ((main, (0, 1)), (wrap, wrapUnits)):
+        lines.append('activity = new TaskActivity("1","教师","C1(C1.01)","课程(C1.01)","7","A101","%s");' % weeks)
+        lines.extend('index =2*unitCount+%d;' % unit for unit in units)
+    lines.append('table0.marshalTable(36,1,20);')
+    return '\r\n'.join(lines)
+
+
+def test_same_slots_are_merged():
+    merged = list(iterMergedCourses(iterCourseRecords(crossYearScript((0, 1))), '36', '20'))
+    assert [(course.courses, course.validweeks) for course in merged] == \
+        [((0, 1), '0' * 35 + '1' * 18 + '11' + '0' * 51)]
+
+
+def test_different_slots_stay_separate():
+    # 改写前不比较节次，会把下一年第5-6节的两周并到第1-2节上；现在输出两个课程，各自保留原来的节次
+    scriptStr = crossYearScript((4, 5))
+    merged = list(iterMergedCourses(iterCourseRecords(scriptStr), '36', '20'))
+    assert [(course.courses, course.validweeks) for course in merged] == \
+        [((0, 1), '0' * 35 + '1' * 18), ((4, 5), '0' * 53 + '11' + '0' * 51)]
+    legacy = legacyMergeCourses(legacyParseCourseScript(scriptStr)[4], '36', '20')
+    assert [course.courses for course in legacy] == [['0', '1']]
+    # 没有合并的下一年部分仍然排在下一年，而不是当年1月
+    events = iterCourseEvents(iterCourseBlocks(merged, False), '36', _firstWeekTime('2019', '36'), 15, False)
+    assert [(event.dtstart.year, event.dtstart.month) for event in events] == [(2019, 9), (2020, 1)]
@@ -0,0 +1,107 @@
+# Metrics：计数器和计时器的汇总、toDict/toPrometheus的输出，以及getCourseTable分别记录的解析和合并耗时
+import json
+import threading
+
+import pytest
+
+from sues_s2c import Metrics, _timedIter
+
+
+def test_counters_and_timers():
+    metrics = Metrics()
+    metrics.count('http_requests', endpoint='login.action', status='200')
+    metrics.count('http_requests', 2, status='200', endpoint='login.action')  # 标签顺序不影响
+    metrics.count('http_requests', endpoint='login.action', status='500')
+    metrics.count('ics_events', 10)
+    metrics.record('phase', 0.5, phase='fetch')
+    metrics.record('phase', 0.25, phase='fetch')
+    with pytest.raises(ValueError):
+        with metrics.timer('phase', phase='parse'):
+            raise ValueError()
+    assert metrics.counters == {('http_requests', (('endpoint', 'login.action'), ('status', '200'))): 3,
+                                ('http_requests', (('endpoint', 'login.action'), ('status', '500'))): 1,
+                                ('ics_events', ()): 10}
+    assert metrics.timers[('phase', (('phase', 'fetch'),))] == [2, 0.75, 0.5]
+    # 抛出异常的块也被记录
+    assert metrics.timers[('phase', (('phase', 'parse'),))][0] == 1
+
+    metrics.reset()
+    assert metrics.counters == {} and metrics.timers == {}
+
+
+def test_toDict():
+    metrics = Metrics()
+    metrics.count('ics_events', 3)
+    metrics.count('http_requests', endpoint='a', status='200')
+    metrics.record('phase', 0.5, phase='merge')
+    metrics.record('phase', 1.5, phase='merge')
+    assert metrics.toDict() == {
+        'counters': {'http_requests{endpoint="a",status="200"}': 1, 'ics_events': 3},
+        'timers': {'phase{phase="merge"}': {'count': 2, 'sum': 2.0, 'max': 1.5}}}
+
+
+def test_toPrometheus():
+    metrics = Metrics()
+    metrics.count('http_requests', endpoint='a', status='200')
+    metrics.count('http_requests', endpoint='b"\\\n', status='error')
+    metrics.record('phase', 0.5, phase='parse')
+    metrics.record('phase', 0.25, phase='merge')
+    assert metrics.toPrometheus() == (
+        '# TYPE sues_s2c_http_requests_total counter\n'
+        'sues_s2c_http_requests_total{endpoint="a",status="200"} 1\n'
+        'sues_s2c_http_requests_total{endpoint="b\\"\\\\\\n",status="error"} 1\n'
+        '# TYPE sues_s2c_phase_seconds summary\n'
+        'sues_s2c_phase_seconds_count{phase="merge"} 1\n'
+        'sues_s2c_phase_seconds_sum{phase="merge"} 0.250000\n'
+        'sues_s2c_phase_seconds_count{phase="parse"} 1\n'
+        'sues_s2c_phase_seconds_sum{phase="parse"} 0.500000\n'
+        '# TYPE sues_s2c_phase_seconds_max gauge\n'
+        'sues_s2c_phase_seconds_max{phase="merge"} 0.250000\n'
+        'sues_s2c_phase_seconds_max{phase="parse"} 0.500000\n')
+    assert Metrics().toPrometheus(prefix='x') == '\n'
+
+
+def test_save(tmp_path):
+    metrics = Metrics()
+    metrics.count('ics_events', 3)
+    metrics.save(str(tmp_path / 'metrics.json'))
+    metrics.save(str(tmp_path / 'metrics.prom'))
+    assert json.loads((tmp_path / 'metrics.json').read_text(encoding='utf-8')) == metrics.toDict()
+    assert (tmp_path / 'metrics.prom').read_text(encoding='utf-8') == metrics.toPrometheus()
+
+
+def test_thread_safety():
+    metrics = Metrics()
+
+    def work():
+        for _ in range(2000):
+            metrics.count('http_requests', endpoint='a')
+            metrics.record('http_request', 0.001, endpoint='a')
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert metrics.counters[('http_requests', (('endpoint', 'a'),))] == 16000
+    count, total, longest = metrics.timers[('http_request', (('endpoint', 'a'),))]
+    assert count == 16000 and total == pytest.approx(16.0) and longest == 0.001
+
+
+def test_timedIter():
+    elapsed = [1.0]
+    assert list(_timedIter(iter(range(5)), elapsed)) == list(range(5))
+    assert elapsed[0] > 1.0
+    assert list(_timedIter([], elapsed)) == []
+
+
+def test_course_table_phases(loginApi):
+    suesApi = loginApi()
+    metrics = suesApi.metrics
+    courses = suesApi.getCourseTable('2019-2020', '1')[4]
+    timers = metrics.toDict()['timers']
+    # 解析和合并各记录一次
+    for phase in ('fetch', 'parse', 'merge'):
+        assert timers['phase{phase="%s"}' % phase]['count'] == 1
+    assert timers['phase{phase="parse"}']['sum'] > 0 and timers['phase{phase="merge"}']['sum'] > 0
+    counters = metrics.toDict()['counters']
+    assert counters['task_activities'] - counters['course_merges'] == len(courses)
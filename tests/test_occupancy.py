@@ -0,0 +1,140 @@
+# 教室、教师占用索引：查询结果与逐个检查所有教学班的结果相同，共享的教学班只记录一次，冲突和空闲教室
+import random
+
+import pytest
+
+from sues_s2c import ErrorCode, MyException, CourseInfo, scanCourseTableHeader, iterCourseRecords, iterMergedCourses
+from s2c_occupancy import OccupancyIndex
+from bench.mockjxxt import generateCourseScript
+
+ROOM, TEACHER = OccupancyIndex.ROOM, OccupancyIndex.TEACHER
+
+
+def course(courseId, teacherId, roomId, weeks, day, slots):
+    """
+    :param weeks: 教学周(从1计数)的字符串，第一周为一年中的第36周
+    """
+    return CourseInfo(teacherId, '教师' + teacherId, courseId, '课程' + courseId, roomId, '教室' + roomId,
+                      '0' * 35 + weeks + '0' * (18 - len(weeks)), day, slots)
+
+
+def table(*courses, startYear='2019'):
+    return startYear, '36', '1', '18', list(courses)
+
+
+def test_occupants_and_free_rooms():
+    math = course('C1', 'T1', 'A101', '1111', 0, (0, 1))
+    english = course('C2', 'T2', 'B202', '0101', 0, (1, 2))
+    index = OccupancyIndex()
+    assert index.add(table(math, english)) == 2
+    assert index.occupants(ROOM, 'A101', 1, 0, 0) == [math]
+    assert index.occupants(TEACHER, 'T2', 2, 0, 2) == [english]
+    # 第5周、星期二、第4节和不存在的教室都空闲
+    assert index.occupants(ROOM, 'A101', 5, 0, 0) == []
+    assert index.occupants(ROOM, 'A101', 1, 1, 0) == []
+    assert index.occupants(ROOM, 'A101', 1, 0, 3) == []
+    assert index.occupants(ROOM, 'X999', 1, 0, 0) == []
+    assert index.freeRooms(1, 0, range(0, 2)) == ['B202']
+    assert index.freeRooms(2, 0, range(0, 2)) == []
+    assert index.freeRooms(2, 0, [3]) == ['A101', 'B202']
+    assert index.freeRooms(1, 0, []) == ['A101', 'B202']
+    assert index.resourceSections(TEACHER, 'T1') == [math]
+    assert index.conflicts() == []
+
+
+def test_shared_sections_are_deduplicated():
+    math = course('C1', 'T1', 'A101', '1111', 0, (0, 1))
+    english = course('C2', 'T2', 'B202', '0101', 0, (1, 2))
+    index = OccupancyIndex()
+    index.add(table(math, english))
+    # 另一个学生课表中的同一个教学班(节次顺序不同)不重复记录，也不算冲突
+    assert index.add(table(course('C1', 'T1', 'A101', '1111', 0, (1, 0)))) == 0
+    assert index.add(table()) == 0
+    assert index.sections == [math, english] and index.studentCounts == [2, 1]
+    assert index.occupants(ROOM, 'A101', 1, 0, 1) == [math]
+    assert index.summary() == {'students': 3, 'sections': 2, 'enrolments': 3, 'rooms': 2, 'teachers': 2,
+                               'roomConflicts': 0, 'teacherConflicts': 0}
+
+
+def test_conflicts():
+    first = course('C1', 'T1', 'A101', '1111', 0, (0, 1))
+    # 同一教室第3-4周第2节重叠
+    sameRoom = course('C2', 'T2', 'A101', '0011', 0, (1, 2))
+    # 同一教师在另一教室，只在第1周重叠
+    sameTeacher = course('C3', 'T1', 'B202', '1', 0, (0,))
+    # 周次不重叠的不冲突
+    later = course('C4', 'T1', 'A101', '00001', 0, (0, 1))
+    index = OccupancyIndex()
+    index.add(table(first, sameRoom))
+    index.add(table(sameTeacher, later))
+    assert index.conflicts(ROOM) == [(ROOM, 'A101', first, sameRoom, [(3, 0, 1), (4, 0, 1)])]
+    assert index.conflicts(TEACHER) == [(TEACHER, 'T1', first, sameTeacher, [(1, 0, 0)])]
+    assert len(index.conflicts()) == 2
+    assert index.occupants(ROOM, 'A101', 3, 0, 1) == [first, sameRoom]
+    assert index.summary()['roomConflicts'] == 1 and index.summary()['teacherConflicts'] == 1
+
+
+def test_empty_resource_ids():
+    # 没有安排教室或教师的课程同一时间可以有多门，不算冲突，也不出现在空闲教室中
+    online = course('C1', 'T1', '', '1111', 0, (0, 1))
+    practice = course('C2', '', '', '1111', 0, (0, 1))
+    room = course('C3', '', 'A101', '1111', 1, (0, 1))
+    index = OccupancyIndex()
+    assert index.add(table(online, practice, room)) == 3
+    assert index.conflicts() == []
+    assert index.names == {ROOM: {'A101': '教室A101'}, TEACHER: {'T1': '教师T1'}}
+    assert index.occupants(ROOM, '', 1, 0, 0) == [] and index.occupants(TEACHER, '', 1, 0, 0) == []
+    assert index.freeRooms(1, 0, [0]) == ['A101']
+    assert index.resourceSections(ROOM, '') == []
+    assert len(index.sections) == 3
+
+
+def test_mismatched_terms():
+    index = OccupancyIndex()
+    index.add(table(course('C1', 'T1', 'A101', '1', 0, (0,))))
+    with pytest.raises(MyException) as info:
+        index.add(table(course('C2', 'T2', 'B202', '1', 0, (0,)), startYear='2020'))
+    assert info.value.errorCode == ErrorCode.INPUT_ERROR
+    assert index.studentCount == 1 and len(index.sections) == 1
+
+
+def test_same_as_brute_force():
+    # 与runOccupancyBenchmark中的对照相同：不使用索引，逐个检查所有教学班
+    rnd = random.Random(3)
+    script = generateCourseScript(400, seed=3)
+    startYear, occupyWeek, startWeek, endWeek = scanCourseTableHeader(script)
+    campus = list(iterMergedCourses(iterCourseRecords(script), occupyWeek, endWeek))
+    index = OccupancyIndex()
+    for _ in range(60):
+        index.add((startYear, occupyWeek, startWeek, endWeek, rnd.sample(campus, 12)))
+    weekOffset = int(occupyWeek) - 1
+    fields = {ROOM: 'roomId', TEACHER: 'teacherId'}
+
+    def busy(section, week, day, slot):
+        return section.day == day and slot in section.courses and section.weeks.test(weekOffset + week - 1)
+
+    rooms = sorted(index.names[ROOM])
+    for _ in range(300):
+        week, day, slot = rnd.randint(1, int(endWeek)), rnd.randrange(7), rnd.randrange(14)
+        for kind in (ROOM, TEACHER):
+            resourceId = rnd.choice(sorted(index.names[kind]))
+            assert index.occupants(kind, resourceId, week, day, slot) == \
+                [s for s in index.sections if getattr(s, fields[kind]) == resourceId and busy(s, week, day, slot)]
+        slots = range(slot, min(slot + 2, 14))
+        assert index.freeRooms(week, day, slots) == \
+            [roomId for roomId in rooms if not any(s.roomId == roomId and busy(s, week, day, each)
+                                                   for s in index.sections for each in slots)]
+
+    expected = []
+    for kind in (ROOM, TEACHER):
+        for j, second in enumerate(index.sections):
+            for first in index.sections[:j]:
+                if getattr(first, fields[kind]) != getattr(second, fields[kind]) or first.day != second.day:
+                    continue
+                cells = [(weekBit - weekOffset + 1, first.day, slot) for weekBit in range(len(first.weeks))
+                         if first.weeks.test(weekBit) and second.weeks.test(weekBit)
+                         for slot in sorted(set(first.courses) & set(second.courses))]
+                if cells:
+                    expected.append((kind, getattr(first, fields[kind]), first, second, tuple(sorted(cells))))
+    actual = [(c.kind, c.resourceId, c.first, c.second, tuple(sorted(c.cells))) for c in index.conflicts()]
+    assert expected and len(actual) == len(expected) and set(actual) == set(expected)
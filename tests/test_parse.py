@@ -0,0 +1,53 @@
+# 课表脚本解析：tokenizeCourseScript/iterCourseRecords与改写前逐行正则解析的结果一致
+import pytest
+
+from sues_s2c import scanCourseTableHeader, iterCourseRecords
+from bench.legacy import legacyParseCourseScript
+from bench.mockjxxt import generateCourseScript
+from bench.stages import loadPageScript, runParseBenchmark
+
+
+def legacyFields(course):
+    return (course.teacherId, course.teacherName, course.courseId, course.courseName, course.roomId, course.roomName,
+            course.validweeks, int(course.day), tuple(int(i) for i in course.courses))
+
+
+def fields(course):
+    return (course.teacherId, course.teacherName, course.courseId, course.courseName, course.roomId, course.roomName,
+            course.validweeks, course.day, course.courses)
+
+
+@pytest.mark.parametrize('scriptStr', [loadPageScript(), generateCourseScript(500, seed=3),
+                                       generateCourseScript(50, seed=4, occupyWeek=1, endWeek=18).replace('\r\n', '\n')],
+                         ids=['fixture', 'synthetic', 'lf'])
+def test_same_records_as_legacy(scriptStr):
+    *header, legacyCourses = legacyParseCourseScript(scriptStr)
+    assert scanCourseTableHeader(scriptStr) == tuple(header)
+    assert [fields(course) for course in iterCourseRecords(scriptStr)] == [legacyFields(c) for c in legacyCourses]
+
+
+def test_parse_benchmark():
+    result = runParseBenchmark(generateCourseScript(100), rounds=1)
+    assert result['records'] == 120 and result['lines'] > result['records']
+    assert result['legacyLinesPerSec'] > 0 and result['parseLinesPerSec'] > 0
+
+
+def test_hand_written_script():
+    # 课程名中的逗号和括号、没有上课节次的TaskActivity、带空格和制表符的index语句
+    scriptStr = ('var table0 = new CourseTable(2020,98);\r\n'
+                 'activity = new TaskActivity("1","张三","C1(C1.01)","高等数学(A),上","7","A101","0111");\r\n'
+                 'activity = new TaskActivity("2","李四","C2(C2.01)","体育","8","","1");\r\n'
+                 'index =4*unitCount+2;\r\n'
+                 '\tindex = 4 * unitCount + 3 ;\r\n'
+                 'table0.marshalTable(36,1,20);')
+    assert scanCourseTableHeader(scriptStr) == ('2020', '36', '1', '20')
+    assert [fields(course) for course in iterCourseRecords(scriptStr)] == [
+        ('1', '张三', 'C1(C1.01)', '高等数学(A),上', '7', 'A101', '0111', None, ()),
+        ('2', '李四', 'C2(C2.01)', '体育', '8', '', '1', 4, (2, 3))]
+
+
+@pytest.mark.parametrize('scriptStr', ['', 'var table0 = new CourseTable(2020,98);\r\ntable0.marshalTable(36,1,20);'],
+                         ids=['empty', 'no-activity'])
+def test_empty_table(scriptStr):
+    assert list(iterCourseRecords(scriptStr)) == []
+    assert scanCourseTableHeader(scriptStr) == tuple(legacyParseCourseScript(scriptStr)[:4])
@@ -0,0 +1,224 @@
+# RequestPolicy和SuesApi._request的故障注入测试：按脚本返回429/5xx或超时的本地服务器，替换sues_s2c中的时间函数
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+import sues_s2c
+from sues_s2c import ErrorCode, MyException, RequestPolicy, SuesApi, HostConcurrencyLimiter, Metrics
+
+TIMEOUT = 'timeout'
+
+
+class FakeTime:
+    """
+    代替sues_s2c中的time模块：monotonic为可控的时钟，sleep只记录等待时间并推进时钟
+    """
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+    perf_counter = staticmethod(time.perf_counter)
+    time = staticmethod(time.time)
+
+
+class ScriptedServer:
+    """
+    依次按script中的项响应：(状态码, 响应头字典)或TIMEOUT(不响应，直到客户端超时)，脚本用完后返回200
+    """
+
+    def __init__(self, script):
+        self.script = list(script)
+        self.requestCount = 0
+        self.released = threading.Event()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.requestCount += 1
+                item = server.script.pop(0) if server.script else (200, {})
+                if item == TIMEOUT:
+                    server.released.wait(5)
+                    return
+                status, headers = item
+                body = b'ok' if status == 200 else b'error'
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.httpd.daemon_threads = True
+        self.url = 'http://127.0.0.1:%d/eams/test.action' % self.httpd.server_port
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.released.set()
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def fakeTime(monkeypatch):
+    fake = FakeTime()
+    monkeypatch.setattr(sues_s2c, 'time', fake)
+    return fake
+
+
+@pytest.fixture
+def scripted():
+    servers = []
+
+    def start(script):
+        servers.append(ScriptedServer(script))
+        return servers[-1]
+    yield start
+    for server in servers:
+        server.close()
+
+
+def makeApi(policy: RequestPolicy):
+    api = SuesApi(hostLimiter=HostConcurrencyLimiter(), verbose=False, requestPolicy=policy, metrics=Metrics())
+    api._createSession()
+    return api
+
+
+def get(api: SuesApi, url: str):
+    return api._request('GET', url, ErrorCode.CONNECTION_ERROR, timeout=0.3)
+
+
+def test_retry_then_success(fakeTime, scripted):
+    server = scripted([(503, {}), (502, {}), (200, {})])
+    policy = RequestPolicy(retries=2, backoffBase=0.5, breakerThreshold=0)
+    r = get(makeApi(policy), server.url)
+    assert r.status_code == 200 and server.requestCount == 3
+    assert len(fakeTime.sleeps) == 2
+    # 指数退避：第n次重试前最多等待backoffBase*2^n
+    assert 0 <= fakeTime.sleeps[0] <= 0.5 and 0 <= fakeTime.sleeps[1] <= 1.0
+    assert policy.stats()['attempts'] == 3 and policy.stats()['retried'] == 2 and policy.stats()['failures'] == 0
+
+
+def test_retry_after_is_honoured_and_capped(fakeTime, scripted):
+    server = scripted([(429, {'Retry-After': '3'}), (503, {'Retry-After': '120'}), (200, {})])
+    policy = RequestPolicy(retries=2, backoffBase=0.01, backoffMax=8.0, breakerThreshold=0)
+    assert get(makeApi(policy), server.url).status_code == 200
+    assert fakeTime.sleeps == [3, 8.0]
+
+
+def test_exhausted_retries_raise(fakeTime, scripted):
+    server = scripted([(503, {})] * 3)
+    policy = RequestPolicy(retries=2, breakerThreshold=0)
+    with pytest.raises(MyException) as info:
+        get(makeApi(policy), server.url)
+    assert info.value.errorCode == ErrorCode.CONNECTION_ERROR and 'HTTP 503' in info.value.detail
+    assert server.requestCount == 3
+    assert policy.stats()['retried'] == 2 and policy.stats()['failures'] == 1
+
+
+def test_no_retry_for_non_idempotent(fakeTime, scripted):
+    server = scripted([(500, {})])
+    with pytest.raises(MyException):
+        makeApi(RequestPolicy(retries=2, breakerThreshold=0))._request('GET', server.url, ErrorCode.LOGIN_ERROR,
+                                                                      retry=False, timeout=0.3)
+    assert server.requestCount == 1 and fakeTime.sleeps == []
+
+
+def test_timeout_is_retried(fakeTime, scripted):
+    server = scripted([TIMEOUT, TIMEOUT, (200, {})])
+    policy = RequestPolicy(retries=2, breakerThreshold=0)
+    assert get(makeApi(policy), server.url).status_code == 200
+    assert server.requestCount == 3 and len(fakeTime.sleeps) == 2
+
+
+def test_timeout_exhausted_raises(fakeTime, scripted):
+    server = scripted([TIMEOUT, TIMEOUT])
+    with pytest.raises(MyException) as info:
+        get(makeApi(RequestPolicy(retries=1, breakerThreshold=0)), server.url)
+    assert info.value.errorCode == ErrorCode.CONNECTION_ERROR and server.requestCount == 2
+
+
+def test_token_bucket(fakeTime):
+    policy = RequestPolicy(ratePerHost=2, burst=3)
+    for _ in range(3):
+        policy.acquire('a')
+    # 突发的3个令牌用完之前不等待
+    assert fakeTime.sleeps == []
+    policy.acquire('a')
+    policy.acquire('a')
+    # 之后每个请求等待1/ratePerHost秒
+    assert fakeTime.sleeps == [pytest.approx(0.5), pytest.approx(0.5)]
+    # 各主机的令牌桶互相独立
+    policy.acquire('b')
+    assert len(fakeTime.sleeps) == 2
+    # 空闲后令牌恢复，但不超过burst
+    fakeTime.now += 60
+    for _ in range(3):
+        policy.acquire('a')
+    assert len(fakeTime.sleeps) == 2
+    policy.acquire('a')
+    assert len(fakeTime.sleeps) == 3
+
+
+def test_breaker_states(fakeTime):
+    policy = RequestPolicy(breakerThreshold=2, breakerCooldown=30)
+    # 关闭：失败次数未达到阈值
+    policy.record('a', 0.1, False, False)
+    assert policy.allow('a')
+    # 打开：冷却时间内拒绝所有请求
+    policy.record('a', 0.1, False, False)
+    assert not policy.allow('a') and policy.stats()['openHosts'] == ['a'] and policy.stats()['rejected'] == 1
+    assert policy.allow('b')
+    fakeTime.now += 29
+    assert not policy.allow('a')
+    # 半开：冷却结束后只放行一个试探请求
+    fakeTime.now += 2
+    assert policy.allow('a')
+    assert not policy.allow('a')
+    # 试探失败时重新打开
+    policy.record('a', 0.1, False, False)
+    assert not policy.allow('a')
+    fakeTime.now += 31
+    assert policy.allow('a')
+    # 试探成功时关闭
+    policy.record('a', 0.1, True, False)
+    assert policy.allow('a') and policy.allow('a') and policy.stats()['openHosts'] == []
+
+
+def test_breaker_through_request(fakeTime, scripted):
+    server = scripted([(503, {})] * 4)
+    policy = RequestPolicy(retries=1, breakerThreshold=2, breakerCooldown=30)
+    api = makeApi(policy)
+    with pytest.raises(MyException):
+        get(api, server.url)
+    assert server.requestCount == 2
+    # 熔断期间不访问服务器
+    with pytest.raises(MyException) as info:
+        get(api, server.url)
+    assert '暂停访问' in info.value.detail and server.requestCount == 2
+    # 冷却结束后的试探请求失败，不重试，重新熔断
+    fakeTime.now += 31
+    with pytest.raises(MyException):
+        get(api, server.url)
+    assert server.requestCount == 3
+    with pytest.raises(MyException):
+        get(api, server.url)
+    assert server.requestCount == 3
+    # 再次冷却后试探成功，恢复正常
+    fakeTime.now += 31
+    server.script = []
+    assert get(api, server.url).status_code == 200 and get(api, server.url).status_code == 200
+    assert server.requestCount == 5 and policy.stats()['openHosts'] == []
@@ -0,0 +1,51 @@
+# 只有通过检查的响应才写入ResponseCache：503和登录页不能被缓存
+import pytest
+
+from sues_s2c import ErrorCode, MyException, ResponseCache
+
+
+def logout(mockServer):
+    for session in mockServer.sessions.values():
+        session['user'] = None
+
+
+def test_unavailable_course_table_is_not_cached(mockServer, loginApi, tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    suesApi = loginApi(cache=cache)
+    mockServer.failureRate = 1.0
+    with pytest.raises(MyException) as info:
+        suesApi.getCourseTable('2018-2019', '1')
+    assert info.value.errorCode == ErrorCode.COURSE_FETCH_ERROR
+    mockServer.failureRate = 0.0
+    # 已结束学期的课表缓存一年，503如果被缓存，这里会一直失败
+    courseTable = suesApi.getCourseTable('2018-2019', '1')
+    assert courseTable[4]
+    requestCount = mockServer.requestCount
+    assert len(suesApi.getCourseTable('2018-2019', '1')[4]) == len(courseTable[4])
+    assert mockServer.requestCount == requestCount
+
+
+def test_logged_out_years_raise_and_are_not_cached(mockServer, loginApi, tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    suesApi = loginApi(cache=cache)
+    logout(mockServer)
+    with pytest.raises(MyException) as info:
+        suesApi.getYears()
+    assert info.value.errorCode == ErrorCode.YEAR_FETCH_ERROR
+    with pytest.raises(MyException) as info:
+        suesApi.getTerms('2019-2020')
+    assert info.value.errorCode == ErrorCode.TERM_FETCH_ERROR
+    assert list(tmp_path.glob('*.cache')) == []
+
+    suesApi = loginApi(cache=cache)
+    assert suesApi.getYears() == mockServer.years
+    assert suesApi.getTerms('2019-2020') == mockServer.terms
+
+
+def test_poisoned_cache_entry_is_ignored(mockServer, loginApi, tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    suesApi = loginApi(cache=cache)
+    # 之前的版本可能已经缓存了登录页
+    cache.put(suesApi.username, 'years', {'baseUrl': suesApi.baseUrl}, 'years', b'<html><form></form></html>')
+    assert suesApi.getYears() == mockServer.years
+    assert suesApi._isBracketList(cache.get(suesApi.username, 'years', {'baseUrl': suesApi.baseUrl}))
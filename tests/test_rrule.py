@@ -0,0 +1,83 @@
+# 重复规则压缩：compactRRule生成的日程展开后与不压缩时的上课时间完全相同
+import pytest
+
+from sues_s2c import (scanCourseTableHeader, iterCourseRecords, iterMergedCourses, iterCourseBlocks, iterCourseEvents,
+                      cvt2Caldav, IcsMemoryWriter, CourseInfo, WeekSet, _firstWeekTime)
+from bench.mockjxxt import generateCourseScript
+
+
+def export(courseTable, splitCourse, modifyDEFTime, compactRRule):
+    writer = IcsMemoryWriter()
+    eventCount = cvt2Caldav(*courseTable, 15, modifyDEFTime, splitCourse, None, verbose=False, writer=writer,
+                            compactRRule=compactRRule)
+    return eventCount, writer.content
+
+
+def vevents(content):
+    """
+    :return: 每个VEVENT的文本
+    """
+    return [event.split('END:VEVENT')[0] for event in content.decode('utf-8').split('BEGIN:VEVENT')[1:]]
+
+
+@pytest.mark.parametrize('splitCourse', [False, True])
+@pytest.mark.parametrize('options', [{}, {'seed': 7, 'occupyWeek': 1, 'endWeek': 18}])
+def test_compact_expands_to_same_occurrences(icsOccurrences, splitCourse, options):
+    # 合成课表中有连续周、单双周、随机周次和跨年合并的课程
+    scriptStr = generateCourseScript(100, **options)
+    startYear, occupyWeek, startWeek, endWeek = scanCourseTableHeader(scriptStr)
+    courseTable = (startYear, occupyWeek, startWeek, endWeek,
+                   list(iterMergedCourses(iterCourseRecords(scriptStr), occupyWeek, endWeek)))
+    plainCount, plain = export(courseTable, splitCourse, True, False)
+    compactCount, compact = export(courseTable, splitCourse, True, True)
+
+    assert compactCount < plainCount
+    assert icsOccurrences(compact) == icsOccurrences(plain)
+    # UID在日历内唯一，只有一段连续上课周的日程UID与不压缩时相同
+    compactEvents, plainEvents = vevents(compact), set(vevents(plain))
+    assert len({event.split('UID:')[1].split('\r\n')[0] for event in compactEvents}) == compactCount
+    for event in compactEvents:
+        if 'UNTIL=' in event:
+            assert event in plainEvents
+
+
+@pytest.mark.parametrize('weekStr, expected', [
+    ('', []),
+    ('0' * 52 + '1', [(52, 52, 1, ())]),  # 只上一周
+    ('1' * 16, [(0, 15, 1, ())]),  # 连续周与不压缩时相同
+    ('10' * 8, [(0, 14, 2, ())]),  # 单周
+    ('0001001001', [(3, 9, 3, ())]),  # 每3周
+    ('1010001', [(0, 6, 2, (4,))]),  # 双周中缺一周用EXDATE排除
+    ('1110111', [(0, 6, 1, (3,))]),  # 中间停一周
+    ('11' + '0' * 9 + '11', [(0, 1, 1, ()), (11, 12, 1, ())]),  # 排除的周太多时仍分成两个日程
+    ('1' + '0' * 10 + '1', [(0, 0, 1, ()), (11, 11, 1, ())]),  # 相隔11周不是2-4的倍数，每周重复需要排除10周
+])
+def test_hand_written_recurrences(weekStr, expected):
+    assert WeekSet.fromStr(weekStr).recurrences() == expected
+
+
+def test_hand_written_events():
+    from datetime import datetime
+    prefix = '0' * 35  # 第一周为一年中的第36周
+    courses = [
+        # 第1、3、5、7周星期一第1-2节
+        CourseInfo('1', '教师', 'C1', '课程', '7', 'A101', prefix + '1010101' + '0' * 11, 0, (0, 1)),
+        # 第1、3、7周，第5周排除
+        CourseInfo('1', '教师', 'C2', '课程', '7', 'A101', prefix + '1010001' + '0' * 11, 1, (0, 1)),
+        # 只上第2周，与不压缩时的日程完全相同
+        CourseInfo('1', '教师', 'C3', '课程', '7', 'A101', prefix + '01' + '0' * 16, 2, (0, 1))]
+
+    def naive(time):
+        # 比较北京时间的钟点，与系统是否有Beijing时区数据无关
+        return time.replace(tzinfo=None)
+    events = list(iterCourseEvents(iterCourseBlocks(courses, False), '36', _firstWeekTime('2019', '36'), 15, False,
+                                   compactRRule=True))
+    assert [({k: naive(v) if k == 'until' else v for k, v in event.rrule.items()}, naive(event.dtstart),
+             tuple(map(naive, event.exdates))) for event in events] == [
+        ({'freq': 'weekly', 'count': 4, 'interval': 2}, datetime(2019, 9, 2, 8, 15), ()),
+        ({'freq': 'weekly', 'count': 4, 'interval': 2}, datetime(2019, 9, 3, 8, 15), (datetime(2019, 10, 1, 8, 15),)),
+        ({'freq': 'weekly', 'until': datetime(2019, 9, 11, 9, 45)}, datetime(2019, 9, 11, 8, 15), ())]
+    # UID由课程、教室、星期、第一周、最后一周和节次组成，压缩后仍唯一
+    assert [event.uid for event in events] == ['C1700601', 'C2710601', 'C3721101']
+    plain = list(iterCourseEvents(iterCourseBlocks(courses[2:], False), '36', _firstWeekTime('2019', '36'), 15, False))
+    assert events[2] == plain[0]
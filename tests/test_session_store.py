@@ -0,0 +1,62 @@
+# 加密保存的登录会话：复用成功时不再创建新会话
+import threading
+
+import pytest
+
+import sues_s2c
+from sues_s2c import SessionStore
+
+pytest.importorskip('cryptography')
+
+
+def recordRoutes(monkeypatch, mockServer):
+    routes = []
+    handle = mockServer.handle
+
+    def recordingHandle(method, path, form, sessionId):
+        routes.append(path.split('?')[0])
+        return handle(method, path, form, sessionId)
+    monkeypatch.setattr(mockServer, 'handle', recordingHandle)
+    return routes
+
+
+def test_store_roundtrip(mockServer, loginApi, tmp_path):
+    store = SessionStore(str(tmp_path))
+    suesApi = loginApi()
+    store.save(suesApi, 'pw')
+    other = sues_s2c.SuesApi(verbose=False, baseUrl=mockServer.baseUrl)
+    assert not other.resumeSession(store, '0123', 'wrong')
+    assert other.resumeSession(store, '0123', 'pw')
+    assert other.getYears() == mockServer.years
+
+
+def finishedThread():
+    thread = threading.Thread(target=lambda: None)
+    thread.start()
+    return thread
+
+
+def test_interactive_resumes_before_new_session(monkeypatch, mockServer, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    class MockSuesApi(sues_s2c.SuesApi):
+        # 交互模式总是访问默认地址，改为访问mockServer
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, baseUrl=mockServer.baseUrl, **kwargs)
+    monkeypatch.setattr(sues_s2c, 'SuesApi', MockSuesApi)
+    monkeypatch.setattr(sues_s2c, 'startNotificationFetch', lambda: (finishedThread(), {}))
+    monkeypatch.setattr(sues_s2c, 'promptCaptcha', lambda capthaBytes: '1234')
+    args = sues_s2c._buildParser().parse_args(['interactive', '--session-dir', str(tmp_path / 'sessions')])
+
+    def run():
+        answers = iter(['0123', 'pw', '1', '1', 'n', 'n', '15', ''])
+        monkeypatch.setattr('builtins.input', lambda prompt='': next(answers))
+        return sues_s2c.interactiveMain(args)
+
+    routes = recordRoutes(monkeypatch, mockServer)
+    assert run() == 0
+    assert '/eams/login.action' in routes and '/' in routes
+    del routes[:]
+    assert run() == 0
+    # 第二次直接复用保存的会话，不访问主页、engine.js和验证码，也不登录
+    assert routes[0] == '/eams/courseTableForStd.action'
+    assert not {'/', '/eams/dwr/engine.js', '/eams/captcha/image.action', '/eams/login.action'} & set(routes)
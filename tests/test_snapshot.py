@@ -0,0 +1,51 @@
+# 课表快照的保存和读取
+import pytest
+
+import sues_s2c
+from sues_s2c import CourseInfo, ErrorCode, MyException, saveSnapshot, loadSnapshot
+from bench.mockjxxt import generateCourseScript
+
+
+def courseTable(courseCount=30):
+    script = generateCourseScript(courseCount)
+    startYear, occupyWeek, startWeek, endWeek = sues_s2c.scanCourseTableHeader(script)
+    courses = list(sues_s2c.iterMergedCourses(sues_s2c.iterCourseRecords(script), occupyWeek, endWeek))
+    return startYear, occupyWeek, startWeek, endWeek, courses
+
+
+def fields(course):
+    return (course.teacherId, course.teacherName, course.courseId, course.courseName, course.roomId, course.roomName,
+            str(course.weeks), course.day, course.courses)
+
+
+def test_roundtrip(tmp_path):
+    path = str(tmp_path / 'a.snap')
+    tables = {('0123', '2019-2020', '1'): courseTable(), ('0456', '2019-2020', '2'): courseTable(5)}
+    assert saveSnapshot(path, tables) == 2
+    loaded = loadSnapshot(path)
+    assert list(loaded) == list(tables)
+    for key, table in tables.items():
+        assert loaded[key][:4] == table[:4]
+        assert [fields(course) for course in loaded[key][4]] == [fields(course) for course in table[4]]
+
+
+@pytest.mark.parametrize('day, slots', [(None, (1, 2)), (-1, (1, 2)), (0, (1, None)), (0, (300,))])
+def test_invalid_course_raises(tmp_path, day, slots):
+    table = courseTable(3)
+    course = table[4][0]
+    broken = CourseInfo(course.teacherId, course.teacherName, course.courseId, course.courseName, course.roomId,
+                        course.roomName, course.weeks, day, slots)
+    path = tmp_path / 'a.snap'
+    with pytest.raises(MyException) as info:
+        saveSnapshot(str(path), {('0123', '2019-2020', '1'): table[:4] + ([broken],)})
+    assert info.value.errorCode == ErrorCode.INPUT_ERROR
+    assert not path.exists() and list(tmp_path.iterdir()) == []
+
+
+def test_missing_header_field_raises(tmp_path):
+    table = courseTable(3)
+    with pytest.raises(MyException) as info:
+        saveSnapshot(str(tmp_path / 'a.snap'), {('0123', '2019-2020', '1'): (table[0], None) + table[2:]})
+    assert info.value.errorCode == ErrorCode.INPUT_ERROR and '0123' in info.value.detail
+    with pytest.raises(MyException):
+        saveSnapshot(str(tmp_path / 'a.snap'), {('0123', None, '1'): table})
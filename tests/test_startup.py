@@ -0,0 +1,38 @@
+# 启动耗时回归测试：导入sues_s2c时不能加载较重的依赖，这些模块只在第一次用到时导入(显示验证码、生成日历、展开日程等)
+import os
+import subprocess
+import sys
+
+HEAVY_MODULES = ('requests_html', 'PIL', 'icalendar', 'dateutil', 'numpy')
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def runPython(code: str, *options):
+    """
+    在新的解释器中执行code，避免受到测试进程中已导入模块的影响
+    :return: 标准输出和标准错误
+    """
+    r = subprocess.run([sys.executable, *options, '-c', code], cwd=REPO_DIR, capture_output=True, text=True,
+                       check=True)
+    return r.stdout, r.stderr
+
+
+def test_heavy_modules_are_lazy():
+    stdout, _ = runPython('import sys, sues_s2c\n'
+                          'print(" ".join(sorted({name.split(".")[0] for name in sys.modules})))')
+    loaded = set(stdout.split())
+    assert 'sues_s2c' in loaded
+    assert sorted(loaded & set(HEAVY_MODULES)) == []
+
+
+def test_faster_than_one_heavy_module():
+    # 与同一进程中导入requests_html的耗时比较，不依赖机器速度；requests_html在sues_s2c之后导入，共用的依赖计入sues_s2c
+    _, stderr = runPython('import sues_s2c\nimport requests_html', '-X', 'importtime')
+    times = {}
+    for line in stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if line.startswith('import time:') and 'cumulative' not in line:
+            _, cumulative, name = line.split('|')
+            times[name.strip()] = int(cumulative)
+    assert times['sues_s2c'] < times['requests_html']
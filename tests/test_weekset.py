@@ -0,0 +1,101 @@
+# WeekSet与原先validweeks字符串(由0/1组成)的运算结果一致，字符串的运算即旧版本中的写法
+import random
+import re
+
+import pytest
+
+from sues_s2c import WeekSet
+
+
+def randomWeekStr(rnd: random.Random):
+    length = rnd.choice((0, 1, 2, 17, 53, 53, 53, 64, 106, 128))
+    kind = rnd.random()
+    if kind < 0.2:
+        # 单双周或每几周一次，是recurrences压缩的主要对象
+        step, offset = rnd.randint(2, 4), rnd.randint(0, 3)
+        weeks = ['1' if i >= offset and (i - offset) % step == 0 else '0' for i in range(length)]
+        for _ in range(rnd.randint(0, 2)):
+            if length:
+                weeks[rnd.randrange(length)] = '0'
+        return ''.join(weeks)
+    if kind < 0.5:
+        # 几段连续的上课周
+        weeks = ['0'] * length
+        for _ in range(rnd.randint(0, 3)):
+            if length:
+                beg = rnd.randrange(length)
+                end = rnd.randint(beg, length)
+                weeks[beg:end] = ['1'] * (end - beg)
+        return ''.join(weeks)
+    density = rnd.random()
+    return ''.join('1' if rnd.random() < density else '0' for _ in range(length))
+
+
+def cases(count=400, seed=0):
+    rnd = random.Random(seed)
+    fixed = ['', '0', '1', '0' * 53, '1' * 53, '01' * 26 + '0', '10' * 26 + '1', '0' * 35 + '1' * 18]
+    return fixed + [randomWeekStr(rnd) for _ in range(count)]
+
+
+@pytest.fixture(params=range(5))
+def weekStrs(request):
+    return cases(seed=request.param)
+
+
+def test_str_roundtrip(weekStrs):
+    for weekStr in weekStrs:
+        weeks = WeekSet.fromStr(weekStr)
+        assert str(weeks) == weekStr and len(weeks) == len(weekStr)
+        assert [weeks.test(i) for i in range(len(weekStr))] == [c == '1' for c in weekStr]
+
+
+def test_runs(weekStrs):
+    for weekStr in weekStrs:
+        assert list(WeekSet.fromStr(weekStr).runs()) == [m.span() for m in re.finditer(r'[1]+', weekStr)]
+
+
+def test_anyInRange(weekStrs):
+    rnd = random.Random(len(weekStrs))
+    for weekStr in weekStrs:
+        weeks = WeekSet.fromStr(weekStr)
+        bounds = [(0, len(weekStr)), (0, 0), (1, len(weekStr) + 5)]
+        bounds += [(rnd.randint(0, len(weekStr) + 1), rnd.randint(0, len(weekStr) + 1)) for _ in range(10)]
+        for beg, end in bounds:
+            assert weeks.anyInRange(beg, end) == ('1' in weekStr[beg:end]), (weekStr, beg, end)
+
+
+def test_concat_shift_union(weekStrs):
+    rnd = random.Random(len(weekStrs) + 1)
+    for weekStr in weekStrs:
+        other = rnd.choice(weekStrs)
+        weeks = WeekSet.fromStr(weekStr)
+        assert str(weeks.concat(WeekSet.fromStr(other))) == weekStr + other
+        count = rnd.randint(0, 60)
+        assert str(weeks.shift(count)) == count * '0' + weekStr
+        same = randomWeekStr(rnd)[:len(weekStr)].ljust(len(weekStr), '0')
+        assert str(weeks.union(WeekSet.fromStr(same))) == ''.join(
+            '1' if '1' in pair else '0' for pair in zip(weekStr, same))
+        assert (weeks == WeekSet.fromStr(weekStr)) and hash(weeks) == hash(WeekSet.fromStr(weekStr))
+
+
+def test_recurrences_cover_exactly_the_same_weeks(weekStrs):
+    for weekStr in weekStrs:
+        weeks = WeekSet.fromStr(weekStr)
+        runs = [m.span() for m in re.finditer(r'[1]+', weekStr)]
+        rules = weeks.recurrences()
+        covered = []
+        for first, last, step, holes in rules:
+            assert set(holes) <= set(range(first, last + 1, step))
+            covered += [week for week in range(first, last + 1, step) if week not in holes]
+        # 每周只被一个日程覆盖，且正好是所有上课周
+        assert sorted(covered) == [i for i, c in enumerate(weekStr) if c == '1'], weekStr
+        assert len(covered) == len(set(covered))
+        # 压缩后的日程数不会比每段连续上课周一个日程多
+        assert len(rules) <= max(1, len(runs))
+        if len(rules) > 1 or (rules and rules[0][2] == 1 and not rules[0][3]):
+            assert rules == [(beg, end - 1, 1, ()) for beg, end in runs]
+
+
+def test_fromStr_rejects_other_characters():
+    with pytest.raises(ValueError):
+        WeekSet.fromStr('0120')